@@ -13,44 +13,18 @@ Prerequisites:
 """
 
 import json
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import os.path
+import sys
+from googleapiclient.errors import HttpError
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrapeki"))
+from calendar_client import get_service
+from calendar_index import upsert_request
 
 def authenticate_google_calendar():
     """Authenticate and return Google Calendar service"""
-    creds = None
-    # The file token.json stores the user's access and refresh tokens.
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists('credentials.json'):
-                print("Error: credentials.json not found!")
-                print("Please download your OAuth 2.0 credentials from Google Cloud Console")
-                return None
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    
-    try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
-    except HttpError as error:
-        print(f'An error occurred: {error}')
-        return None
+    # token.json and credentials.json live in the current directory for this script
+    return get_service(token_path='token.json', credentials_path='credentials.json')
 
 def add_events_to_calendar(service, events_data):
     """Add events from JSON file to Google Calendar"""
@@ -66,11 +40,8 @@ def add_events_to_calendar(service, events_data):
     
     for event in events:
         try:
-            # Create the event
-            created_event = service.events().insert(
-                calendarId='primary',
-                body=event
-            ).execute()
+            # Create the event (an idempotent import when it has an iCalUID, so reruns add no duplicates)
+            created_event = upsert_request(service, event).execute()
             
             print(f"✓ Added: {event['summary']} (Due: {event['start']['dateTime']})")
             added_count += 1
@@ -12,95 +12,44 @@ Prerequisites:
 3. Run this script: python add_to_google_calendar.py
 """
 
+import argparse
+import itertools
 import json
 import os
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import sys
 from googleapiclient.errors import HttpError
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from calendar_batch import execute_in_batches
+from calendar_client import get_account_service, get_service, token_path_for
+from calendar_index import upsert_request
+from ndjson_stream import iter_events, iter_ndjson
 
 def authenticate_google_calendar():
-    """Authenticate and return Google Calendar service"""
-    creds = None
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    token_path = os.path.join(script_dir, 'token.json')
-    credentials_path = os.path.join(script_dir, 'credentials.json')
-    
-    # The file token.json stores the user's access and refresh tokens.
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(credentials_path):
-                print("=" * 60)
-                print("ERROR: credentials.json not found!")
-                print("=" * 60)
-                print("Please download your OAuth 2.0 credentials from Google Cloud Console:")
-                print("1. Go to https://console.cloud.google.com/")
-                print("2. Create a project and enable Calendar API")
-                print("3. Create OAuth 2.0 credentials (Desktop app)")
-                print("4. Download credentials.json to this directory:")
-                print(f"   {script_dir}")
-                print("=" * 60)
-                return None
-            
-            flow = InstalledAppFlow.from_client_secrets_file(
-                credentials_path, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        # Save the credentials for the next run
-        with open(token_path, 'w') as token:
-            token.write(creds.to_json())
-    
-    try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
-    except HttpError as error:
-        print(f'An error occurred: {error}')
-        return None
+    """Authenticate and return Google Calendar service (cached for the life of the process)"""
+    return get_service()
 
-def add_events_to_calendar(service, events_data):
-    """Add events from JSON file to Google Calendar"""
-    if not service:
-        print("Calendar service not available")
-        return
-    
-    events = events_data.get('events', [])
-    if not events:
-        print("No events found in the data file.")
-        return
-    
-    print(f"\n{'=' * 60}")
-    print(f"Adding {len(events)} events to Google Calendar...")
-    print(f"{'=' * 60}\n")
-    
+def insert_events(service, events, total):
+    """Insert events one request at a time; returns (processed, added, failed)"""
     added_count = 0
     failed_count = 0
-    skipped_count = 0
+    processed = 0
     
     for i, event in enumerate(events, 1):
+        processed = i
+        progress = f"{i}/{total}" if total is not None else str(i)
         try:
             # Check if event already exists (optional - you can skip this if you want duplicates)
             # For now, we'll just add all events
             
-            # Create the event
-            created_event = service.events().insert(
-                calendarId='primary',
-                body=event
-            ).execute()
+            # Create the event (an idempotent import when it has an iCalUID)
+            created_event = upsert_request(service, event).execute()
             
             event_summary = event.get('summary', 'Unknown')
             event_date = event.get('start', {}).get('dateTime', 'Unknown')
             
-            print(f"✓ [{i}/{len(events)}] Added: {event_summary}")
+            print(f"✓ [{progress}] Added: {event_summary}")
             print(f"  Due: {event_date}")
             print(f"  Event ID: {created_event.get('id', 'N/A')}")
             print()
@@ -109,22 +58,88 @@ def add_events_to_calendar(service, events_data):
             
         except HttpError as error:
             event_summary = event.get('summary', 'Unknown')
-            print(f"✗ [{i}/{len(events)}] Failed to add: {event_summary}")
+            print(f"✗ [{progress}] Failed to add: {event_summary}")
             print(f"  Error: {error}")
             print()
             failed_count += 1
         except Exception as e:
             event_summary = event.get('summary', 'Unknown')
-            print(f"✗ [{i}/{len(events)}] Error adding: {event_summary}")
+            print(f"✗ [{progress}] Error adding: {event_summary}")
             print(f"  Error: {e}")
             print()
             failed_count += 1
     
+    return processed, added_count, failed_count
+
+def insert_events_batched(service, events, total):
+    """Insert events with Calendar batch requests of up to 50 calls; returns (processed, added, failed)"""
+    counts = {"processed": 0, "added": 0, "failed": 0}
+    sent = {}
+    
+    def on_inserted(request_id, response, exception):
+        event = sent.pop(request_id)
+        i = int(request_id)
+        progress = f"{i}/{total}" if total is not None else str(i)
+        event_summary = event.get('summary', 'Unknown')
+        if exception is not None:
+            print(f"✗ [{progress}] Failed to add: {event_summary}")
+            print(f"  Error: {exception}")
+            print()
+            counts["failed"] += 1
+            return
+        print(f"✓ [{progress}] Added: {event_summary}")
+        print(f"  Due: {event.get('start', {}).get('dateTime', 'Unknown')}")
+        print(f"  Event ID: {response.get('id', 'N/A')}")
+        print()
+        counts["added"] += 1
+    
+    def insert_requests():
+        # Built lazily so a streamed NDJSON input is never held in memory whole
+        for i, event in enumerate(events, 1):
+            counts["processed"] = i
+            sent[str(i)] = event
+            yield i, upsert_request(service, event)
+    
+    round_trips = execute_in_batches(service, insert_requests(), on_inserted)
+    if counts["processed"]:
+        print(f"Batched {counts['processed']} inserts into {round_trips} requests")
+    return counts["processed"], counts["added"], counts["failed"]
+
+def add_events_to_calendar(service, events_data, use_batch=False):
+    """Add events to Google Calendar from the loaded JSON file or any iterable of events
+
+    With use_batch the inserts are sent as Calendar batch requests of up to 50 calls.
+    """
+    if not service:
+        print("Calendar service not available")
+        return
+    
+    # A dict is the loaded JSON file; anything else (e.g. an NDJSON generator) is consumed lazily
+    events = events_data.get('events', []) if isinstance(events_data, dict) else events_data
+    total = len(events) if hasattr(events, '__len__') else None
+    if total == 0:
+        print("No events found in the data file.")
+        return
+    
+    print(f"\n{'=' * 60}")
+    print(f"Adding {total if total is not None else 'streamed'} events to Google Calendar...")
+    print(f"{'=' * 60}\n")
+    
+    skipped_count = 0
+    if use_batch:
+        processed, added_count, failed_count = insert_events_batched(service, events, total)
+    else:
+        processed, added_count, failed_count = insert_events(service, events, total)
+    
+    if processed == 0:
+        print("No events found in the data file.")
+        return
+    
     # Summary
     print("=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total events processed: {len(events)}")
+    print(f"Total events processed: {processed}")
     print(f"✓ Successfully added: {added_count}")
     print(f"✗ Failed: {failed_count}")
     if skipped_count > 0:
@@ -133,10 +148,62 @@ def add_events_to_calendar(service, events_data):
     
     return added_count, failed_count
 
+def add_stream_to_calendars(path, use_batch=False):
+    """Add every account's events in an NDJSON stream to that account's calendar, reading the file once
+
+    Each run of consecutive events of one account (multi_account.py writes an
+    account's records together) goes to tokens/<account>.json. The default
+    token.json takes the events of at most one account without its own token,
+    so two accounts never end up in the same calendar.
+    """
+    default_account = None
+    records = iter_ndjson(path, kind="event")
+    for account, group in itertools.groupby(records, key=lambda record: record.get("account")):
+        print(f"\nAccount {account}:")
+        if not os.path.exists(token_path_for(account)):
+            if default_account not in (None, account):
+                print(f"⊘ Skipped: no {token_path_for(account)}, and the default calendar "
+                      f"already has {default_account}'s events")
+                continue
+            default_account = account
+        service = get_account_service(account)
+        if not service:
+            print(f"✗ Failed to authenticate with Google Calendar for {account} - skipped")
+            continue
+        add_events_to_calendar(service, (record["event"] for record in group), use_batch=use_batch)
+
 def main():
+    parser = argparse.ArgumentParser(description="Add library due date reminders to Google Calendar")
+    parser.add_argument("--ndjson", help="read events lazily from an NDJSON stream instead of library_due_dates.json")
+    parser.add_argument("--account", help="with --ndjson, only add this account's events (to the default calendar)")
+    parser.add_argument("--batch", action="store_true", help="send inserts as Calendar batch requests (50 calls each)")
+    args = parser.parse_args()
+    
     script_dir = os.path.dirname(os.path.abspath(__file__))
     json_filename = os.path.join(script_dir, "library_due_dates.json")
     
+    if args.ndjson:
+        print("=" * 60)
+        print("Google Calendar Integration (NDJSON stream)")
+        print("=" * 60)
+        print(f"Streaming events from: {args.ndjson}")
+        if not os.path.exists(args.ndjson):
+            print(f"✗ File not found: {args.ndjson}")
+            return
+        if args.account:
+            service = authenticate_google_calendar()
+            if not service:
+                print("\n✗ Failed to authenticate with Google Calendar")
+                return
+            print("✓ Authentication successful!")
+            add_events_to_calendar(service, iter_events(args.ndjson, args.account), use_batch=args.batch)
+            print("\n✓ Process completed!")
+            return
+
+        add_stream_to_calendars(args.ndjson, use_batch=args.batch)
+        print("\n✓ Process completed!")
+        return
+    
     # Check if JSON file exists
     if not os.path.exists(json_filename):
         print("=" * 60)
@@ -179,7 +246,7 @@ def main():
     if service:
         print("✓ Authentication successful!")
         # Add events to calendar
-        add_events_to_calendar(service, events_data)
+        add_events_to_calendar(service, events_data, use_batch=args.batch)
         print("\n✓ Process completed!")
     else:
         print("\n✗ Failed to authenticate with Google Calendar")
@@ -12,104 +12,105 @@ Prerequisites:
 3. Run this script: python auto_calendar_reminder.py
 """
 
+import argparse
 import json
 import os
 from datetime import datetime, timedelta
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 # Import scraping functions from scrp.py
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+from calendar_batch import execute_in_batches
+from calendar_client import get_service
+from calendar_index import build_event_index, update_request, upsert_request
+from change_detect import ChangeTracker, fingerprint_records
+from library_store import DEFAULT_DB_FILE, LibraryStore
 
 # Login credentials for DTU Library
 USERNAME = "22234325"
 PASSWORD = "1234"
 
 def authenticate_google_calendar():
-    """Authenticate and return Google Calendar service"""
-    creds = None
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    token_path = os.path.join(script_dir, 'token.json')
-    credentials_path = os.path.join(script_dir, 'credentials.json')
-    
-    # The file token.json stores the user's access and refresh tokens.
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(credentials_path):
-                print("=" * 60)
-                print("ERROR: credentials.json not found!")
-                print("=" * 60)
-                print("Please download your OAuth 2.0 credentials from Google Cloud Console:")
-                print("1. Go to https://console.cloud.google.com/")
-                print("2. Create a project and enable Calendar API")
-                print("3. Create OAuth 2.0 credentials (Desktop app)")
-                print("4. Download credentials.json to this directory:")
-                print(f"   {script_dir}")
-                print("=" * 60)
-                return None
-            
-            flow = InstalledAppFlow.from_client_secrets_file(
-                credentials_path, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        # Save the credentials for the next run
-        with open(token_path, 'w') as token:
-            token.write(creds.to_json())
-    
-    try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
-    except HttpError as error:
-        print(f'An error occurred: {error}')
-        return None
+    """Authenticate and return Google Calendar service (cached for the life of the process)"""
+    return get_service()
+
+def list_window_request(service, event_date):
+    """Return the events().list request covering one day either side of event_date"""
+    time_min = (event_date - timedelta(days=1)).isoformat() + 'Z'
+    time_max = (event_date + timedelta(days=1)).isoformat() + 'Z'
+    return service.events().list(
+        calendarId='primary',
+        timeMin=time_min,
+        timeMax=time_max,
+        maxResults=100,
+        singleEvents=True,
+        orderBy='startTime'
+    )
+
+def find_matching_event(items, event_summary, event_date):
+    """Return (True, event_id) if items hold an event with the same summary within 24 hours"""
+    for event in items:
+        if event.get('summary') == event_summary:
+            # Check if the date matches (within same day)
+            start = event.get('start', {}).get('dateTime')
+            if start:
+                event_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
+                if abs((event_dt - event_date).total_seconds()) < 86400:  # Within 24 hours
+                    return True, event.get('id')
+    return False, None
 
 def check_event_exists(service, event_summary, event_date):
     """Check if an event with the same summary and date already exists"""
     try:
         # Search for events in a date range around the due date
-        time_min = (event_date - timedelta(days=1)).isoformat() + 'Z'
-        time_max = (event_date + timedelta(days=1)).isoformat() + 'Z'
-        
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            maxResults=100,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        events = events_result.get('items', [])
-        
-        for event in events:
-            if event.get('summary') == event_summary:
-                # Check if the date matches (within same day)
-                start = event.get('start', {}).get('dateTime')
-                if start:
-                    event_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                    if abs((event_dt - event_date).total_seconds()) < 86400:  # Within 24 hours
-                        return True, event.get('id')
-        
-        return False, None
+        events_result = list_window_request(service, event_date).execute()
+        return find_matching_event(events_result.get('items', []), event_summary, event_date)
     except Exception as e:
         print(f"  Warning: Could not check for existing events: {e}")
         return False, None
 
-def add_events_to_calendar(service, events_data, update_existing=False):
-    """Add events from JSON file to Google Calendar with duplicate checking"""
+def find_event(service, event, event_date):
+    """Find an existing copy of an event that has no iCalUID, by summary and date
+
+    Events with an iCalUID need no lookup: events().import_ creates or updates
+    them in one call.
+    """
+    if event.get('iCalUID'):
+        return False, None
+    return check_event_exists(service, event.get('summary'), event_date)
+
+def parse_event_date(event_date_str):
+    """Parse an event's start dateTime"""
+    try:
+        return datetime.fromisoformat(event_date_str.replace('Z', '+00:00'))
+    except:
+        return datetime.fromisoformat(event_date_str)
+
+def with_reminders(event):
+    """Set the enhanced reminders: 3 days before, 1 day before, and on the day"""
+    event['reminders'] = {
+        "useDefault": False,
+        "overrides": [
+            {"method": "email", "minutes": 4320},   # 3 days before (72 hours)
+            {"method": "popup", "minutes": 4320},   # 3 days before
+            {"method": "email", "minutes": 1440},   # 1 day before (24 hours)
+            {"method": "popup", "minutes": 1440},   # 1 day before
+            {"method": "popup", "minutes": 0}       # On the due date
+        ]
+    }
+    return event
+
+def add_events_to_calendar(service, events_data, update_existing=False, use_batch=False, use_index=False):
+    """Add events from JSON file to Google Calendar with duplicate checking
+
+    With use_batch the duplicate checks and the inserts/updates are each sent
+    as Calendar batch requests of up to 50 calls. With use_index the calendar
+    is listed once for the due-date span of the events without an iCalUID,
+    and their duplicate checks are dict lookups (see calendar_index.py).
+    Events with an iCalUID are never looked up, so they need no index.
+    """
     if not service:
         print("Calendar service not available")
         return
@@ -123,6 +124,20 @@ def add_events_to_calendar(service, events_data, update_existing=False):
     print(f"Adding {len(events)} events to Google Calendar...")
     print(f"{'=' * 60}\n")
     
+    index = None
+    unkeyed = [event for event in events if not event.get('iCalUID')]
+    if use_index and unkeyed:
+        try:
+            index = build_event_index(service, unkeyed)
+            print(f"Indexed existing calendar events with {index.list_calls} list call(s)\n")
+        except HttpError as error:
+            print(f"  Warning: Could not list existing events, checking one by one: {error}\n")
+    
+    if use_batch:
+        counts = add_events_batched(service, events, update_existing, index)
+        print_summary(len(events), *counts)
+        return counts
+    
     added_count = 0
     updated_count = 0
     skipped_count = 0
@@ -139,13 +154,13 @@ def add_events_to_calendar(service, events_data, update_existing=False):
                 continue
             
             # Parse event date
-            try:
-                event_date = datetime.fromisoformat(event_date_str.replace('Z', '+00:00'))
-            except:
-                event_date = datetime.fromisoformat(event_date_str)
+            event_date = parse_event_date(event_date_str)
             
             # Check if event already exists
-            exists, event_id = check_event_exists(service, event_summary, event_date)
+            if index is not None and not event.get('iCalUID'):
+                exists, event_id = index.find(event)
+            else:
+                exists, event_id = find_event(service, event, event_date)
             
             if exists and not update_existing:
                 print(f"⊘ [{i}/{len(events)}] Skipped (already exists): {event_summary}")
@@ -154,35 +169,22 @@ def add_events_to_calendar(service, events_data, update_existing=False):
                 continue
             
             # Enhanced reminders: 3 days before, 1 day before, and on the day
-            event['reminders'] = {
-                "useDefault": False,
-                "overrides": [
-                    {"method": "email", "minutes": 4320},   # 3 days before (72 hours)
-                    {"method": "popup", "minutes": 4320},   # 3 days before
-                    {"method": "email", "minutes": 1440},   # 1 day before (24 hours)
-                    {"method": "popup", "minutes": 1440},   # 1 day before
-                    {"method": "popup", "minutes": 0}       # On the due date
-                ]
-            }
+            with_reminders(event)
             
             if exists and update_existing:
                 # Update existing event
                 event['id'] = event_id
-                created_event = service.events().update(
-                    calendarId='primary',
-                    eventId=event_id,
-                    body=event
-                ).execute()
+                created_event = update_request(service, event_id, event).execute()
                 print(f"↻ [{i}/{len(events)}] Updated: {event_summary}")
                 updated_count += 1
             else:
-                # Create new event
-                created_event = service.events().insert(
-                    calendarId='primary',
-                    body=event
-                ).execute()
+                # Create new event (an idempotent import when it has an iCalUID)
+                created_event = upsert_request(service, event).execute()
                 print(f"✓ [{i}/{len(events)}] Added: {event_summary}")
                 added_count += 1
+                if index is not None:
+                    # A repeated book later in the same file is then a duplicate too
+                    index.add(created_event)
             
             print(f"  Due: {event_date_str}")
             print(f"  Event ID: {created_event.get('id', 'N/A')}")
@@ -202,19 +204,104 @@ def add_events_to_calendar(service, events_data, update_existing=False):
             print()
             failed_count += 1
     
-    # Summary
+    print_summary(len(events), added_count, updated_count, skipped_count, failed_count)
+    return added_count, updated_count, skipped_count, failed_count
+
+def add_events_batched(service, events, update_existing=False, index=None):
+    """Batched version of the add loop; returns (added, updated, skipped, failed)"""
+    counts = {"added": 0, "updated": 0, "skipped": 0, "failed": 0}
+    total = len(events)
+    
+    # Step 1: duplicate checks, 50 list calls per round trip
+    pending = {}
+    for i, event in enumerate(events, 1):
+        event_summary = event.get('summary', 'Unknown')
+        event_date_str = event.get('start', {}).get('dateTime', '')
+        if not event_date_str:
+            print(f"⊘ [{i}/{total}] Skipped: {event_summary} (no date)")
+            counts["skipped"] += 1
+            continue
+        try:
+            pending[str(i)] = (event, parse_event_date(event_date_str))
+        except ValueError as e:
+            print(f"✗ [{i}/{total}] Error adding: {event_summary}")
+            print(f"  Error: {e}")
+            counts["failed"] += 1
+    
+    existing = {}
+    def on_listed(request_id, response, exception):
+        event, event_date = pending[request_id]
+        if exception is not None:
+            print(f"  Warning: Could not check for existing events: {exception}")
+            existing[request_id] = (False, None)
+        else:
+            existing[request_id] = find_matching_event(response.get('items', []), event.get('summary'), event_date)
+    
+    # Events with an iCalUID are upserted with import_ and need no duplicate check
+    for request_id, (event, _) in pending.items():
+        if event.get('iCalUID'):
+            existing[request_id] = (False, None)
+        elif index is not None:
+            existing[request_id] = index.find(event)
+    unresolved = [(request_id, list_window_request(service, event_date))
+                  for request_id, (_, event_date) in pending.items() if request_id not in existing]
+    round_trips = execute_in_batches(service, unresolved, on_listed)
+    lookups = len(unresolved)
+    
+    # Step 2: inserts and updates, 50 per round trip
+    writes = []
+    for request_id, (event, _) in pending.items():
+        exists, event_id = existing[request_id]
+        event_summary = event.get('summary', 'Unknown')
+        if exists and not update_existing:
+            print(f"⊘ [{request_id}/{total}] Skipped (already exists): {event_summary}")
+            print(f"  Due: {event.get('start', {}).get('dateTime', '')}")
+            counts["skipped"] += 1
+            continue
+        with_reminders(event)
+        if exists:
+            event['id'] = event_id
+            request = update_request(service, event_id, event)
+        else:
+            request = upsert_request(service, event)
+        writes.append((request_id, request))
+    
+    def on_written(request_id, response, exception):
+        event, _ = pending[request_id]
+        event_summary = event.get('summary', 'Unknown')
+        if exception is not None:
+            print(f"✗ [{request_id}/{total}] Failed to add: {event_summary}")
+            print(f"  Error: {exception}")
+            print()
+            counts["failed"] += 1
+            return
+        if existing[request_id][0]:
+            print(f"↻ [{request_id}/{total}] Updated: {event_summary}")
+            counts["updated"] += 1
+        else:
+            print(f"✓ [{request_id}/{total}] Added: {event_summary}")
+            counts["added"] += 1
+        print(f"  Due: {event.get('start', {}).get('dateTime', '')}")
+        print(f"  Event ID: {response.get('id', 'N/A')}")
+        print(f"  Reminders: 3 days, 1 day, and on due date")
+        print()
+    
+    round_trips += execute_in_batches(service, writes, on_written)
+    calls = len(writes) + lookups
+    print(f"Batched {calls} Calendar API calls into {round_trips} requests")
+    return counts["added"], counts["updated"], counts["skipped"], counts["failed"]
+
+def print_summary(total, added_count, updated_count, skipped_count, failed_count):
     print("=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total events processed: {len(events)}")
+    print(f"Total events processed: {total}")
     print(f"✓ Successfully added: {added_count}")
     if updated_count > 0:
         print(f"↻ Updated: {updated_count}")
     print(f"⊘ Skipped (duplicates): {skipped_count}")
     print(f"✗ Failed: {failed_count}")
     print("=" * 60)
-    
-    return added_count, updated_count, skipped_count, failed_count
 
 def run_scraping():
     """Run the scraping script to get latest due dates"""
@@ -271,12 +358,51 @@ def run_scraping():
         print(f"Error during scraping: {e}")
         return None
 
+def load_events_from_store(username):
+    """Return events_data for username from the library database, or None if it has no data"""
+    if not os.path.exists(DEFAULT_DB_FILE):
+        return None
+    store = LibraryStore()
+    try:
+        if not store.has_account(username):
+            return None
+        scraped_at = store.last_scraped_at(username)
+        return {
+            "events": store.load_events(username),
+            "metadata": {
+                "source": f"Library database ({store.path})",
+                "extracted_at": scraped_at.isoformat() if scraped_at else None
+            }
+        }
+    finally:
+        store.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="Add library due date reminders to Google Calendar")
+    parser.add_argument("--batch", action="store_true",
+                        help="send duplicate checks and inserts as Calendar batch requests (50 calls each)")
+    parser.add_argument("--index", action="store_true",
+                        help="list the calendar once for all due dates instead of once per event")
+    parser.add_argument("--delta", action="store_true",
+                        help="send only the inserts/updates/deletes changed since the last sync (needs the library database)")
+    args = parser.parse_args()
+    
+    if args.delta:
+        from calendar_delta_sync import sync_account
+        print("=" * 60)
+        print("Delta Sync with Google Calendar")
+        print("=" * 60)
+        sync_account(USERNAME, use_batch=args.batch)
+        return
+    
     script_dir = os.path.dirname(os.path.abspath(__file__))
     json_filename = os.path.join(script_dir, "library_due_dates.json")
     
+    # Prefer the library database; it only reads this account's rows
+    events_data = load_events_from_store(USERNAME)
+    
     # Step 1: Check if we have data, if not, prompt to run scraper
-    if not os.path.exists(json_filename):
+    if events_data is None and not os.path.exists(json_filename):
         print("=" * 60)
         print("ERROR: library_due_dates.json not found!")
         print("=" * 60)
@@ -290,23 +416,23 @@ def main():
         if not json_filename or not os.path.exists(json_filename):
             return
     
-    # Load events from JSON
+    # Load events from the JSON file when the database has none
     print("\n" + "=" * 60)
     print("Step 2: Loading Calendar Events")
     print("=" * 60)
-    print(f"Loading events from: {json_filename}")
-    
-    try:
-        with open(json_filename, 'r', encoding='utf-8') as f:
-            events_data = json.load(f)
-    except Exception as e:
-        print(f"Error reading JSON file: {e}")
-        return
+    if events_data is None:
+        print(f"Loading events from: {json_filename}")
+        try:
+            with open(json_filename, 'r', encoding='utf-8') as f:
+                events_data = json.load(f)
+        except Exception as e:
+            print(f"Error reading JSON file: {e}")
+            return
     
     events = events_data.get('events', [])
     metadata = events_data.get('metadata', {})
     
-    print(f"✓ Loaded {len(events)} events from file")
+    print(f"✓ Loaded {len(events)} events")
     if metadata:
         print(f"  Source: {metadata.get('source', 'N/A')}")
         print(f"  Extracted at: {metadata.get('extracted_at', 'N/A')}")
@@ -315,6 +441,13 @@ def main():
         print("\nNo events to add to calendar.")
         return
     
+    # Nothing to do if these exact events were already synced last time
+    tracker = ChangeTracker()
+    events_fingerprint = fingerprint_records(events)
+    if tracker.is_synced(USERNAME, events_fingerprint):
+        print("\n✓ Checkouts unchanged since the last sync - calendar is up to date")
+        return
+    
     # Step 3: Authenticate with Google Calendar
     print("\n" + "=" * 60)
     print("Step 3: Authenticating with Google Calendar")
@@ -332,7 +465,9 @@ def main():
     print("\n" + "=" * 60)
     print("Step 4: Adding Events to Google Calendar")
     print("=" * 60)
-    add_events_to_calendar(service, events_data, update_existing=False)
+    result = add_events_to_calendar(service, events_data, update_existing=False, use_batch=args.batch, use_index=args.index)
+    if result and result[3] == 0:
+        tracker.mark_synced(USERNAME, events_fingerprint)
     
     print("\n" + "=" * 60)
     print("✓ Process completed!")
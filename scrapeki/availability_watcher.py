@@ -0,0 +1,270 @@
+"""
+Availability watcher for popular DTU Library titles.
+
+Students subscribe to the biblios they are waiting for. The watcher fetches
+each biblio at most once per TTL window, however many students watch it:
+
+- results live in an LRU cache with a TTL, so repeat lookups are free
+- concurrent lookups of the same biblio share one in-flight request
+- expired entries are revalidated with their ETag, so unchanged records cost a 304
+- when a biblio's status changes (e.g. issued -> available), every
+  subscriber of that biblio is notified
+
+OPAC load therefore grows with the number of unique titles, not watchers.
+
+Usage: python scrapeki/availability_watcher.py watchlist.json --ttl 300
+
+watchlist.json maps each student to titles or biblionumbers, e.g.
+{"22234325": ["Operating System Concepts", "1234"]}. Titles are looked up in
+the local catalog index built by catalog_crawler.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_crawler import CatalogIndex, fetch_record, summarize_availability
+from opac_http import new_session
+from rate_limit import TokenBucket
+
+DEFAULT_TTL = 300           # seconds a fetched status is reused
+DEFAULT_CACHE_SIZE = 1024   # biblios kept in memory
+DEFAULT_RATE = 2.0          # OPAC requests per second
+
+class TTLCache:
+    """LRU cache whose entries expire ttl seconds after they were stored"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Return the value if present and fresh, else None"""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def peek(self, key):
+        """Return the value even if it has expired (for revalidation), else None"""
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+class AvailabilityWatcher:
+    """Shared availability lookups with per-biblio subscribers"""
+
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_CACHE_SIZE, rate=DEFAULT_RATE, fetcher=None):
+        self.cache = TTLCache(maxsize, ttl)
+        self.bucket = TokenBucket(rate)
+        self._fetcher = fetcher or self._fetch_from_opac
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._subscribers = {}
+        self._last_status = {}
+        self._local = threading.local()
+        self.stats = {"hits": 0, "fetches": 0, "shared": 0, "not_modified": 0, "notifications": 0}
+
+    def _fetch_from_opac(self, biblionumber, etag=None):
+        """Default fetcher: read the record's #holdingst table; returns (items, etag), items None on 304"""
+        if not hasattr(self._local, "session"):
+            self._local.session = new_session()
+        self.bucket.acquire()
+        return fetch_record(self._local.session, biblionumber, etag)
+
+    def subscribe(self, biblionumber, callback):
+        """Call callback(biblionumber, old_status, new_status, entry) whenever the status changes"""
+        biblionumber = str(biblionumber)
+        with self._lock:
+            self._subscribers.setdefault(biblionumber, []).append(callback)
+
+    def unsubscribe(self, biblionumber, callback):
+        """Stop notifying callback about biblionumber"""
+        biblionumber = str(biblionumber)
+        with self._lock:
+            callbacks = self._subscribers.get(biblionumber, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(biblionumber, None)
+
+    def watched(self):
+        """Return the biblionumbers that have at least one subscriber"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def get(self, biblionumber):
+        """Return the availability entry for biblionumber, fetching it at most once per TTL"""
+        biblionumber = str(biblionumber)
+        with self._lock:
+            entry = self.cache.get(biblionumber)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry
+            flight = self._inflight.get(biblionumber)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[biblionumber] = Future()
+                stale = self.cache.peek(biblionumber)
+            else:
+                self.stats["shared"] += 1
+
+        # Everyone else asking for this biblio waits for the leader's request
+        if not leader:
+            return flight.result()
+
+        try:
+            items, etag = self._fetcher(biblionumber, stale["etag"] if stale else None)
+            with self._lock:
+                if items is None and stale is not None:
+                    self.stats["not_modified"] += 1
+                    items = stale["items"]
+                else:
+                    self.stats["fetches"] += 1
+                items = items or []
+                entry = {
+                    "biblionumber": biblionumber,
+                    "availability": summarize_availability(items) if items else "unknown",
+                    "available_items": sum(1 for item in items if item["availability"] == "available"),
+                    "total_items": len(items),
+                    "items": items,
+                    "etag": etag,
+                    "fetched_at": datetime.now().isoformat()
+                }
+                self.cache.set(biblionumber, entry)
+            flight.set_result(entry)
+            return entry
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[biblionumber]
+
+    def check(self, biblionumber):
+        """Look up one biblio and notify its subscribers if its status changed"""
+        entry = self.get(biblionumber)
+        with self._lock:
+            old_status = self._last_status.get(entry["biblionumber"])
+            self._last_status[entry["biblionumber"]] = entry["availability"]
+            callbacks = list(self._subscribers.get(entry["biblionumber"], []))
+        # The first lookup only sets the baseline
+        if old_status is not None and old_status != entry["availability"]:
+            for callback in callbacks:
+                with self._lock:
+                    self.stats["notifications"] += 1
+                # One failing subscriber must not keep the others from hearing about it
+                try:
+                    callback(entry["biblionumber"], old_status, entry["availability"], entry)
+                except Exception as e:
+                    print(f"✗ biblio {entry['biblionumber']}: subscriber failed: {e.__class__.__name__}: {e}")
+        return entry
+
+    def poll_once(self):
+        """Check every watched biblio once; return the number of failures"""
+        failed = 0
+        for biblionumber in self.watched():
+            try:
+                self.check(biblionumber)
+            except requests.RequestException as e:
+                failed += 1
+                print(f"✗ biblio {biblionumber}: {e}")
+            except Exception as e:
+                # e.g. a record page the parser does not understand; keep watching the rest
+                failed += 1
+                print(f"✗ biblio {biblionumber}: {e.__class__.__name__}: {e}")
+        return failed
+
+    def run_forever(self):
+        """Re-check watched biblios each time their cache entries expire"""
+        while True:
+            self.poll_once()
+            time.sleep(self.cache.ttl)
+
+def load_watchlist(path, index):
+    """Return {student: [biblionumber, ...]} from a watchlist file, resolving titles via the index"""
+    with open(path, 'r', encoding='utf-8') as f:
+        watchlist = json.load(f)
+    resolved = {}
+    for student, wanted in watchlist.items():
+        biblionumbers = []
+        for entry in wanted:
+            entry = str(entry).strip()
+            if entry.isdigit():
+                biblionumbers.append(entry)
+                continue
+            matches = index.search(entry, limit=5)
+            exact = [m for m in matches if (m["title"] or "").casefold() == entry.casefold()]
+            match = (exact or matches or [None])[0]
+            if match is None:
+                print(f"✗ {student}: '{entry}' not found in the catalog index (run catalog_crawler.py crawl)")
+                continue
+            biblionumbers.append(match["biblionumber"])
+        resolved[student] = biblionumbers
+    return resolved
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch DTU Library titles and report when they become available")
+    parser.add_argument("watchlist", help="JSON file mapping students to titles or biblionumbers")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="seconds between checks of one biblio")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="max OPAC requests per second")
+    parser.add_argument("--once", action="store_true", help="check every title once and exit")
+    args = parser.parse_args()
+
+    index = CatalogIndex()
+    watchlist = load_watchlist(args.watchlist, index)
+    watcher = AvailabilityWatcher(ttl=args.ttl, rate=args.rate)
+
+    def notifier(student):
+        def notify(biblionumber, old_status, new_status, entry):
+            title = index.records.get(biblionumber, {}).get("title", f"biblio {biblionumber}")
+            print(f"✓ {student}: '{title}' is now {new_status} (was {old_status}, "
+                  f"{entry['available_items']}/{entry['total_items']} copies available)")
+        return notify
+
+    for student, biblionumbers in watchlist.items():
+        callback = notifier(student)
+        for biblionumber in biblionumbers:
+            watcher.subscribe(biblionumber, callback)
+
+    print("=" * 60)
+    print("DTU Library Availability Watcher")
+    print("=" * 60)
+    print(f"{sum(len(b) for b in watchlist.values())} subscriptions on {len(watcher.watched())} unique titles")
+
+    if args.once:
+        watcher.poll_once()
+        for biblionumber in watcher.watched():
+            entry = watcher.get(biblionumber)
+            title = index.records.get(biblionumber, {}).get("title", f"biblio {biblionumber}")
+            print(f"  [{entry['availability']}] {title}")
+        return
+
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        print(f"\nWatcher stopped. OPAC fetches: {watcher.stats['fetches']}, "
+              f"304s: {watcher.stats['not_modified']}, cache hits: {watcher.stats['hits']}")
+
+if __name__ == '__main__':
+    main()
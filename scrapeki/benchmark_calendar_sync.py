@@ -0,0 +1,209 @@
+"""
+API cost benchmark for every Google Calendar sync path.
+
+Generates library accounts with loans into a temporary library database and
+syncs their reminders to fake_calendar.py, which needs no Google account or
+network. Each scenario starts from an empty calendar unless noted:
+
+    insert            add_to_google_calendar.add_events_to_calendar, one call per book
+    insert-batch      the same with --batch
+    check             auto_calendar_reminder.add_events_to_calendar, duplicate check + write per book
+    check-batch       the same with --batch
+    check-index       the same with --index
+    check-index-batch the same with --index --batch
+    delta             calendar_delta_sync, first sync
+    delta-rerun       calendar_delta_sync again with nothing changed
+    executor          calendar_sync_executor, all accounts concurrently
+    reconcile-full    calendar_reconcile without a sync token (after a delta sync)
+    reconcile         calendar_reconcile with a sync token, after one user deletion per account
+
+The report shows API calls and HTTP round trips per synced book, wall time, and
+how many books are missing from or duplicated on the calendar afterwards.
+
+Usage: python scrapeki/benchmark_calendar_sync.py --accounts 5 --books 10 --latency 0.02
+       python scrapeki/benchmark_calendar_sync.py --quota 20 --error-rate 0.05
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_calendar import FakeCalendar
+
+SCENARIOS = ("insert", "insert-batch", "check", "check-batch", "check-index", "check-index-batch",
+             "delta", "delta-rerun", "executor", "reconcile-full", "reconcile")
+
+def generate_accounts(store, accounts, books):
+    """Record `books` loans for each of `accounts` generated accounts; return the usernames"""
+    from checkout_parser import add_event_identity, build_calendar_event, parse_date
+
+    usernames = [f"bench{i:04d}" for i in range(accounts)]
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for username in usernames:
+        checkout_data, calendar_events = [], []
+        for book in range(books):
+            checkout = today - timedelta(days=book % 14)
+            due = checkout + timedelta(days=14 + book % 7)
+            item = {
+                "title": f"Benchmark Book {book} ({username})",
+                "author": "A. Author",
+                "checkout_date": f"{checkout:%d/%m/%Y %H:%M}",
+                "due_date": f"{due:%d/%m/%Y}"
+            }
+            due_dt = parse_date(item["due_date"])
+            event = build_calendar_event(item["title"], item["author"], item["checkout_date"],
+                                         item["due_date"], due_dt)
+            checkout_data.append(item)
+            calendar_events.append(add_event_identity(event, username, item))
+        store.record_scrape(username, checkout_data, calendar_events, engine="benchmark")
+    return usernames
+
+def calendar_health(fake, store, usernames):
+    """Return (missing, duplicated) books over all accounts"""
+    missing = duplicated = 0
+    for username in usernames:
+        wanted = {event["iCalUID"] for event in store.load_events(username)}
+        live = [event.get("iCalUID") for event in fake.events_of(username)]
+        missing += len(wanted - set(live))
+        duplicated += len(live) - len(set(live))
+    return missing, duplicated
+
+def _reset_sync_state(store):
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM calendar_sync")
+        conn.execute("DELETE FROM calendar_sync_tokens")
+
+def _delta_all(fake, store, usernames):
+    from calendar_delta_sync import DeltaSync
+    for username in usernames:
+        DeltaSync(store, use_batch=True, verbose=False).sync(fake.service(username), username)
+
+def _reconcile_all(fake, store, usernames):
+    from calendar_reconcile import Reconciler
+    for username in usernames:
+        Reconciler(store, verbose=False).reconcile(fake.service(username), username)
+
+def prepare(name, fake, store, usernames):
+    """Untimed setup of a scenario"""
+    if name in ("delta-rerun", "reconcile-full"):
+        _delta_all(fake, store, usernames)
+    elif name == "reconcile":
+        _delta_all(fake, store, usernames)
+        _reconcile_all(fake, store, usernames)
+        for username in usernames:
+            fake.user_delete(username, fake.events_of(username)[0]["id"])
+
+def run(name, fake, store, usernames, args):
+    """The timed part of a scenario"""
+    if name in ("insert", "insert-batch"):
+        import add_to_google_calendar
+        for username in usernames:
+            add_to_google_calendar.add_events_to_calendar(
+                fake.service(username), {"events": store.load_events(username)}, use_batch=name == "insert-batch"
+            )
+    elif name.startswith("check"):
+        import auto_calendar_reminder
+        for username in usernames:
+            auto_calendar_reminder.add_events_to_calendar(
+                fake.service(username), {"events": store.load_events(username)},
+                use_batch=name.endswith("batch"), use_index="index" in name
+            )
+    elif name in ("delta", "delta-rerun"):
+        _delta_all(fake, store, usernames)
+    elif name == "executor":
+        from calendar_sync_executor import CalendarSyncExecutor
+        executor = CalendarSyncExecutor(args.workers, args.rate, service_factory=fake.service)
+        for _ in executor.run(usernames):
+            pass
+    elif name.startswith("reconcile"):
+        _reconcile_all(fake, store, usernames)
+
+def bench_scenario(name, store, usernames, args):
+    """Run one scenario against a fresh fake calendar and return its measurements"""
+    fake = FakeCalendar(latency=args.latency, quota=args.quota, error_rate=args.error_rate, seed=1)
+    _reset_sync_state(store)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Setup runs without failures so every scenario starts from the same state
+        error_rate, quota = fake.error_rate, fake.quota
+        fake.error_rate, fake.quota = 0.0, 0
+        prepare(name, fake, store, usernames)
+        fake.error_rate, fake.quota = error_rate, quota
+        fake.reset_stats()
+
+        start = time.perf_counter()
+        error = None
+        try:
+            run(name, fake, store, usernames, args)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        wall = time.perf_counter() - start
+
+    missing, duplicated = calendar_health(fake, store, usernames)
+    return {"scenario": name, "wall": wall, "error": error, "missing": missing, "duplicated": duplicated,
+            **fake.stats}
+
+def print_report(results, args):
+    books = args.accounts * args.books
+    print("\n" + "=" * 60)
+    print(f"Results ({args.accounts} accounts x {args.books} books, {args.latency * 1000:.0f} ms per round trip)")
+    print("=" * 60)
+    print(f"{'scenario':<18} {'calls':>6} {'trips':>6} {'calls/book':>10} {'trips/book':>10} "
+          f"{'wall s':>7} {'missing':>7} {'dupes':>6}")
+    for result in results:
+        print(
+            f"{result['scenario']:<18} {result['calls']:>6} {result['round_trips']:>6} "
+            f"{result['calls'] / books:>10.2f} {result['round_trips'] / books:>10.2f} "
+            f"{result['wall']:>7.2f} {result['missing']:>7} {result['duplicated']:>6}"
+        )
+        if result["rate_limited"] or result["failed"]:
+            print(f"{'':<18} {result['rate_limited']} rate-limited, {result['failed']} server errors")
+        if result["error"]:
+            print(f"{'':<18} ✗ {result['error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the calendar sync paths against a fake Calendar API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--accounts", type=int, default=5, help="library accounts to sync")
+    parser.add_argument("--books", type=int, default=10, help="loans per account")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake API delay per round trip in seconds")
+    parser.add_argument("--quota", type=int, default=0, help="API calls per second before 403 rateLimitExceeded (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of API calls answered with 503")
+    parser.add_argument("--workers", type=int, default=4, help="threads for the executor scenario")
+    parser.add_argument("--rate", type=float, default=1000, help="executor's own API call limit per second")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The sync modules open LibraryStore() with the default path, so set it before importing them
+        os.environ["LIBRARY_DB"] = os.path.join(work_dir, "library.db")
+        from library_store import LibraryStore
+
+        store = LibraryStore(os.environ["LIBRARY_DB"])
+        usernames = generate_accounts(store, args.accounts, args.books)
+        print("=" * 60)
+        print("DTU Library Calendar Sync Benchmark")
+        print("=" * 60)
+        print(f"{len(usernames)} accounts, {args.accounts * args.books} books, fake Calendar API in-process")
+
+        results = []
+        try:
+            for name in scenarios:
+                print(f"Running {name}...")
+                results.append(bench_scenario(name, store, usernames, args))
+        finally:
+            store.close()
+    print_report(results, args)
+
+if __name__ == '__main__':
+    main()
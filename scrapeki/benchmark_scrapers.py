@@ -0,0 +1,223 @@
+"""
+Throughput benchmark for every DTU Library scraping engine.
+
+Starts fake_opac.py on a free local port and scrapes the same set of
+generated accounts with each engine:
+
+    http      opac_http.py, one requests.Session per account
+    async     multi_account.py, concurrent aiohttp over a shared pool
+    api       koha_api.py (ILS-DI on the fake server)
+    pool      driver_pool.py, warm headless Chrome
+    selenium  dataa.py as a script, one headless Chrome per account
+
+Each engine runs in its own worker process so its peak RSS can be measured
+in isolation (for selenium this includes the browser processes). The report
+shows accounts/s, p50/p95 latency per account, peak RSS, RSS per account and
+OPAC requests per account. No real credentials or network access needed.
+
+Usage: python scrapeki/benchmark_scrapers.py --accounts 20 --checkouts 10 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_opac import FakeKoha, serve_in_thread
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ("http", "async", "api", "pool", "selenium")
+BROWSER_ENGINES = ("pool", "selenium")
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def peak_rss_mb():
+    """Return the peak RSS of this process and its finished children in MB"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+# Workers (run inside the engine's own process)
+
+def _timed(job):
+    start = time.perf_counter()
+    try:
+        items = job()
+        return time.perf_counter() - start, items, None
+    except Exception as e:
+        message = str(e).strip().splitlines()
+        return time.perf_counter() - start, 0, message[0] if message else e.__class__.__name__
+
+def _worker_http(accounts, args):
+    from opac_http import scrape_account
+    return [_timed(lambda: len(scrape_account(acc["username"], acc["password"])[0])) for acc in accounts]
+
+def _worker_async(accounts, args):
+    from multi_account import scrape_accounts
+
+    async def collect():
+        results = []
+        async for result in scrape_accounts(accounts, args.concurrency, args.concurrency):
+            results.append((result["elapsed"], len(result["checkout_data"]), result.get("error")))
+        return results
+    return asyncio.run(collect())
+
+def _worker_api(accounts, args):
+    from koha_api import KohaClient
+    return [
+        _timed(lambda: len(KohaClient(acc["username"], acc["password"]).get_checkouts()[0]))
+        for acc in accounts
+    ]
+
+def _worker_pool(accounts, args):
+    from driver_pool import DriverPool
+    pool = DriverPool(size=1)
+    try:
+        return [_timed(lambda: len(pool.run(acc["username"], acc["password"])[0])) for acc in accounts]
+    finally:
+        pool.close()
+
+def _worker_selenium(accounts, args):
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        env = dict(os.environ, SCRAPER_HEADLESS="1", SCRAPER_OUTPUT_DIR=output_dir,
+                   LIBRARY_DB=os.path.join(output_dir, "library.db"))
+        data_file = os.path.join(output_dir, "library_checkout_data.json")
+
+        def run_script():
+            # dataa.py has its own hard-coded account; the fake OPAC accepts it
+            if os.path.exists(data_file):
+                os.remove(data_file)
+            proc = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "dataa.py")],
+                                  env=env, capture_output=True, text=True)
+            if not os.path.exists(data_file):
+                lines = (proc.stdout + proc.stderr).strip().splitlines()
+                raise RuntimeError(lines[-1] if lines else "dataa.py produced no output")
+            with open(data_file, 'r', encoding='utf-8') as f:
+                return len(json.load(f)["checkout_data"])
+
+        for _ in accounts:
+            results.append(_timed(run_script))
+    return results
+
+WORKERS = {
+    "http": _worker_http,
+    "async": _worker_async,
+    "api": _worker_api,
+    "pool": _worker_pool,
+    "selenium": _worker_selenium,
+}
+
+def run_worker(args):
+    """Entry point of a worker process: scrape and print one JSON result line"""
+    accounts = [{"username": f"bench{i:04d}", "password": "bench"} for i in range(args.accounts)]
+    start = time.perf_counter()
+    results = WORKERS[args.worker](accounts, args)
+    print(json.dumps({
+        "wall": time.perf_counter() - start,
+        "latencies": [elapsed for elapsed, _, error in results if error is None],
+        "items": [items for _, items, error in results if error is None],
+        "errors": [error for _, _, error in results if error is not None],
+        "peak_rss_mb": peak_rss_mb()
+    }))
+
+# Driver
+
+def bench_engine(engine, base_url, server, args):
+    """Run one engine in a fresh process and return its measurements"""
+    with server.stats_lock:
+        requests_before = sum(server.stats.values())
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", engine,
+        "--accounts", str(args.accounts), "--concurrency", str(args.concurrency)
+    ]
+    env = dict(os.environ, OPAC_BASE_URL=base_url)
+    proc = subprocess.run(command, env=env, capture_output=True, text=True)
+    with server.stats_lock:
+        requests_made = sum(server.stats.values()) - requests_before
+
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        error = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]
+        return {"engine": engine, "failed": error[0]}
+    result = json.loads(lines[-1])
+    result["engine"] = engine
+    result["requests"] = requests_made
+    return result
+
+def print_report(results, args):
+    print("\n" + "=" * 60)
+    print(f"Results ({args.accounts} accounts, {args.checkouts} loans each, {args.latency * 1000:.0f} ms server latency)")
+    print("=" * 60)
+    print(f"{'engine':<9} {'ok':>4} {'acc/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>7} {'MB/acc':>7} {'req/acc':>8}")
+    for result in results:
+        if "failed" in result:
+            print(f"{result['engine']:<9} ✗ {result['failed']}")
+            continue
+        ok = len(result["latencies"])
+        throughput = ok / result["wall"] if result["wall"] else 0.0
+        print(
+            f"{result['engine']:<9} {ok:>4} {throughput:>7.1f} "
+            f"{percentile(result['latencies'], 50) * 1000:>8.0f} {percentile(result['latencies'], 95) * 1000:>8.0f} "
+            f"{result['peak_rss_mb']:>7.1f} {result['peak_rss_mb'] / max(1, ok):>7.2f} "
+            f"{result['requests'] / max(1, args.accounts):>8.1f}"
+        )
+        wrong = [items for items in result["items"] if items != args.checkouts]
+        if wrong:
+            print(f"          ✗ {len(wrong)} accounts returned the wrong number of items")
+        if result["errors"]:
+            print(f"          ✗ {len(result['errors'])} errors, first: {result['errors'][0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraping engines against a local fake OPAC")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"comma-separated subset of {','.join(ENGINES)}")
+    parser.add_argument("--accounts", type=int, default=20, help="accounts to scrape per engine")
+    parser.add_argument("--checkouts", type=int, default=5, help="loans per account (#checkoutst rows)")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake server delay per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrency for the async engine")
+    parser.add_argument("--worker", choices=ENGINES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+
+    server, base_url = serve_in_thread(port=0, koha=FakeKoha(checkouts=args.checkouts), latency=args.latency)
+    print("=" * 60)
+    print("DTU Library Scraper Benchmark")
+    print("=" * 60)
+    print(f"Fake OPAC: {base_url}")
+
+    results = []
+    try:
+        for engine in engines:
+            print(f"Running {engine}...")
+            results.append(bench_engine(engine, base_url, server, args))
+    finally:
+        server.shutdown()
+
+    if any(engine in BROWSER_ENGINES for engine in engines):
+        print("\nNote: selenium/pool RSS includes Chrome only for processes that exited during the run")
+    print_report(results, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Bulk extraction of the #checkoutst table for the Selenium scrapers.
+
+Reading each cell with row.find_element costs one WebDriver round trip per
+field, so extraction time grows by 4-6 round trips per book. The modes here
+keep the cost flat:
+
+    script       one execute_script call returns every row as JSON (default)
+    page_source  one page_source call, parsed offline with checkout_parser
+    elements     the original per-cell find_element loop (for comparison)
+
+Both bulk modes first switch off DataTables pagination so every loan is in
+the DOM, not just the first page.
+"""
+
+import json
+import os
+import sys
+from selenium.webdriver.common.by import By
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import extract_checkout_rows, make_soup
+
+EXTRACTION_MODES = ("script", "page_source", "elements")
+DEFAULT_EXTRACTION_MODE = os.environ.get("SCRAPER_EXTRACTION", "script")
+
+SHOW_ALL_ROWS_JS = """
+var table = document.getElementById('checkoutst');
+if (table && window.jQuery && jQuery.fn.dataTable && jQuery.fn.dataTable.isDataTable(table)) {
+    jQuery(table).DataTable().page.len(-1).draw(false);
+}
+"""
+
+CHECKOUT_ROWS_JS = SHOW_ALL_ROWS_JS + """
+if (!table) { return '[]'; }
+function cellText(el) {
+    if (!el) { return null; }
+    var copy = el.cloneNode(true);
+    copy.querySelectorAll('.tdlabel').forEach(function (label) { label.remove(); });
+    return copy.textContent.replace(/\\s+/g, ' ').trim() || null;
+}
+var rows = [];
+table.querySelectorAll('tbody tr').forEach(function (tr) {
+    if (tr.querySelector('td.dataTables_empty')) { return; }
+    var due = tr.querySelector('td.date_due');
+    if (!due) {
+        var dateCells = tr.querySelectorAll("td[class*='date'], td[data-order]");
+        due = dateCells.length ? dateCells[dateCells.length - 1] : null;
+    }
+    var link = tr.querySelector("a[href*='biblionumber=']");
+    var match = link ? /biblionumber=(\\d+)/.exec(link.getAttribute('href')) : null;
+    rows.push({
+        title: cellText(tr.querySelector('span.biblio-title')) || 'Book ' + (rows.length + 1),
+        author: cellText(tr.querySelector('td.author')) || 'N/A',
+        checkout_date: cellText(tr.querySelector('td.checkout_date')),
+        due_date: cellText(due),
+        biblionumber: match ? match[1] : null,
+        barcode: cellText(tr.querySelector('td.barcode'))
+    });
+});
+return JSON.stringify(rows);
+"""
+
+def extract_rows_script(driver):
+    """Return every checkout row in a single execute_script round trip"""
+    rows = json.loads(driver.execute_script(CHECKOUT_ROWS_JS))
+    for row in rows:
+        for field in ("biblionumber", "barcode"):
+            if row.get(field) is None:
+                row.pop(field, None)
+    return rows
+
+def extract_rows_page_source(driver):
+    """Return every checkout row by parsing one copy of the page source offline"""
+    driver.execute_script(SHOW_ALL_ROWS_JS)
+    return extract_checkout_rows(make_soup(driver.page_source))
+
+def extract_rows_elements(driver):
+    """Return every checkout row with one find_element call per cell (original behaviour)"""
+    table = driver.find_element(By.ID, "checkoutst")
+    rows = []
+    for i, tr in enumerate(table.find_elements(By.CSS_SELECTOR, "tbody tr"), 1):
+        try:
+            title = tr.find_element(By.CSS_SELECTOR, "span.biblio-title").text.strip()
+        except Exception:
+            title = f"Book {i}"
+
+        try:
+            due_date_str = tr.find_element(By.CSS_SELECTOR, "td.date_due").text.strip()
+        except Exception:
+            date_cells = tr.find_elements(By.CSS_SELECTOR, "td[class*='date'], td[data-order]")
+            due_date_str = date_cells[-1].text.strip() if date_cells else None
+
+        try:
+            checkout_date_str = tr.find_element(By.CSS_SELECTOR, "td.checkout_date").text.strip()
+        except Exception:
+            checkout_date_str = None
+
+        try:
+            author = tr.find_element(By.CSS_SELECTOR, "td.author").text.strip()
+        except Exception:
+            author = "N/A"
+
+        rows.append({
+            "title": title,
+            "author": author or "N/A",
+            "checkout_date": checkout_date_str or None,
+            "due_date": due_date_str or None
+        })
+    return rows
+
+def extract_rows(driver, mode=DEFAULT_EXTRACTION_MODE):
+    """Return the raw rows of #checkoutst using the given extraction mode"""
+    if mode == "script":
+        return extract_rows_script(driver)
+    if mode == "page_source":
+        return extract_rows_page_source(driver)
+    if mode == "elements":
+        return extract_rows_elements(driver)
+    raise ValueError(f"Unknown extraction mode '{mode}', expected one of {EXTRACTION_MODES}")
@@ -0,0 +1,201 @@
+"""
+Shared Google Calendar client for every calendar script.
+
+Each script used to call build('calendar', 'v3', ...) on every run, which
+fetches or parses the discovery document. It also re-read token.json and
+could refresh the token each time. This module does that work once per
+process:
+
+- the Calendar v3 discovery document comes from a local copy: the static
+  document shipped with google-api-python-client, or calendar_v3_discovery.json
+  (downloaded once). It is read and parsed once per process; every service
+  is then built from the parsed document with build_from_document.
+- credentials are cached in memory per account, read from disk once and
+  refreshed only when expired; refreshed tokens are written back
+- service objects are reused: each thread builds one per account, with its
+  own AuthorizedHttp and keep-alive connection, because httplib2 is not
+  thread-safe
+
+A long-running daemon therefore pays the setup cost only on its first sync.
+
+Token files:
+    scrapeki/token.json              the default account (as before)
+    scrapeki/tokens/<account>.json   one file per account for multi-account sync
+
+Usage: python scrapeki/calendar_client.py   (times cold vs. warm service setup)
+"""
+
+import json
+import os
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKENS_DIR = os.path.join(SCRIPT_DIR, "tokens")
+DEFAULT_TOKEN_FILE = os.path.join(SCRIPT_DIR, "token.json")
+DEFAULT_CREDENTIALS_FILE = os.path.join(SCRIPT_DIR, "credentials.json")
+DISCOVERY_CACHE_FILE = os.path.join(SCRIPT_DIR, "calendar_v3_discovery.json")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+
+# If modifying these scopes, delete the token files.
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+_lock = threading.Lock()
+_discovery_doc = None
+_credentials = {}
+_token_locks = {}
+# build_from_document fills in defaults in the shared document, so builds take turns
+_build_lock = threading.Lock()
+_local = threading.local()
+
+def token_path_for(account=None):
+    """Return the token file of an account (None = the default scrapeki/token.json)"""
+    if account is None:
+        return DEFAULT_TOKEN_FILE
+    return os.path.join(TOKENS_DIR, f"{account}.json")
+
+def _token_lock(token_path):
+    """Return the lock of one token file, so a slow refresh or login only blocks its own account"""
+    with _lock:
+        lock = _token_locks.get(token_path)
+        if lock is None:
+            lock = _token_locks[token_path] = threading.Lock()
+        return lock
+
+def load_discovery_document():
+    """Return the parsed Calendar v3 discovery document, loading it at most once"""
+    global _discovery_doc
+    with _lock:
+        if _discovery_doc is not None:
+            return _discovery_doc
+        doc = None
+        if os.path.exists(DISCOVERY_CACHE_FILE):
+            with open(DISCOVERY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                doc = f.read()
+        if doc is None:
+            try:
+                # google-api-python-client 2.x ships static discovery documents
+                from googleapiclient.discovery_cache import get_static_doc
+                doc = get_static_doc('calendar', 'v3')
+            except ImportError:
+                doc = None
+        if doc is None:
+            import requests
+            response = requests.get(DISCOVERY_URL, timeout=20)
+            response.raise_for_status()
+            doc = response.text
+            with open(DISCOVERY_CACHE_FILE, 'w', encoding='utf-8') as f:
+                f.write(doc)
+        _discovery_doc = json.loads(doc)
+        return _discovery_doc
+
+def _print_missing_credentials(credentials_path):
+    print("=" * 60)
+    print("ERROR: credentials.json not found!")
+    print("=" * 60)
+    print("Please download your OAuth 2.0 credentials from Google Cloud Console:")
+    print("1. Go to https://console.cloud.google.com/")
+    print("2. Create a project and enable Calendar API")
+    print("3. Create OAuth 2.0 credentials (Desktop app)")
+    print("4. Download credentials.json to this directory:")
+    print(f"   {os.path.dirname(os.path.abspath(credentials_path))}")
+    print("=" * 60)
+
+def get_credentials(account=None, token_path=None, credentials_path=None, interactive=True):
+    """Return valid credentials for an account, from memory when possible, or None"""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    token_path = token_path or token_path_for(account)
+    credentials_path = credentials_path or DEFAULT_CREDENTIALS_FILE
+    with _token_lock(token_path):
+        creds = _credentials.get(token_path)
+        if creds is None and os.path.exists(token_path):
+            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+        if creds is not None and creds.valid:
+            _credentials[token_path] = creds
+            return creds
+
+        # If there are no (valid) credentials available, refresh or let the user log in.
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            if not interactive:
+                return None
+            if not os.path.exists(credentials_path):
+                _print_missing_credentials(credentials_path)
+                return None
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
+            creds = flow.run_local_server(port=0)
+
+        # Save the credentials for the next run
+        os.makedirs(os.path.dirname(os.path.abspath(token_path)), exist_ok=True)
+        with open(token_path, 'w') as token:
+            token.write(creds.to_json())
+        _credentials[token_path] = creds
+        return creds
+
+def get_service(account=None, token_path=None, credentials_path=None, interactive=True):
+    """Return a Calendar service for an account, reusing the one this thread built before"""
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.errors import HttpError
+
+    creds = get_credentials(account, token_path, credentials_path, interactive)
+    if creds is None:
+        return None
+
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+    key = token_path or token_path_for(account)
+    cached = services.get(key)
+    # AuthorizedHttp refreshes the token itself; a new creds object means a re-login
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+
+    try:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=30))
+        document = load_discovery_document()
+        with _build_lock:
+            service = build_from_document(document, http=http)
+    except HttpError as error:
+        print(f'An error occurred: {error}')
+        return None
+    services[key] = (creds, service)
+    return service
+
+def get_account_service(account, interactive=True):
+    """Return the Calendar service of an account's own token file, or of the default token if it has none
+
+    calendar_sync_executor always uses tokens/<account>.json, so every sync of
+    an account must pick the same calendar as the executor does.
+    """
+    if os.path.exists(token_path_for(account)):
+        return get_service(account, interactive=interactive)
+    return get_service(interactive=interactive)
+
+def clear_cache():
+    """Forget cached credentials and services (e.g. after revoking a token)"""
+    with _lock:
+        _credentials.clear()
+    _local.services = {}
+
+def main():
+    print("=" * 60)
+    print("Google Calendar Client Setup Timing")
+    print("=" * 60)
+    for label in ("Cold", "Warm"):
+        start = time.perf_counter()
+        service = get_service()
+        if service is None:
+            print("✗ Failed to authenticate with Google Calendar")
+            return
+        print(f"{label} setup: {(time.perf_counter() - start) * 1000:.1f} ms")
+    document = load_discovery_document()
+    print(f"✓ Discovery document: {document.get('id')} (revision {document.get('revision')})")
+
+if __name__ == '__main__':
+    main()
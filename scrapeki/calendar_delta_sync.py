@@ -0,0 +1,271 @@
+"""
+Delta sync of library reminders to Google Calendar.
+
+The calendar scripts used to have no memory of what they pushed: every run
+inserted or re-checked every event. The library database now keeps a
+calendar_sync table that maps each loan (checkout_key: account + title +
+checkout date) to its calendar event id and a hash of the payload last
+pushed. Each sync compares the wanted events with that table and sends only:
+
+    insert   loans without an event yet
+    update   loans whose payload changed (e.g. a renewed due date)
+    delete   events of books that were returned
+
+A sync with nothing to change makes no API calls at all, and does not even
+authenticate. On an account's first delta sync, events that an older script
+already created are adopted (matched with calendar_index) instead of
+duplicated.
+
+Usage:
+    python scrapeki/calendar_delta_sync.py --account 22234325
+    python scrapeki/calendar_delta_sync.py --dry-run
+    python scrapeki/calendar_delta_sync.py --reconcile
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from googleapiclient.errors import HttpError
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from calendar_batch import execute_in_batches
+from calendar_client import get_account_service
+from calendar_index import build_event_index, update_request, upsert_request
+from library_store import LibraryStore
+
+# Login credentials for DTU Library
+USERNAME = "22234325"
+
+GONE_STATUSES = (404, 410)
+
+def payload_hash(event):
+    """Return a stable hash of an event payload"""
+    canonical = json.dumps(event, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+def _status(error):
+    return getattr(getattr(error, "resp", None), "status", None)
+
+def plan_sync(wanted, state):
+    """Compare wanted {checkout_key: event} with sync state and return the needed operations"""
+    plan = {"creates": [], "updates": [], "deletes": [], "unchanged": 0}
+    for key, event in wanted.items():
+        synced = state.get(key)
+        if synced is None:
+            plan["creates"].append((key, event))
+        elif synced["payload_hash"] != payload_hash(event):
+            plan["updates"].append((key, synced["event_id"], event))
+        else:
+            plan["unchanged"] += 1
+    for key, synced in state.items():
+        if key not in wanted:
+            plan["deletes"].append((key, synced["event_id"], synced["summary"]))
+    return plan
+
+def plan_is_empty(plan):
+    return not (plan["creates"] or plan["updates"] or plan["deletes"])
+
+class DeltaSync:
+    """Pushes only the calendar changes needed to match the library database"""
+
+    def __init__(self, store, calendar_id='primary', use_batch=True, adopt_existing=True, executor=None, verbose=True):
+        self.store = store
+        self.verbose = verbose
+        self.calendar_id = calendar_id
+        self.use_batch = use_batch
+        self.adopt_existing = adopt_existing
+        # Optional object with the same execute() contract, e.g. calendar_sync_executor.RetryingExecutor
+        self.executor = executor
+
+    def _report(self, line):
+        if self.verbose:
+            print(line)
+
+    def plan(self, username):
+        """Return the operations needed to bring username's calendar up to date"""
+        state = self.store.load_sync_state(username, self.calendar_id)
+        plan = plan_sync(self.store.load_events_by_key(username), state)
+        plan["first_sync"] = not state
+        return plan
+
+    def _execute(self, service, operations, callback):
+        """Send (request_id, HttpRequest) pairs batched or one by one; return the number of round trips"""
+        if self.executor is not None:
+            return self.executor.execute(service, operations, callback)
+        if self.use_batch:
+            return execute_in_batches(service, operations, callback)
+        for request_id, request in operations:
+            try:
+                response = request.execute()
+            except HttpError as error:
+                callback(request_id, None, error)
+            else:
+                callback(request_id, response, None)
+        return len(operations)
+
+    def _adopt(self, service, plan, stats):
+        """Turn creates into updates for events an older script already put on the calendar"""
+        index = build_event_index(service, [event for _, event in plan["creates"]], self.calendar_id)
+        stats["api_calls"] += index.list_calls
+        stats["round_trips"] += index.list_calls
+        creates = []
+        for key, event in plan["creates"]:
+            exists, event_id = index.find(event)
+            if exists:
+                plan["updates"].append((key, event_id, event))
+            else:
+                creates.append((key, event))
+        plan["creates"] = creates
+
+    def apply(self, service, username, plan):
+        """Send the planned inserts, updates and deletes and record the results; return stats"""
+        stats = {"created": 0, "updated": 0, "deleted": 0, "unchanged": plan["unchanged"],
+                 "failed": 0, "api_calls": 0, "round_trips": 0}
+        if plan_is_empty(plan):
+            return stats
+        if self.adopt_existing and plan.get("first_sync") and plan["creates"]:
+            try:
+                self._adopt(service, plan, stats)
+            except HttpError as error:
+                print(f"  Warning: Could not list existing events, creating all: {error}")
+
+        events = service.events()
+        operations = {}
+        for key, event in plan["creates"]:
+            operations[f"c-{key}"] = ("create", key, event, None,
+                                     upsert_request(service, event, self.calendar_id))
+        for key, event_id, event in plan["updates"]:
+            operations[f"u-{key}"] = ("update", key, event, event_id,
+                                     update_request(service, event_id, event, self.calendar_id))
+        for key, event_id, summary in plan["deletes"]:
+            operations[f"d-{key}"] = ("delete", key, {"summary": summary}, event_id,
+                                     events.delete(calendarId=self.calendar_id, eventId=event_id))
+
+        recreate = []
+
+        def on_done(request_id, response, exception):
+            kind, key, event, event_id = operations[request_id][:4]
+            summary = event.get("summary") or "Unknown"
+            if exception is not None:
+                gone = _status(exception) in GONE_STATUSES
+                if kind == "delete" and gone:
+                    # Already removed by the user; nothing left to delete
+                    self.store.forget_sync_state(self.calendar_id, key)
+                    self._report(f"✓ Removed (returned): {summary}")
+                    stats["deleted"] += 1
+                elif kind == "update" and gone:
+                    # The user deleted the reminder; put it back
+                    recreate.append((key, event))
+                else:
+                    self._report(f"✗ Failed to {kind}: {summary}\n  Error: {exception}")
+                    stats["failed"] += 1
+                return
+            if kind == "delete":
+                self.store.forget_sync_state(self.calendar_id, key)
+                self._report(f"✓ Removed (returned): {summary}")
+                stats["deleted"] += 1
+            else:
+                self.store.save_sync_state(username, self.calendar_id, key, response.get("id") or event_id,
+                                           payload_hash(event), event.get("summary"))
+                self._report(f"{'✓ Added' if kind == 'create' else '↻ Updated'}: {summary}")
+                stats["created" if kind == "create" else "updated"] += 1
+
+        stats["api_calls"] += len(operations)
+        stats["round_trips"] += self._execute(
+            service, [(request_id, operation[4]) for request_id, operation in operations.items()], on_done
+        )
+
+        if recreate:
+            operations.clear()
+            for key, event in recreate:
+                operations[f"c-{key}"] = ("create", key, event, None,
+                                         upsert_request(service, event, self.calendar_id))
+            stats["api_calls"] += len(operations)
+            stats["round_trips"] += self._execute(
+                service, [(request_id, operation[4]) for request_id, operation in operations.items()], on_done
+            )
+        return stats
+
+    def sync(self, service, username):
+        """Plan and apply one account's delta sync; return stats"""
+        return self.apply(service, username, self.plan(username))
+
+def print_stats(stats):
+    print("=" * 60)
+    print("SUMMARY")
+    print("=" * 60)
+    print(f"✓ Added: {stats['created']}")
+    print(f"↻ Updated: {stats['updated']}")
+    print(f"✓ Removed (returned): {stats['deleted']}")
+    print(f"= Unchanged: {stats['unchanged']}")
+    print(f"✗ Failed: {stats['failed']}")
+    print(f"Calendar API calls: {stats['api_calls']} in {stats['round_trips']} requests")
+    print("=" * 60)
+
+def sync_account(username, calendar_id='primary', use_batch=True, dry_run=False, reconcile=False):
+    """Delta-sync one account from the library database, authenticating only if there is work
+
+    With reconcile=True, calendar-side edits and deletions are picked up first
+    (calendar_reconcile), so they are repaired in the same run.
+    """
+    store = LibraryStore()
+    try:
+        if not store.has_account(username):
+            print(f"✗ No checkouts stored for {username} - run a scraper first")
+            return None
+        service = None
+        if reconcile:
+            # Imported here because calendar_reconcile uses payload_hash from this module
+            from calendar_reconcile import Reconciler, print_stats as print_reconcile_stats
+            service = get_account_service(username)
+            if not service:
+                print("\n✗ Failed to authenticate with Google Calendar")
+                return None
+            print_reconcile_stats(Reconciler(store, calendar_id).reconcile(service, username))
+        delta = DeltaSync(store, calendar_id, use_batch=use_batch)
+        plan = delta.plan(username)
+        print(f"Planned: {len(plan['creates'])} inserts, {len(plan['updates'])} updates, "
+              f"{len(plan['deletes'])} deletes, {plan['unchanged']} unchanged")
+        if plan_is_empty(plan):
+            print("✓ Calendar is up to date - no API calls needed")
+            return delta.apply(None, username, plan)
+        if dry_run:
+            for _, event in plan["creates"]:
+                print(f"  + {event.get('summary')}")
+            for _, _, event in plan["updates"]:
+                print(f"  ↻ {event.get('summary')}")
+            for _, _, summary in plan["deletes"]:
+                print(f"  - {summary}")
+            return None
+
+        service = service or get_account_service(username)
+        if not service:
+            print("\n✗ Failed to authenticate with Google Calendar")
+            return None
+        stats = delta.apply(service, username, plan)
+        print_stats(stats)
+        return stats
+    finally:
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync library reminders to Google Calendar, sending only changes")
+    parser.add_argument("--account", default=USERNAME, help="library account to sync")
+    parser.add_argument("--calendar", default="primary", help="Google Calendar id")
+    parser.add_argument("--no-batch", action="store_true", help="send one request per change instead of batches")
+    parser.add_argument("--dry-run", action="store_true", help="only print the planned changes")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="first pick up reminders the user edited or deleted on the calendar")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DTU Library Calendar Delta Sync")
+    print("=" * 60)
+    sync_account(args.account, args.calendar, use_batch=not args.no_batch, dry_run=args.dry_run,
+                 reconcile=args.reconcile)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+In-memory index of the events already on a Google Calendar.
+
+check_event_exists() lists a two-day window around every event, so N books
+cost N events().list calls, plus a linear scan of each result. The index
+lists the whole span from the earliest to the latest due date once (paging
+with pageToken) and answers every existence check with a dict lookup:
+
+- by the private extended property checkoutKey, when the event carries one
+- otherwise by (summary, start date), accepting the neighbouring dates so the
+  old "within 24 hours" rule still holds
+
+For N books, duplicate checking takes one or two list calls instead of N.
+
+Events built with checkout_parser.add_event_identity() carry a deterministic
+iCalUID, so they need no lookup at all: events().import_ (upsert_request)
+creates or updates them in one call.
+"""
+
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 2500    # maximum maxResults allowed by events().list
+
+def parse_start(event):
+    """Return the start datetime of an event payload, or None"""
+    start = event.get('start', {}).get('dateTime')
+    if not start:
+        return None
+    try:
+        return datetime.fromisoformat(start.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+def private_key(event):
+    """Return the checkoutKey private extended property of an event, or None"""
+    return event.get('extendedProperties', {}).get('private', {}).get('checkoutKey')
+
+def _naive(dt):
+    """Drop the UTC offset so times from Google and from our payloads compare (both local time)"""
+    return dt.replace(tzinfo=None)
+
+class CalendarEventIndex:
+    """Existing calendar events keyed by checkoutKey and by (summary, date)"""
+
+    def __init__(self):
+        self.by_key = {}
+        self.by_summary = {}
+        self.list_calls = 0
+
+    def add(self, event, event_id=None):
+        """Index one event (from events().list, or one we just created)"""
+        event_id = event_id or event.get('id')
+        key = private_key(event)
+        if key:
+            self.by_key[key] = event_id
+        start = parse_start(event)
+        if event.get('summary') and start is not None:
+            self.by_summary.setdefault((event['summary'], start.date()), []).append((_naive(start), event_id))
+
+    def find(self, event):
+        """Return (True, event_id) if a matching event exists, else (False, None)"""
+        key = private_key(event)
+        if key and key in self.by_key:
+            return True, self.by_key[key]
+        start = parse_start(event)
+        if start is None:
+            return False, None
+        start = _naive(start)
+        for day in (start.date(), start.date() - timedelta(days=1), start.date() + timedelta(days=1)):
+            for other_start, event_id in self.by_summary.get((event.get('summary'), day), ()):
+                if abs((other_start - start).total_seconds()) < 86400:  # Within 24 hours
+                    return True, event_id
+        return False, None
+
+    def load(self, service, events, calendar_id='primary'):
+        """List every calendar event between the earliest and latest start of events, once"""
+        starts = [_naive(start) for start in map(parse_start, events) if start is not None]
+        if not starts:
+            return self
+        time_min = (min(starts) - timedelta(days=1)).isoformat() + 'Z'
+        time_max = (max(starts) + timedelta(days=1)).isoformat() + 'Z'
+        page_token = None
+        while True:
+            result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                maxResults=PAGE_SIZE,
+                singleEvents=True,
+                pageToken=page_token
+            ).execute()
+            self.list_calls += 1
+            for event in result.get('items', []):
+                self.add(event)
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return self
+
+def upsert_request(service, event, calendar_id='primary'):
+    """Return an idempotent events().import_ request for events with an iCalUID, else an insert
+
+    import_ creates the event or updates the one with the same iCalUID, so a
+    retried or concurrent sync can never create a duplicate.
+    """
+    if event.get('iCalUID'):
+        return service.events().import_(calendarId=calendar_id, body=event)
+    return service.events().insert(calendarId=calendar_id, body=event)
+
+def update_request(service, event_id, event, calendar_id='primary'):
+    """Return an events().update request; an existing event's iCalUID cannot change, so it is left out"""
+    body = {name: value for name, value in event.items() if name != 'iCalUID'}
+    return service.events().update(calendarId=calendar_id, eventId=event_id, body=body)
+
+def build_event_index(service, events, calendar_id='primary'):
+    """Return a CalendarEventIndex of the calendar events spanning the given payloads"""
+    return CalendarEventIndex().load(service, events, calendar_id)
@@ -0,0 +1,217 @@
+"""
+Incremental reconciliation of our calendar reminders with syncToken.
+
+Delta sync only knows what it pushed. If a user deletes or edits one of our
+reminders, it would only notice when it next updated that event, and finding
+out any earlier meant listing the whole calendar window again. Reconciliation
+uses Calendar's incremental sync instead:
+
+- the first run lists the calendar once and stores the nextSyncToken for the
+  account (library_store calendar_sync_tokens)
+- later runs call events().list(syncToken=...), which returns only the events
+  changed since the last run. When nothing changed, that is one small request
+- a 410 Gone (expired token) clears the token and falls back to a full list
+
+Changed events update the calendar_sync mapping between loans and event ids:
+
+    deleted by the user   mapping forgotten, so the next delta sync recreates it
+    edited by the user    mapping marked as drifted, so the next delta sync restores it
+    ours but unmapped     adopted (e.g. created by another machine), or queued
+                          for deletion if the book was returned
+
+Usage:
+    python scrapeki/calendar_reconcile.py --account 22234325
+    python scrapeki/calendar_reconcile.py --account 22234325 --sync
+    python scrapeki/calendar_delta_sync.py --reconcile
+"""
+
+import argparse
+import os
+import sys
+from googleapiclient.errors import HttpError
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from calendar_client import get_account_service
+from calendar_delta_sync import payload_hash, sync_account
+from calendar_index import PAGE_SIZE, _naive, parse_start, private_key
+from library_store import LibraryStore
+
+# Login credentials for DTU Library
+USERNAME = "22234325"
+
+# payload_hash of a mapping whose event the user changed; never matches, so delta sync updates it
+DRIFTED = "drifted"
+
+def _status(error):
+    return getattr(getattr(error, "resp", None), "status", None)
+
+def _reminders(event):
+    reminders = event.get("reminders") or {}
+    overrides = sorted((o.get("method"), o.get("minutes")) for o in reminders.get("overrides", []))
+    return bool(reminders.get("useDefault")), overrides
+
+def _end(event):
+    return parse_start({"start": event.get("end") or {}})
+
+def event_drifted(item, wanted):
+    """Return True if a calendar event no longer matches the payload we pushed"""
+    if item.get("summary") != wanted.get("summary"):
+        return True
+    if (item.get("description") or "").strip() != (wanted.get("description") or "").strip():
+        return True
+    for get_time in (parse_start, _end):
+        ours, theirs = get_time(wanted), get_time(item)
+        if ours is None or theirs is None or _naive(ours) != _naive(theirs):
+            return True
+    return _reminders(item) != _reminders(wanted)
+
+class Reconciler:
+    """Applies calendar-side changes to one account's calendar_sync mapping"""
+
+    def __init__(self, store, calendar_id='primary', verbose=True):
+        self.store = store
+        self.calendar_id = calendar_id
+        self.verbose = verbose
+
+    def _report(self, line):
+        if self.verbose:
+            print(line)
+
+    def _list(self, service, sync_token, stats):
+        """Return (events, nextSyncToken) of one full or incremental listing"""
+        items = []
+        page_token = None
+        while True:
+            params = {"calendarId": self.calendar_id, "maxResults": PAGE_SIZE, "pageToken": page_token}
+            if sync_token:
+                params["syncToken"] = sync_token
+            result = service.events().list(**params).execute()
+            stats["api_calls"] += 1
+            items.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return items, result.get("nextSyncToken")
+
+    def _apply(self, username, items, full, stats):
+        """Update the mapping from listed events; a full listing also reveals deletions by absence"""
+        state = self.store.load_sync_state(username, self.calendar_id)
+        wanted = self.store.load_events_by_key(username)
+        key_by_event_id = {row["event_id"]: key for key, row in state.items()}
+        seen = set()
+
+        if not full:
+            stats["changed"] = len(items)
+        for item in items:
+            event_id = item.get("id")
+            seen.add(event_id)
+            key = key_by_event_id.get(event_id)
+            if item.get("status") == "cancelled":
+                if key is not None:
+                    self.store.forget_sync_state(self.calendar_id, key)
+                    self._report(f"✗ Deleted on the calendar: {state[key]['summary'] or key}")
+                    stats["deleted"] += 1
+                continue
+
+            if key is None:
+                key = private_key(item)
+                properties = item.get("extendedProperties", {}).get("private", {})
+                if not key or properties.get("account") != str(username) or key in state:
+                    continue
+                # One of ours the mapping does not know about
+                if key in wanted:
+                    current = not event_drifted(item, wanted[key])
+                    self.store.save_sync_state(username, self.calendar_id, key, event_id,
+                                               payload_hash(wanted[key]) if current else DRIFTED,
+                                               item.get("summary"))
+                    self._report(f"= Adopted: {item.get('summary')}")
+                    stats["adopted"] += 1
+                else:
+                    # The book was returned; delta sync will delete the event
+                    self.store.save_sync_state(username, self.calendar_id, key, event_id, DRIFTED,
+                                               item.get("summary"))
+                    self._report(f"= Adopted for removal (returned): {item.get('summary')}")
+                    stats["adopted"] += 1
+                continue
+
+            # Only events we believe are up to date can tell us about user edits
+            if key in wanted and state[key]["payload_hash"] == payload_hash(wanted[key]) \
+                    and event_drifted(item, wanted[key]):
+                self.store.save_sync_state(username, self.calendar_id, key, event_id, DRIFTED,
+                                           state[key]["summary"])
+                self._report(f"↻ Edited on the calendar: {item.get('summary')}")
+                stats["edited"] += 1
+
+        if full:
+            for key, row in state.items():
+                if row["event_id"] not in seen:
+                    self.store.forget_sync_state(self.calendar_id, key)
+                    self._report(f"✗ Deleted on the calendar: {row['summary'] or key}")
+                    stats["deleted"] += 1
+
+    def reconcile(self, service, username):
+        """Fetch the calendar changes since the last run and update the mapping; return stats"""
+        stats = {"changed": 0, "deleted": 0, "edited": 0, "adopted": 0, "api_calls": 0, "full_resync": False}
+        sync_token = self.store.load_sync_token(username, self.calendar_id)
+        try:
+            items, next_sync_token = self._list(service, sync_token, stats)
+        except HttpError as error:
+            if sync_token is None or _status(error) != 410:
+                raise
+            stats["api_calls"] += 1
+            # The token expired or was invalidated: start over with a full listing
+            self._report("⊘ Sync token expired - listing the whole calendar again")
+            self.store.save_sync_token(username, self.calendar_id, None)
+            sync_token = None
+            items, next_sync_token = self._list(service, sync_token, stats)
+
+        stats["full_resync"] = sync_token is None
+        self._apply(username, items, stats["full_resync"], stats)
+        self.store.save_sync_token(username, self.calendar_id, next_sync_token)
+        return stats
+
+def print_stats(stats):
+    print("=" * 60)
+    print("RECONCILIATION")
+    print("=" * 60)
+    if stats["full_resync"]:
+        print("Full listing (no valid sync token)")
+    else:
+        print(f"Changed events since last run: {stats['changed']}")
+    print(f"✗ Deleted on the calendar: {stats['deleted']}")
+    print(f"↻ Edited on the calendar: {stats['edited']}")
+    print(f"= Adopted: {stats['adopted']}")
+    print(f"Calendar API calls: {stats['api_calls']}")
+    print("=" * 60)
+
+def reconcile_account(username, calendar_id='primary', service=None):
+    """Reconcile one account's mapping with its calendar; return stats"""
+    service = service or get_account_service(username)
+    if not service:
+        print("\n✗ Failed to authenticate with Google Calendar")
+        return None
+    store = LibraryStore()
+    try:
+        stats = Reconciler(store, calendar_id).reconcile(service, username)
+        print_stats(stats)
+        return stats
+    finally:
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick up calendar-side edits and deletions of our reminders")
+    parser.add_argument("--account", default=USERNAME, help="library account to reconcile")
+    parser.add_argument("--calendar", default="primary", help="Google Calendar id")
+    parser.add_argument("--sync", action="store_true", help="run a delta sync afterwards to repair drift")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DTU Library Calendar Reconciliation")
+    print("=" * 60)
+    if args.sync:
+        sync_account(args.account, args.calendar, reconcile=True)
+    else:
+        reconcile_account(args.account, args.calendar)
+
+if __name__ == '__main__':
+    main()
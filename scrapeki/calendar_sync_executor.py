@@ -0,0 +1,237 @@
+"""
+Concurrent, quota-aware calendar sync for many library accounts.
+
+Calendar sync used to run one account at a time, and a quota error simply
+counted as a failed event. The executor syncs accounts on a bounded thread
+pool. Each account runs calendar_delta_sync.DeltaSync, so only changed
+reminders cost API calls. In addition:
+
+- every Calendar API call takes a token from one shared TokenBucket sized
+  to the project's quota, including each call inside a batch
+- 403 rateLimitExceeded/userRateLimitExceeded, 429 and 5xx responses are
+  retried with jittered exponential backoff, both for whole batches and for
+  single calls inside a batch
+- the run ends with a report of accounts/s, calls/s, retries and failures
+
+Each account uses its own OAuth token, stored in scrapeki/tokens/<account>.json.
+
+Usage:
+    python scrapeki/calendar_sync_executor.py --workers 8 --rate 10
+    python scrapeki/calendar_sync_executor.py --account 22234325 --account 22234326
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from googleapiclient.errors import HttpError
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from calendar_batch import BATCH_LIMIT, chunked, execute_in_batches
+from calendar_client import TOKENS_DIR, get_service
+from calendar_delta_sync import DeltaSync, plan_is_empty
+from library_store import LibraryStore
+from opac_governor import backoff_delay
+from rate_limit import TokenBucket
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = float(os.environ.get("CALENDAR_RATE", "10"))    # Calendar API calls per second, all accounts
+MAX_RETRIES = 5
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+def error_reasons(error):
+    """Return the 'reason' values of a Google API HttpError"""
+    try:
+        content = json.loads(error.content.decode("utf-8") if isinstance(error.content, bytes) else error.content)
+        return {item.get("reason") for item in content.get("error", {}).get("errors", [])}
+    except (AttributeError, TypeError, ValueError):
+        return set()
+
+def is_retryable(error):
+    """Return True for quota errors and transient server errors"""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status in RETRY_STATUSES:
+        return True
+    return status == 403 and bool(error_reasons(error) & RATE_LIMIT_REASONS)
+
+class SyncStats:
+    """Counters shared by all worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"api_calls": 0, "round_trips": 0, "retries": 0, "throttled_seconds": 0.0}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+class RetryingExecutor:
+    """Sends calendar requests through a shared token bucket, retrying quota and server errors"""
+
+    def __init__(self, bucket, stats, use_batch=True, max_retries=MAX_RETRIES):
+        self.bucket = bucket
+        self.stats = stats
+        self.use_batch = use_batch
+        self.max_retries = max_retries
+
+    def _take(self, tokens):
+        start = time.monotonic()
+        self.bucket.acquire(tokens)
+        self.stats.add("throttled_seconds", time.monotonic() - start)
+
+    def execute(self, service, operations, callback):
+        """Same contract as DeltaSync._execute; returns the number of round trips"""
+        requests = dict(operations)
+        pending = list(requests)
+        round_trips = 0
+        attempt = 0
+        while pending:
+            retry = []
+
+            def on_result(request_id, response, exception):
+                if exception is not None and attempt < self.max_retries and is_retryable(exception):
+                    retry.append(request_id)
+                else:
+                    callback(request_id, response, exception)
+
+            if self.use_batch:
+                for chunk in chunked(pending, BATCH_LIMIT):
+                    # Quota is counted per call, not per batch
+                    self._take(len(chunk))
+                    round_trips += execute_in_batches(
+                        service, [(request_id, requests[request_id]) for request_id in chunk], on_result
+                    )
+            else:
+                for request_id in pending:
+                    self._take(1)
+                    round_trips += 1
+                    try:
+                        response = requests[request_id].execute()
+                    except HttpError as error:
+                        on_result(request_id, None, error)
+                    else:
+                        on_result(request_id, response, None)
+            self.stats.add("api_calls", len(pending))
+
+            if retry:
+                self.stats.add("retries", len(retry))
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+            pending = retry
+        self.stats.add("round_trips", round_trips)
+        return round_trips
+
+def load_account_service(account):
+    """Return a Calendar service from scrapeki/tokens/<account>.json, or None (never opens a browser)"""
+    return get_service(account, interactive=False)
+
+class CalendarSyncExecutor:
+    """Delta-syncs many accounts concurrently under one Calendar API quota"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, use_batch=True,
+                 service_factory=load_account_service, calendar_id='primary'):
+        self.workers = workers
+        # A full batch must fit in the bucket
+        self.bucket = TokenBucket(rate, capacity=max(rate, BATCH_LIMIT if use_batch else 1))
+        self.stats = SyncStats()
+        self.use_batch = use_batch
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+
+    def sync_account(self, account):
+        """Sync one account on the calling thread and return its result dict"""
+        start = time.perf_counter()
+        result = {"account": account, "status": "ok"}
+        # SQLite connections and Google API clients must not be shared across threads
+        store = LibraryStore()
+        try:
+            delta = DeltaSync(store, self.calendar_id,
+                              executor=RetryingExecutor(self.bucket, self.stats, self.use_batch), verbose=False)
+            plan = delta.plan(account)
+            if plan_is_empty(plan):
+                result["status"] = "unchanged"
+                result["stats"] = delta.apply(None, account, plan)
+                return result
+            service = self.service_factory(account)
+            if service is None:
+                result["status"] = "skipped"
+                result["error"] = f"no Google token in {TOKENS_DIR}"
+                return result
+            result["stats"] = delta.apply(service, account, plan)
+            if result["stats"]["failed"]:
+                result["status"] = "partial"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e) or e.__class__.__name__
+        finally:
+            store.close()
+            result["elapsed"] = time.perf_counter() - start
+        return result
+
+    def run(self, accounts):
+        """Sync all accounts, yielding one result per account as each finishes"""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.sync_account, account) for account in accounts]
+            for future in as_completed(futures):
+                yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta-sync calendar reminders for many accounts concurrently")
+    parser.add_argument("--account", action="append", help="account to sync (repeatable; default: all in the database)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="accounts synced at the same time")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Calendar API calls per second, in total")
+    parser.add_argument("--no-batch", action="store_true", help="send one request per change instead of batches")
+    args = parser.parse_args()
+
+    accounts = args.account
+    if not accounts:
+        store = LibraryStore()
+        accounts = store.accounts()
+        store.close()
+
+    print("=" * 60)
+    print("DTU Library Calendar Sync (all accounts)")
+    print("=" * 60)
+    print(f"{len(accounts)} accounts, {args.workers} workers, {args.rate:g} API calls/s")
+
+    executor = CalendarSyncExecutor(args.workers, args.rate, use_batch=not args.no_batch)
+    start = time.perf_counter()
+    totals = {"ok": 0, "unchanged": 0, "partial": 0, "skipped": 0, "error": 0}
+    changes = 0
+    for i, result in enumerate(executor.run(accounts), 1):
+        totals[result["status"]] += 1
+        stats = result.get("stats") or {}
+        changed = stats.get("created", 0) + stats.get("updated", 0) + stats.get("deleted", 0)
+        changes += changed
+        prefix = f"[{i}/{len(accounts)}] {result['account']}"
+        if result["status"] == "unchanged":
+            print(f"= {prefix}: up to date")
+        elif result["status"] in ("skipped", "error"):
+            marker = "⊘" if result["status"] == "skipped" else "✗"
+            print(f"{marker} {prefix}: {result['error']}")
+        else:
+            marker = "✓" if result["status"] == "ok" else "✗"
+            print(f"{marker} {prefix}: {changed} changes, {stats.get('failed', 0)} failed ({result['elapsed']:.2f}s)")
+
+    elapsed = time.perf_counter() - start
+    counts = executor.stats.counts
+    print("\n" + "=" * 60)
+    print("Summary")
+    print("=" * 60)
+    print(f"Accounts synced: {totals['ok']}  unchanged: {totals['unchanged']}  "
+          f"with failures: {totals['partial']}  skipped: {totals['skipped']}  errors: {totals['error']}")
+    print(f"Reminder changes: {changes}")
+    print(f"Calendar API calls: {counts['api_calls']} in {counts['round_trips']} requests, "
+          f"{counts['retries']} retried")
+    print(f"Wall time: {elapsed:.2f}s ({len(accounts) / elapsed if elapsed else 0:.1f} accounts/s, "
+          f"{counts['api_calls'] / elapsed if elapsed else 0:.1f} calls/s, "
+          f"{counts['throttled_seconds']:.1f}s waiting for quota)")
+
+if __name__ == '__main__':
+    main()
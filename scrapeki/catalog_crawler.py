@@ -0,0 +1,354 @@
+"""
+Catalog crawler that keeps a local availability index of the DTU Library OPAC.
+
+Walks the Koha opac-search.pl result pages and fetches opac-detail.pl for
+each record on a small thread pool, with a global rate limit so the shared
+OPAC is never flooded. The #holdingst table of every record gives its
+items with status, call number and location. Everything is stored in
+scrapeki/catalog_index.json.
+
+Later crawls only refresh records whose availability summary on the
+results page changed, that have no items yet, or that are older than
+--max-age. Refreshes send the stored ETag, so an unchanged record costs a
+304. Searches are answered from the local index in milliseconds:
+
+    python scrapeki/catalog_crawler.py crawl --query "operating system" --query networks
+    python scrapeki/catalog_crawler.py search "operating system concepts"
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from urllib.parse import urljoin
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import BIBLIONUMBER_RE, make_soup
+from opac_http import OPAC_BASE_URL, new_session, opac_request
+from rate_limit import TokenBucket
+
+OPAC_SEARCH_URL = f"{OPAC_BASE_URL}/opac-search.pl"
+OPAC_DETAIL_URL = f"{OPAC_BASE_URL}/opac-detail.pl"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_FILE = os.path.join(SCRIPT_DIR, "catalog_index.json")
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 5.0              # OPAC requests per second, across all workers
+DEFAULT_MAX_AGE_HOURS = 24
+
+WORD_RE = re.compile(r"\w+")
+
+def _text(elem):
+    """Return the visible text of an element without Koha's hidden .tdlabel spans"""
+    if elem is None:
+        return ""
+    for label in elem.select(".tdlabel"):
+        label.decompose()
+    return " ".join(elem.get_text(" ", strip=True).split())
+
+def item_availability(status_text, status_classes=()):
+    """Map a Koha item status to 'available', 'issued', 'reserved' or 'unavailable'"""
+    text = status_text.casefold()
+    classes = " ".join(status_classes).casefold()
+    if "checkedout" in classes or "checked out" in text or text.startswith("due"):
+        return "issued"
+    if "hold" in text or "waiting" in text or "reserved" in classes:
+        return "reserved"
+    if "available" in classes.split() or (text.startswith("available") and "not" not in text):
+        return "available"
+    return "unavailable"
+
+def parse_search_page(html, page_url=OPAC_SEARCH_URL):
+    """Return (results, next_url) for one opac-search.pl results page"""
+    soup = make_soup(html)
+    results = []
+    seen = set()
+    for link in soup.select(".searchresults a.title[href*='biblionumber='], td.bibliocol a[href*='biblionumber=']"):
+        match = BIBLIONUMBER_RE.search(link.get("href", ""))
+        if not match or match.group(1) in seen:
+            continue
+        seen.add(match.group(1))
+        cell = link.find_parent("td") or link.parent
+        author = _text(cell.select_one(".author"))
+        results.append({
+            "biblionumber": match.group(1),
+            "title": _text(link),
+            "author": re.sub(r"^by\s+", "", author) or "N/A",
+            "summary": _text(cell.select_one(".availability"))
+        })
+
+    next_link = soup.select_one("a[rel='next'], nav.pagination a[aria-label*='next' i]")
+    if next_link is None:
+        next_link = next((a for a in soup.select("nav.pagination a, .pagination a") if "next" in a.get_text().casefold()), None)
+    next_url = urljoin(page_url, next_link["href"]) if next_link is not None and next_link.get("href") else None
+    return results, next_url
+
+def parse_holdings(html):
+    """Return the items of an opac-detail.pl page's #holdingst table"""
+    soup = make_soup(html)
+    table = soup.find(id="holdingst")
+    if table is None:
+        return []
+    items = []
+    for tr in table.select("tbody tr"):
+        status_elem = tr.select_one("td.status")
+        status_span = status_elem.select_one(".item-status") if status_elem else None
+        status_text = _text(status_elem)
+        items.append({
+            "location": _text(tr.select_one("td.location, td.homebranch")) or None,
+            "call_number": _text(tr.select_one("td.call_no")) or None,
+            "status": status_text or None,
+            "availability": item_availability(status_text, status_span.get("class", []) if status_span else ()),
+            "due_date": _text(tr.select_one("td.date_due")) or None,
+            "barcode": _text(tr.select_one("td.barcode")) or None
+        })
+    return items
+
+def summarize_availability(items):
+    """Return the overall availability of a record from its items"""
+    states = {item["availability"] for item in items}
+    for state in ("available", "reserved", "issued"):
+        if state in states:
+            return state
+    return "unavailable"
+
+def fetch_record(session, biblionumber, etag=None):
+    """GET one opac-detail.pl page; return (items, etag), or (None, etag) on 304 Not Modified"""
+    headers = {"If-None-Match": etag} if etag else None
+    response = opac_request(session, "GET", OPAC_DETAIL_URL, params={"biblionumber": biblionumber}, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    return parse_holdings(response.text), response.headers.get("ETag")
+
+class CatalogIndex:
+    """Local biblio -> items index with an in-memory word index for fast searches"""
+
+    def __init__(self, path=DEFAULT_INDEX_FILE):
+        self.path = path
+        self.records = {}
+        self.crawled_at = None
+        self._lock = threading.Lock()
+        self._words = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.records = data.get("records", {})
+                self.crawled_at = data.get("crawled_at")
+            except (ValueError, OSError):
+                self.records = {}
+
+    def save(self):
+        """Write the index atomically"""
+        with self._lock:
+            data = {"crawled_at": self.crawled_at, "records": self.records}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def upsert(self, biblionumber, **fields):
+        """Update one record's fields"""
+        with self._lock:
+            self.records.setdefault(biblionumber, {}).update(fields)
+            self._words = None
+
+    def _word_index(self):
+        with self._lock:
+            if self._words is None:
+                words = {}
+                for biblionumber, record in self.records.items():
+                    text = f"{record.get('title', '')} {record.get('author', '')}".casefold()
+                    for word in WORD_RE.findall(text):
+                        words.setdefault(word, set()).add(biblionumber)
+                self._words = words
+            return self._words
+
+    def search(self, query, limit=20):
+        """Return records matching every word of query; the last word may be a prefix"""
+        terms = WORD_RE.findall(query.casefold())
+        if not terms:
+            return []
+        words = self._word_index()
+        matches = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                # Prefix match on the word being typed
+                found = set().union(*(ids for word, ids in words.items() if word.startswith(term)))
+            else:
+                found = words.get(term, set())
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+
+        results = []
+        for biblionumber in sorted(matches, key=lambda b: self.records[b].get("title", "")):
+            record = self.records[biblionumber]
+            items = record.get("items", [])
+            call_numbers = [item["call_number"] for item in items if item.get("call_number")]
+            results.append({
+                "biblionumber": biblionumber,
+                "title": record.get("title"),
+                "author": record.get("author"),
+                "call_number": call_numbers[0] if call_numbers else None,
+                "availability": summarize_availability(items) if items else "unknown",
+                "available_items": sum(1 for item in items if item["availability"] == "available"),
+                "total_items": len(items),
+                "locations": sorted({item["location"] for item in items if item.get("location")}),
+                "fetched_at": record.get("fetched_at")
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+def search_index(query, path=DEFAULT_INDEX_FILE, limit=20):
+    """Search the local catalog index without touching the OPAC"""
+    return CatalogIndex(path).search(query, limit)
+
+class CatalogCrawler:
+    """Crawls search results and record pages on a rate-limited thread pool"""
+
+    def __init__(self, index, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+        self.index = index
+        self.workers = workers
+        self.bucket = TokenBucket(rate, capacity=max(1, workers))
+        self.max_age = timedelta(hours=max_age_hours)
+        self._local = threading.local()
+        self.stats = {"pages": 0, "fetched": 0, "not_modified": 0, "skipped": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _session(self):
+        # requests.Session is not thread-safe, so each worker keeps its own
+        if not hasattr(self._local, "session"):
+            self._local.session = new_session()
+        return self._local.session
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def search_pages(self, query):
+        """Yield the results of every opac-search.pl page for query"""
+        url, params = OPAC_SEARCH_URL, {"q": query}
+        while url:
+            self.bucket.acquire()
+            response = opac_request(self._session(), "GET", url, params=params)
+            self._count("pages")
+            results, url = parse_search_page(response.text, response.url)
+            params = None
+            yield from results
+
+    def needs_refresh(self, result, now):
+        """Return True if a search result differs from the indexed record or the record is stale"""
+        record = self.index.records.get(result["biblionumber"])
+        if record is None or "items" not in record:
+            return True
+        if record.get("summary") != result["summary"]:
+            return True
+        fetched_at = record.get("fetched_at")
+        return fetched_at is None or now - datetime.fromisoformat(fetched_at) > self.max_age
+
+    def refresh(self, biblionumber, summary=None):
+        """Fetch one record's items and store them with the search summary they belong to"""
+        self.bucket.acquire()
+        etag = self.index.records.get(biblionumber, {}).get("etag")
+        items, etag = fetch_record(self._session(), biblionumber, etag)
+        fields = {"fetched_at": datetime.now().isoformat(), "etag": etag}
+        if summary is not None:
+            fields["summary"] = summary
+        if items is None:
+            self._count("not_modified")
+        else:
+            self._count("fetched")
+            fields["items"] = items
+        self.index.upsert(biblionumber, **fields)
+
+    def crawl(self, queries):
+        """Crawl every query and refresh the records that changed; return the stats"""
+        now = datetime.now()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {}
+                for query in queries:
+                    try:
+                        for result in self.search_pages(query):
+                            biblionumber = result["biblionumber"]
+                            refresh = self.needs_refresh(result, now)
+                            # The summary is stored by refresh(), so a failed refresh is retried next crawl
+                            self.index.upsert(
+                                biblionumber, title=result["title"], author=result["author"],
+                                last_seen=now.isoformat()
+                            )
+                            if biblionumber in futures:
+                                continue
+                            if not refresh:
+                                self._count("skipped")
+                                continue
+                            futures[biblionumber] = executor.submit(self.refresh, biblionumber, result["summary"])
+                    except requests.RequestException as e:
+                        # Keep the pages already seen and go on with the next query
+                        self._count("errors")
+                        print(f"✗ Search '{query}' failed: {e}")
+
+                for future in as_completed(futures.values()):
+                    try:
+                        future.result()
+                    except requests.RequestException as e:
+                        self._count("errors")
+                        print(f"✗ {e}")
+            self.index.crawled_at = now.isoformat()
+        finally:
+            # Save what was crawled so far, even if the crawl stops early
+            self.index.save()
+        return self.stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the DTU Library catalog into a local availability index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE, help="path of the index file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = subparsers.add_parser("crawl", help="crawl search results and refresh changed records")
+    crawl_parser.add_argument("--query", action="append", default=None,
+                              help="search terms to crawl (repeatable, default '*')")
+    crawl_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    crawl_parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="max OPAC requests per second")
+    crawl_parser.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE_HOURS,
+                              help="hours after which an unchanged record is re-checked")
+
+    search_parser = subparsers.add_parser("search", help="search the local index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "search":
+        start = time.perf_counter()
+        results = search_index(args.query, args.index, args.limit)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for result in results:
+            print(f"  [{result['availability']}] {result['title']} - {result['author']}")
+            print(f"      {result['call_number'] or 'N/A'} | {', '.join(result['locations']) or 'N/A'} "
+                  f"| {result['available_items']}/{result['total_items']} available")
+        return
+
+    print("=" * 60)
+    print("DTU Library Catalog Crawler")
+    print("=" * 60)
+    index = CatalogIndex(args.index)
+    crawler = CatalogCrawler(index, args.workers, args.rate, args.max_age)
+    start = time.perf_counter()
+    stats = crawler.crawl(args.query or ["*"])
+    print(f"✓ Crawled {stats['pages']} result pages in {time.perf_counter() - start:.1f}s")
+    print(f"  Records fetched: {stats['fetched']}, not modified: {stats['not_modified']}, "
+          f"unchanged: {stats['skipped']}, errors: {stats['errors']}")
+    print(f"✓ Index: {args.index} ({len(index.records)} records)")
+
+if __name__ == '__main__':
+    main()
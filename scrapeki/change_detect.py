@@ -0,0 +1,157 @@
+"""
+Change detection for DTU Library checkouts.
+
+Most polls find exactly the same loans as last time. This module keeps a
+small per-account state file with a fingerprint of the normalized checkout
+list plus the page's ETag/Last-Modified validators:
+
+- the next poll sends If-None-Match/If-Modified-Since, so an OPAC that
+  supports conditional requests answers with a body-less 304
+- otherwise the fresh page is fingerprinted and compared
+- when nothing changed the run reports 'unchanged' and skips rewriting the
+  output files and re-syncing Google Calendar
+
+State is kept in scrapeki/library_fingerprints.json.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import parse_checkout_page
+from opac_http import fetch_patron_page, new_session
+from snapshot_archive import SNAPSHOTS_ENABLED, save_snapshot
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATE_FILE = os.path.join(SCRIPT_DIR, "library_fingerprints.json")
+
+def _normalize(value):
+    """Collapse whitespace and case so cosmetic page changes do not count as changes"""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: _normalize(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [_normalize(val) for val in value]
+    return value
+
+def fingerprint_records(records):
+    """Return an order-independent SHA-256 fingerprint of a list of dicts"""
+    canonical = sorted(
+        json.dumps(_normalize(record), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        for record in records
+    )
+    return hashlib.sha256("\n".join(canonical).encode("utf-8")).hexdigest()
+
+class ChangeTracker:
+    """Per-account fingerprints and HTTP validators, persisted as JSON"""
+
+    def __init__(self, path=DEFAULT_STATE_FILE, autosave=True):
+        self.path = path
+        self.autosave = autosave
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (ValueError, OSError):
+                self.state = {}
+
+    def _account(self, username):
+        return self.state.setdefault(username, {})
+
+    def save(self):
+        """Write the state file atomically"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def conditional_headers(self, username):
+        """Return If-None-Match/If-Modified-Since headers for the account's last response"""
+        account = self.state.get(username, {})
+        headers = {}
+        if account.get("etag"):
+            headers["If-None-Match"] = account["etag"]
+        if account.get("last_modified"):
+            headers["If-Modified-Since"] = account["last_modified"]
+        return headers
+
+    def is_changed(self, username, fingerprint):
+        """Return True if fingerprint differs from the account's stored one, without storing it"""
+        return self.state.get(username, {}).get("fingerprint") != fingerprint
+
+    def update(self, username, fingerprint):
+        """Store the latest fingerprint and return True if it differs from the previous one"""
+        account = self._account(username)
+        now = datetime.now().isoformat()
+        changed = account.get("fingerprint") != fingerprint
+        account["checked_at"] = now
+        if changed:
+            account["fingerprint"] = fingerprint
+            account["changed_at"] = now
+        if self.autosave:
+            self.save()
+        return changed
+
+    def confirm(self, result):
+        """Store the validators and fingerprint of a scrape_if_changed result once its output is written"""
+        if result.get("fingerprint") is None:
+            return
+        account = self._account(result["username"])
+        account["etag"], account["last_modified"] = result["validators"]
+        self.update(result["username"], result["fingerprint"])
+
+    def touch(self, username):
+        """Record a poll that the OPAC answered with 304 Not Modified"""
+        self._account(username)["checked_at"] = datetime.now().isoformat()
+        if self.autosave:
+            self.save()
+
+    def is_synced(self, username, fingerprint):
+        """Return True if these calendar events were already synced for the account"""
+        return self.state.get(username, {}).get("synced_fingerprint") == fingerprint
+
+    def mark_synced(self, username, fingerprint):
+        """Remember that the calendar matches this fingerprint"""
+        account = self._account(username)
+        account["synced_fingerprint"] = fingerprint
+        account["synced_at"] = datetime.now().isoformat()
+        if self.autosave:
+            self.save()
+
+def scrape_if_changed(username, password, tracker, session=None, session_store=None):
+    """Poll one account and return a result dict whose status is 'changed' or 'unchanged'
+
+    Nothing is stored for a fresh page: call tracker.confirm(result) after
+    writing the output, so a failed write is redone on the next poll instead
+    of being answered with 304 or 'unchanged'.
+    """
+    if session is None:
+        session = new_session()
+    headers = tracker.conditional_headers(username)
+    if session_store is not None:
+        response = session_store.fetch_patron_page(session, username, password, headers=headers)
+    else:
+        response = fetch_patron_page(session, username, password, headers=headers)
+
+    if response.status_code == 304:
+        tracker.touch(username)
+        return {"username": username, "status": "unchanged", "checkout_data": None, "calendar_events": None}
+
+    checkout_data, calendar_events = parse_checkout_page(response.text, username)
+    if SNAPSHOTS_ENABLED:
+        save_snapshot(response.text, username, checkout_data, "http", response.url)
+    fingerprint = fingerprint_records(checkout_data)
+    return {
+        "username": username,
+        "status": "changed" if tracker.is_changed(username, fingerprint) else "unchanged",
+        "checkout_data": checkout_data,
+        "calendar_events": calendar_events,
+        "fingerprint": fingerprint,
+        "validators": (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    }
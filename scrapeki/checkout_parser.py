@@ -0,0 +1,248 @@
+"""
+Offline parser for the DTU Library (Koha OPAC) checkouts page.
+
+Turns the HTML of opac-user.pl into the same checkout_data and
+calendar_events structures that scrp.py builds with Selenium, so every
+scraping engine writes identical output files.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from bs4 import BeautifulSoup
+
+# lxml is several times faster than the built-in parser; use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+TIMEZONE = "Asia/Kolkata"
+
+REMINDER_OVERRIDES = [
+    {"method": "email", "minutes": 4320},   # 3 days before (72 hours)
+    {"method": "popup", "minutes": 4320},   # 3 days before
+    {"method": "email", "minutes": 1440},   # 1 day before (24 hours)
+    {"method": "popup", "minutes": 1440},   # 1 day before
+    {"method": "popup", "minutes": 0}       # On the due date
+]
+
+BIBLIONUMBER_RE = re.compile(r"biblionumber=(\d+)")
+
+# Koha record ids carried from the rows into checkout_data, when the source has them
+ITEM_ID_FIELDS = ("biblionumber", "itemnumber", "barcode")
+
+# Domain part of the iCalUID given to every generated event
+ICAL_UID_DOMAIN = "dtu-library-reminder"
+
+def parse_date(date_str):
+    """Parse date string from format 'DD/MM/YYYY HH:MM' or 'DD/MM/YYYY' and return datetime object"""
+    try:
+        date_str = date_str.strip()
+        if ' ' in date_str:
+            date_part, time_part = date_str.split(' ', 1)
+            day, month, year = map(int, date_part.split('/'))
+            hour, minute = map(int, time_part.split(':'))
+            return datetime(year, month, day, hour, minute)
+        else:
+            day, month, year = map(int, date_str.split('/'))
+            return datetime(year, month, day, 23, 59)  # End of day for due dates
+    except Exception as e:
+        print(f"Error parsing date '{date_str}': {e}")
+        return None
+
+def to_rfc3339(dt):
+    """Convert datetime to RFC3339 format for Google Calendar API"""
+    if dt is None:
+        return None
+    return dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+def make_soup(html):
+    """Parse an HTML document with the fastest available parser"""
+    return BeautifulSoup(html, HTML_PARSER)
+
+def is_logged_in(soup):
+    """Return True if the page belongs to a logged-in patron"""
+    if soup.select_one("input[name='login_password'], form#auth input[type='password']"):
+        return False
+    return soup.select_one("#checkoutst, .loggedinusername, a.logout, #logout") is not None
+
+def _cell_text(cell):
+    """Return the visible text of a table cell, like Selenium's element.text"""
+    return " ".join(cell.get_text(" ", strip=True).split())
+
+def extract_checkout_rows(soup):
+    """Return the raw rows of the #checkoutst table as dicts (title, author, checkout_date, due_date)
+
+    biblionumber and barcode are added when the row shows them.
+    """
+    table = soup.find(id="checkoutst")
+    if table is None:
+        return []
+
+    # Koha repeats the column name in a hidden <span class="tdlabel"> for small screens
+    for label in table.select(".tdlabel"):
+        label.decompose()
+
+    rows = []
+    for tr in table.select("tbody tr"):
+        # DataTables renders a placeholder row when the patron has no loans
+        if tr.select_one("td.dataTables_empty"):
+            continue
+        i = len(rows) + 1
+        title_elem = tr.select_one("span.biblio-title")
+        title = _cell_text(title_elem) if title_elem else f"Book {i}"
+
+        due_date_elem = tr.select_one("td.date_due")
+        if due_date_elem is None:
+            date_cells = tr.select("td[class*='date'], td[data-order]")
+            due_date_elem = date_cells[-1] if date_cells else None
+        due_date_str = _cell_text(due_date_elem) if due_date_elem else None
+
+        checkout_date_elem = tr.select_one("td.checkout_date")
+        checkout_date_str = _cell_text(checkout_date_elem) if checkout_date_elem else None
+
+        author_elem = tr.select_one("td.author")
+        author = _cell_text(author_elem) if author_elem else "N/A"
+
+        row = {
+            "title": title,
+            "author": author or "N/A",
+            "checkout_date": checkout_date_str or None,
+            "due_date": due_date_str or None
+        }
+
+        link = tr.select_one("a[href*='biblionumber=']")
+        if link:
+            match = BIBLIONUMBER_RE.search(link.get("href", ""))
+            if match:
+                row["biblionumber"] = match.group(1)
+
+        # Only shown when the library enables the barcode column
+        barcode_elem = tr.select_one("td.barcode")
+        if barcode_elem and _cell_text(barcode_elem):
+            row["barcode"] = _cell_text(barcode_elem)
+
+        rows.append(row)
+    return rows
+
+def build_calendar_event(title, author, checkout_date_str, due_date_str, due_date_dt):
+    """Build a Google Calendar event for one checkout, in the format scrp.py produces"""
+    return {
+        "summary": f"Library Book Due: {title}",
+        "description": f"Book: {title}\nAuthor: {author}\n" +
+                       (f"Checked out on: {checkout_date_str}\n" if checkout_date_str else "") +
+                       f"Due date: {due_date_str}",
+        "start": {
+            "dateTime": to_rfc3339(due_date_dt),
+            "timeZone": TIMEZONE
+        },
+        "end": {
+            "dateTime": to_rfc3339(due_date_dt + timedelta(hours=1)),
+            "timeZone": TIMEZONE
+        },
+        "reminders": {
+            "useDefault": False,
+            "overrides": [dict(override) for override in REMINDER_OVERRIDES]
+        }
+    }
+
+def checkout_key(username, item):
+    """Return a stable id for one loan: account + title + checkout date
+
+    Only fields every scraping engine and Koha API produces go into the key,
+    so a loan keeps its key (and iCalUID) when the source changes.
+    """
+    title = " ".join((item.get("title") or "").split()).casefold()
+    checkout_date = (item.get("checkout_date") or "").strip()
+    raw = f"{username}|{title}|{checkout_date}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+def add_event_identity(event, username, item):
+    """Give an event a deterministic iCalUID and checkoutKey/account private properties
+
+    Calendar sync code can then upsert with events().import_() and find an
+    event by key, so retries and parallel workers never create duplicates.
+    """
+    key = checkout_key(username, item)
+    event["iCalUID"] = f"{key}@{ICAL_UID_DOMAIN}"
+    event["extendedProperties"] = {"private": {"checkoutKey": key, "account": str(username)}}
+    return event
+
+def build_records(rows, username=None):
+    """Convert raw rows into (checkout_data, calendar_events)
+
+    With username, every event carries the identity from add_event_identity().
+    """
+    checkout_data = []
+    calendar_events = []
+
+    for row in rows:
+        title = row["title"]
+        author = row.get("author") or "N/A"
+        checkout_date_str = row.get("checkout_date")
+        due_date_str = row.get("due_date")
+
+        item_data = {
+            "title": title,
+            "author": author,
+            "checkout_date": checkout_date_str if checkout_date_str else "N/A",
+            "due_date": due_date_str if due_date_str else "N/A"
+        }
+        for field in ITEM_ID_FIELDS:
+            if row.get(field):
+                item_data[field] = str(row[field])
+        checkout_data.append(item_data)
+
+        due_date_dt = parse_date(due_date_str) if due_date_str else None
+        if due_date_dt:
+            event = build_calendar_event(title, author, checkout_date_str, due_date_str, due_date_dt)
+            if username is not None:
+                add_event_identity(event, username, item_data)
+            calendar_events.append(event)
+
+    return checkout_data, calendar_events
+
+def parse_checkout_page(html, username=None):
+    """Parse the HTML of opac-user.pl and return (checkout_data, calendar_events)"""
+    return build_records(extract_checkout_rows(make_soup(html)), username)
+
+def save_checkout_files(output_dir, checkout_data, calendar_events, source="DTU Library Checkouts"):
+    """Write library_due_dates.json, library_checkout_data.json and library_books.csv"""
+    extracted_at = datetime.now().isoformat()
+
+    json_filename = os.path.join(output_dir, "library_due_dates.json")
+    with open(json_filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            "events": calendar_events,
+            "metadata": {
+                "total_events": len(calendar_events),
+                "extracted_at": extracted_at,
+                "source": source
+            }
+        }, f, indent=2, ensure_ascii=False)
+
+    raw_data_filename = os.path.join(output_dir, "library_checkout_data.json")
+    with open(raw_data_filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            "checkout_data": checkout_data,
+            "extracted_at": extracted_at
+        }, f, indent=2, ensure_ascii=False)
+
+    csv_filename = os.path.join(output_dir, "library_books.csv")
+    with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Title", "Author", "Checkout Date", "Due Date"])
+        for item in checkout_data:
+            writer.writerow([
+                item['title'],
+                item['author'],
+                item['checkout_date'],
+                item['due_date']
+            ])
+
+    return json_filename, raw_data_filename, csv_filename
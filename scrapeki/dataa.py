@@ -5,23 +5,37 @@ and save them to a file for Google Calendar integration.
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from time import sleep
 import json
 import os
 import csv
 from datetime import datetime, timedelta
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import add_event_identity
+from library_store import EXPORT_FILES, LibraryStore
+from waits import BudgetedWait, RunBudget, debug_pause, wait_for_checkouts, wait_for_login_form, wait_for_login_redirect
 
 # Login credentials
 username = "22234325"
 password = "1234"
 
+# OPAC location and run options (overridable, e.g. to point at fake_opac.py)
+OPAC_BASE_URL = os.environ.get("OPAC_BASE_URL", "https://dtu.bestbookbuddies.com/cgi-bin/koha")
+HEADLESS = os.environ.get("SCRAPER_HEADLESS", "").lower() in ("1", "true", "yes")
+
+# Per-run time budget: every wait below stops when it runs out
+budget = RunBudget()
+
 # Initialize the WebDriver
-driver = webdriver.Chrome()
-driver.get("https://dtu.bestbookbuddies.com/cgi-bin/koha/opac-user.pl")
+options = webdriver.ChromeOptions()
+if HEADLESS:
+    options.add_argument("--headless=new")
+driver = webdriver.Chrome(options=options)
+driver.get(f"{OPAC_BASE_URL}/opac-user.pl")
 
-wait = WebDriverWait(driver, 20)
+wait = BudgetedWait(driver, budget, 20)
 
 def parse_date(date_str):
     """Parse date string from format 'DD/MM/YYYY HH:MM' or 'DD/MM/YYYY' and return datetime object"""
@@ -52,7 +66,7 @@ try:
     print("=" * 60)
     print(f"Page: {driver.title}")
     
-    sleep(2)  # Wait for page to load
+    wait_for_login_form(wait)
     
     # Find username field using specific selectors: id="userid" or name="login_userid"
     print("Finding username field...")
@@ -70,11 +84,9 @@ try:
     # Enter username
     wait.until(EC.element_to_be_clickable(username_field))
     driver.execute_script("arguments[0].scrollIntoView(true);", username_field)
-    sleep(0.5)
     
     try:
         username_field.click()
-        sleep(0.3)
         username_field.clear()
         username_field.send_keys(username)
         print(f"✓ Username '{username}' entered")
@@ -100,11 +112,9 @@ try:
     
     wait.until(EC.element_to_be_clickable(password_field))
     driver.execute_script("arguments[0].scrollIntoView(true);", password_field)
-    sleep(0.5)
     
     try:
         password_field.click()
-        sleep(0.3)
         password_field.clear()
         password_field.send_keys(password)
         print("✓ Password entered")
@@ -118,35 +128,37 @@ try:
     # Find and click login button: <input type="submit" value="Log in" class="btn btn-primary">
     print("Finding login button...")
     login_button = None
+    # The form is already loaded, so each fallback selector only needs a short wait
+    form_wait = BudgetedWait(driver, budget, 2)
     try:
         # First try: Exact match - input with type="submit", class="btn btn-primary", value="Log in"
         try:
-            login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary[value='Log in']")))
+            login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary[value='Log in']")))
             print("✓ Found login button: input[type='submit'].btn.btn-primary[value='Log in']")
         except:
             # Second try: Find by class and value (without type check)
             try:
-                login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input.btn.btn-primary[value='Log in']")))
+                login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input.btn.btn-primary[value='Log in']")))
                 print("✓ Found login button: input.btn.btn-primary[value='Log in']")
             except:
                 # Third try: Find button inside fieldset.action
                 try:
-                    login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'].btn.btn-primary[value='Log in']")))
+                    login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'].btn.btn-primary[value='Log in']")))
                     print("✓ Found login button inside fieldset.action")
                 except:
                     # Fourth try: Find by fieldset.action and button attributes
                     try:
-                        login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'][value='Log in']")))
+                        login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'][value='Log in']")))
                         print("✓ Found login button in fieldset.action by value")
                     except:
                         # Fifth try: Find button inside fieldset.action (any submit button)
                         try:
-                            login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit']")))
+                            login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit']")))
                             print("✓ Found login button in fieldset.action")
                         except:
                             # Sixth try: Find by class only
                             try:
-                                login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary")))
+                                login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary")))
                                 print("✓ Found login button by class")
                             except:
                                 # Seventh try: Find by value attribute (search all submit buttons)
@@ -168,8 +180,7 @@ try:
         # Wait for button to be clickable
         wait.until(EC.element_to_be_clickable(login_button))
         # Scroll button into view
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'smooth'});", login_button)
-        sleep(1)
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", login_button)
         
         # Try multiple click methods
         clicked = False
@@ -213,8 +224,8 @@ try:
     else:
         raise Exception("Login button not found")
     
-    # Wait for login to complete
-    sleep(3)
+    # Wait for the post-login redirect to the patron page
+    wait_for_login_redirect(driver, wait, login_button)
     print("✓ Login successful!\n")
     
     # Step 2: Extract tabular data from dashboard
@@ -222,12 +233,9 @@ try:
     print("Extracting Book Names and Due Dates")
     print("=" * 60)
     
-    # Wait for dashboard to load and checkouts table to appear
-    print("Waiting for dashboard to load...")
-    sleep(3)
-    
-    # Wait for checkouts table
-    checkout_table = wait.until(EC.presence_of_element_located((By.ID, "checkoutst")))
+    # Wait for the checkouts table to be rendered
+    print("Waiting for checkouts table...")
+    checkout_table = wait_for_checkouts(wait)
     print("✓ Found checkouts table")
     
     # Find all rows in tbody
@@ -324,6 +332,8 @@ try:
                         ]
                     }
                 }
+                # Deterministic iCalUID + private checkoutKey, so calendar upserts are idempotent
+                add_event_identity(calendar_event, username, item_data)
                 calendar_events.append(calendar_event)
                 print(f"  ✓ Calendar event created")
             else:
@@ -344,46 +354,55 @@ try:
     print("Saving Data to Files")
     print("=" * 60)
     
-    # Get output directory (same directory as this script)
-    output_dir = os.path.dirname(os.path.abspath(__file__))
+    # Get output directory (same directory as this script unless SCRAPER_OUTPUT_DIR is set)
+    output_dir = os.environ.get("SCRAPER_OUTPUT_DIR") or os.path.dirname(os.path.abspath(__file__))
+    
+    # The database is always updated; it only touches this account's rows
+    store = LibraryStore()
+    store.record_scrape(username, checkout_data, calendar_events, engine="selenium")
+    store.close()
+    print(f"✓ Checkouts stored in: {store.path}")
     
-    # Save calendar events JSON for Google Calendar API
-    calendar_json = {
-        "events": calendar_events,
-        "metadata": {
-            "total_events": len(calendar_events),
-            "extracted_at": datetime.now().isoformat(),
-            "source": "DTU Library Checkouts"
+    if not EXPORT_FILES:
+        print("⊘ JSON/CSV export disabled (LIBRARY_EXPORT_FILES=0)")
+    else:
+        # Save calendar events JSON for Google Calendar API
+        calendar_json = {
+            "events": calendar_events,
+            "metadata": {
+                "total_events": len(calendar_events),
+                "extracted_at": datetime.now().isoformat(),
+                "source": "DTU Library Checkouts"
+            }
         }
-    }
     
-    json_filename = os.path.join(output_dir, "library_due_dates.json")
-    with open(json_filename, 'w', encoding='utf-8') as f:
-        json.dump(calendar_json, f, indent=2, ensure_ascii=False)
-    print(f"✓ Calendar events saved to: {json_filename}")
+        json_filename = os.path.join(output_dir, "library_due_dates.json")
+        with open(json_filename, 'w', encoding='utf-8') as f:
+            json.dump(calendar_json, f, indent=2, ensure_ascii=False)
+        print(f"✓ Calendar events saved to: {json_filename}")
     
-    # Save raw data
-    raw_data_filename = os.path.join(output_dir, "library_checkout_data.json")
-    with open(raw_data_filename, 'w', encoding='utf-8') as f:
-        json.dump({
-            "checkout_data": checkout_data,
-            "extracted_at": datetime.now().isoformat()
-        }, f, indent=2, ensure_ascii=False)
-    print(f"✓ Raw checkout data saved to: {raw_data_filename}")
+        # Save raw data
+        raw_data_filename = os.path.join(output_dir, "library_checkout_data.json")
+        with open(raw_data_filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                "checkout_data": checkout_data,
+                "extracted_at": datetime.now().isoformat()
+            }, f, indent=2, ensure_ascii=False)
+        print(f"✓ Raw checkout data saved to: {raw_data_filename}")
     
-    # Save CSV file for easy viewing
-    csv_filename = os.path.join(output_dir, "library_books.csv")
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Title", "Author", "Checkout Date", "Due Date"])
-        for item in checkout_data:
-            writer.writerow([
-                item['title'],
-                item['author'],
-                item['checkout_date'],
-                item['due_date']
-            ])
-    print(f"✓ CSV data saved to: {csv_filename}")
+        # Save CSV file for easy viewing
+        csv_filename = os.path.join(output_dir, "library_books.csv")
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Title", "Author", "Checkout Date", "Due Date"])
+            for item in checkout_data:
+                writer.writerow([
+                    item['title'],
+                    item['author'],
+                    item['checkout_date'],
+                    item['due_date']
+                ])
+        print(f"✓ CSV data saved to: {csv_filename}")
     
     # Display summary
     print("\n" + "=" * 60)
@@ -401,19 +420,14 @@ try:
     
     print("\n✓ Data saved successfully!")
     print("✓ Ready for Google Calendar integration!")
-    print("\n" + "=" * 60)
-    print("Browser will stay open for 30 seconds for verification...")
-    print("=" * 60)
-    sleep(30)  # Keep browser open for 30 seconds
+    print(f"\n✓ Finished in {budget.elapsed():.1f}s")
+    debug_pause(30, "for verification")
     
 except Exception as e:
     print(f"\n✗ An error occurred: {e}")
     import traceback
     traceback.print_exc()
-    print("\n" + "=" * 60)
-    print("Browser will stay open for 30 seconds for debugging...")
-    print("=" * 60)
-    sleep(30)
+    debug_pause(30, "for debugging")
 
 finally:
     print("\nClosing browser...")
@@ -0,0 +1,225 @@
+"""
+Warm pool of headless Chrome drivers for the JavaScript-heavy scraping path.
+
+Starting Chrome is the slowest part of a Selenium scrape, so a long-running
+process keeps a few drivers open and reuses them across jobs. Drivers stay
+logged in: a job for the account a driver last served skips the login
+entirely. Each driver uses a lean profile (pageLoadStrategy='eager', no
+images, stylesheets or fonts) and is recycled after a fixed number of jobs
+or as soon as it stops responding.
+
+Usage:
+    pool = DriverPool(size=2)
+    checkout_data, calendar_events = pool.run(username, password, scrape_checkouts)
+    pool.close()
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bulk_extract import extract_rows
+from checkout_parser import build_records, save_checkout_files
+from opac_http import OPAC_USER_URL, PASSWORD, USERNAME, OpacLoginError
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_JOBS = 50
+WAIT_TIMEOUT = 20
+
+# Resources the checkouts page does not need for scraping
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"
+]
+
+LOGGED_IN_SELECTOR = "#checkoutst, .loggedinusername, a.logout, #logout"
+
+def make_lean_options(headless=True):
+    """Return ChromeOptions for a fast, low-memory scraping profile"""
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.page_load_strategy = "eager"
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--no-first-run")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.fonts": 2,
+    })
+    return options
+
+def create_lean_driver(headless=True):
+    """Start a Chrome driver with the lean profile and network-level resource blocking"""
+    driver = webdriver.Chrome(options=make_lean_options(headless))
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    return driver
+
+def login_driver(driver, username, password, timeout=WAIT_TIMEOUT):
+    """Log the driver into the OPAC, skipping the form if the session is still valid"""
+    wait = WebDriverWait(driver, timeout)
+    driver.get(OPAC_USER_URL)
+    wait.until(EC.presence_of_element_located(
+        (By.CSS_SELECTOR, f"{LOGGED_IN_SELECTOR}, #userid, input[name='login_userid']")
+    ))
+    if driver.find_elements(By.CSS_SELECTOR, LOGGED_IN_SELECTOR):
+        return
+
+    username_field = driver.find_element(By.CSS_SELECTOR, "#userid, input[name='login_userid']")
+    password_field = driver.find_element(By.CSS_SELECTOR, "#password, input[name='login_password']")
+
+    # Fill and submit the form in one script call instead of typing key by key
+    driver.execute_script("""
+        arguments[0].value = arguments[2];
+        arguments[1].value = arguments[3];
+        HTMLFormElement.prototype.submit.call(arguments[0].form);
+    """, username_field, password_field, username, password)
+
+    try:
+        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, LOGGED_IN_SELECTOR)))
+    except TimeoutException:
+        raise OpacLoginError(f"Login failed for account '{username}'")
+
+def scrape_checkouts(driver):
+    """Default pool job: read every row of the checkouts table in one round trip"""
+    return build_records(extract_rows(driver))
+
+class PooledDriver:
+    """A driver owned by the pool, with its job count and logged-in account"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.jobs = 0
+        self.username = None
+        self.created_at = time.time()
+
+class DriverPool:
+    """Thread-safe pool of warm, logged-in headless Chrome drivers"""
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_jobs=DEFAULT_MAX_JOBS, headless=True):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.headless = headless
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _is_healthy(self, pooled):
+        """Return False if the driver has served enough jobs or has crashed"""
+        if pooled.jobs >= self.max_jobs:
+            return False
+        try:
+            pooled.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, pooled):
+        """Quit a driver and free its slot"""
+        try:
+            pooled.driver.quit()
+        except WebDriverException:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def acquire(self, username=None):
+        """Take a driver from the pool, preferring one already logged in as username"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("DriverPool is closed")
+                if self._idle:
+                    for i, pooled in enumerate(self._idle):
+                        if pooled.username == username:
+                            return self._idle.pop(i)
+                    return self._idle.pop()
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                self._cond.wait()
+
+        try:
+            return PooledDriver(create_lean_driver(self.headless))
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, pooled, failed=False):
+        """Return a driver to the pool, recycling it if it failed or is worn out"""
+        pooled.jobs += 1
+        if failed or self._closed or not self._is_healthy(pooled):
+            self._discard(pooled)
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self, username, password):
+        """Yield a driver logged in as username, returning it to the pool afterwards"""
+        pooled = self.acquire(username)
+        failed = False
+        try:
+            if pooled.username is not None and pooled.username != username:
+                pooled.driver.delete_all_cookies()
+                pooled.username = None
+            login_driver(pooled.driver, username, password)
+            pooled.username = username
+            yield pooled.driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(pooled, failed=failed)
+
+    def run(self, username, password, job=scrape_checkouts):
+        """Run job(driver) for one account on a warm driver and return its result"""
+        with self.session(username, password) as driver:
+            return job(driver)
+
+    def close(self):
+        """Quit every idle driver; busy drivers are quit when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+def main():
+    print("=" * 60)
+    print("DTU Library Scraper - Warm Driver Pool")
+    print("=" * 60)
+
+    pool = DriverPool(size=1)
+    try:
+        for attempt in range(1, 3):
+            start = time.perf_counter()
+            checkout_data, calendar_events = pool.run(USERNAME, PASSWORD)
+            print(f"✓ Run {attempt}: {len(checkout_data)} items in {time.perf_counter() - start:.2f}s")
+    finally:
+        pool.close()
+
+    output_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in save_checkout_files(output_dir, checkout_data, calendar_events):
+        print(f"✓ Saved: {path}")
+
+if __name__ == '__main__':
+    main()
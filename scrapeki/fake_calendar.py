@@ -0,0 +1,344 @@
+"""
+In-process stand-in for the Google Calendar v3 API, for benchmarks and offline testing.
+
+FakeCalendar.service(account) returns an object with the same surface as
+googleapiclient's Calendar service, as far as our scripts use it:
+
+    service.events().list/get/insert/update/delete/import_(...).execute()
+    service.new_batch_http_request(callback=...).add(...).execute()
+
+Each account has its own 'primary' calendar. The fake implements what our
+scripts rely on:
+- iCalUID uniqueness: insert answers 409 for a duplicate, and import_ upserts
+- deleted events stay behind as status 'cancelled', and delete answers 410
+  for them
+- timeMin/timeMax/iCalUID filters and pageToken paging
+- incremental sync with nextSyncToken/syncToken, including 410 Gone for an
+  expired token (expire_sync_tokens)
+
+Failures are raised as real googleapiclient HttpErrors, so retry and error
+handling take the same code paths as against Google. Optional settings:
+- latency: seconds per HTTP round trip (one per batch)
+- quota: calls per second for all accounts together; calls above it get
+  403 rateLimitExceeded
+- error_rate: share of calls answered with 503 backendError
+
+Every call and round trip is counted in stats, so benchmarks can report the
+API cost of a sync.
+
+Usage (see benchmark_calendar_sync.py):
+    fake = FakeCalendar(latency=0.05, quota=50)
+    service = fake.service("22234325")
+"""
+
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+DEFAULT_PAGE_SIZE = 250
+MAX_PAGE_SIZE = 2500
+BATCH_LIMIT = 1000    # the API's limit; our scripts send at most 50
+
+def _http_error(status, reason, message):
+    """Build the HttpError googleapiclient would raise for a JSON error response"""
+    resp = httplib2.Response({"status": str(status)})
+    resp.reason = message
+    content = json.dumps({
+        "error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}
+    }).encode("utf-8")
+    return HttpError(resp, content)
+
+def _naive(value):
+    """Parse an RFC 3339 time and drop the offset (our payloads are local times)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+class FakeRequest:
+    """One API call; execute() runs it as its own HTTP round trip"""
+
+    def __init__(self, calendar, method, handler, params):
+        self.calendar = calendar
+        self.method = method
+        self.handler = handler
+        self.params = params
+
+    def execute(self):
+        self.calendar._round_trip()
+        return self.calendar._call(self)
+
+class FakeBatch:
+    """A batch request: one round trip, every call still succeeds or fails on its own"""
+
+    def __init__(self, calendar, callback=None):
+        self.calendar = calendar
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id if request_id is not None else str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback))
+
+    def execute(self):
+        if len(self.requests) > BATCH_LIMIT:
+            raise _http_error(400, "badRequest", f"Too many requests in batch (max {BATCH_LIMIT})")
+        self.calendar._round_trip()
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = self.calendar._call(request), None
+            except HttpError as error:
+                response, exception = None, error
+            for handler in (callback, self.callback):
+                if handler is not None:
+                    handler(request_id, response, exception)
+
+class FakeEvents:
+    """service.events() of one account"""
+
+    def __init__(self, calendar, account):
+        self.calendar = calendar
+        self.account = account
+
+    def _request(self, method, **params):
+        handler = getattr(self.calendar, f"_{method}")
+        return FakeRequest(self.calendar, method, lambda: handler(self.account, **params), params)
+
+    def list(self, **params):
+        return self._request("list", **params)
+
+    def get(self, **params):
+        return self._request("get", **params)
+
+    def insert(self, **params):
+        return self._request("insert", **params)
+
+    def update(self, **params):
+        return self._request("update", **params)
+
+    def delete(self, **params):
+        return self._request("delete", **params)
+
+    def import_(self, **params):
+        return self._request("import", **params)
+
+class FakeService:
+    """The Calendar service object of one account"""
+
+    def __init__(self, calendar, account):
+        self.calendar = calendar
+        self.account = account
+
+    def events(self):
+        return FakeEvents(self.calendar, self.account)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self.calendar, callback)
+
+class FakeCalendar:
+    """Calendars of any number of accounts, behind one simulated API endpoint"""
+
+    def __init__(self, latency=0.0, quota=0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.quota = quota
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calendars = {}
+        self._recent_calls = deque()
+        self.stats = {"calls": 0, "round_trips": 0, "rate_limited": 0, "failed": 0}
+        self.calls_by_method = {}
+
+    def service(self, account="primary"):
+        """Return a Calendar service object for one account"""
+        return FakeService(self, str(account))
+
+    # Simulation
+
+    def _round_trip(self):
+        with self._lock:
+            self.stats["round_trips"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, request):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.calls_by_method[request.method] = self.calls_by_method.get(request.method, 0) + 1
+            if self.quota:
+                now = time.monotonic()
+                while self._recent_calls and now - self._recent_calls[0] >= 1.0:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= self.quota:
+                    self.stats["rate_limited"] += 1
+                    raise _http_error(403, "rateLimitExceeded", "Rate Limit Exceeded")
+                self._recent_calls.append(now)
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats["failed"] += 1
+                raise _http_error(503, "backendError", "Backend Error")
+            return request.handler()
+
+    def _calendar(self, account):
+        calendar = self._calendars.get(account)
+        if calendar is None:
+            calendar = self._calendars[account] = {"events": {}, "by_uid": {}, "seq": 0, "epoch": 0}
+        return calendar
+
+    def _touch(self, calendar, event):
+        calendar["seq"] += 1
+        event["_seq"] = calendar["seq"]
+        event["updated"] = datetime.utcnow().isoformat() + "Z"
+        event["etag"] = f'"{calendar["seq"]}"'
+
+    @staticmethod
+    def _public(event):
+        return {name: copy.deepcopy(value) for name, value in event.items() if not name.startswith("_")}
+
+    def _live(self, calendar, event_id):
+        event = calendar["events"].get(event_id)
+        if event is None:
+            raise _http_error(404, "notFound", "Not Found")
+        if event["status"] == "cancelled":
+            raise _http_error(410, "deleted", "Resource has been deleted")
+        return event
+
+    def _by_ical_uid(self, calendar, ical_uid):
+        event_id = calendar["by_uid"].get(ical_uid)
+        return calendar["events"][event_id] if event_id is not None else None
+
+    # Endpoints (called with the lock held)
+
+    def _list(self, account, calendarId="primary", syncToken=None, pageToken=None, maxResults=None,
+              timeMin=None, timeMax=None, iCalUID=None, showDeleted=False, **_ignored):
+        calendar = self._calendar(account)
+        events = sorted(calendar["events"].values(), key=lambda event: event["_seq"])
+        if syncToken is not None:
+            if timeMin or timeMax or iCalUID:
+                raise _http_error(400, "invalid", "syncToken cannot be combined with these filters")
+            epoch, _, since = syncToken.partition(":")
+            if epoch != str(calendar["epoch"]) or not since.isdigit():
+                raise _http_error(410, "fullSyncRequired", "Sync token is no longer valid")
+            since = int(since)
+            # Incremental sync always includes deleted events
+            events = [event for event in events if event["_seq"] > since]
+        else:
+            if not showDeleted:
+                events = [event for event in events if event["status"] != "cancelled"]
+            if iCalUID:
+                events = [event for event in events if event.get("iCalUID") == iCalUID]
+            low, high = _naive(timeMin), _naive(timeMax)
+            if low or high:
+                def in_window(event):
+                    start = _naive(event.get("start", {}).get("dateTime"))
+                    end = _naive(event.get("end", {}).get("dateTime")) or start
+                    if start is None:
+                        return False
+                    return (low is None or end > low) and (high is None or start < high)
+                events = [event for event in events if in_window(event)]
+
+        page_size = min(maxResults or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        offset = int(pageToken or 0)
+        page = events[offset:offset + page_size]
+        result = {"kind": "calendar#events", "items": [self._public(event) for event in page]}
+        if offset + page_size < len(events):
+            result["nextPageToken"] = str(offset + page_size)
+        else:
+            result["nextSyncToken"] = f"{calendar['epoch']}:{calendar['seq']}"
+        return result
+
+    def _get(self, account, calendarId="primary", eventId=None, **_ignored):
+        event = self._calendar(account)["events"].get(eventId)
+        if event is None:
+            raise _http_error(404, "notFound", "Not Found")
+        return self._public(event)
+
+    def _insert(self, account, calendarId="primary", body=None, **_ignored):
+        calendar = self._calendar(account)
+        body = copy.deepcopy(body or {})
+        event_id = uuid.uuid4().hex
+        ical_uid = body.get("iCalUID") or f"{event_id}@google.com"
+        existing = self._by_ical_uid(calendar, ical_uid)
+        if existing is not None and existing["status"] != "cancelled":
+            raise _http_error(409, "duplicate", "The requested identifier already exists.")
+        event = dict(body, id=event_id, iCalUID=ical_uid, status="confirmed")
+        calendar["events"][event_id] = event
+        calendar["by_uid"][ical_uid] = event_id
+        self._touch(calendar, event)
+        return self._public(event)
+
+    def _import(self, account, calendarId="primary", body=None, **_ignored):
+        calendar = self._calendar(account)
+        body = copy.deepcopy(body or {})
+        if not body.get("iCalUID"):
+            raise _http_error(400, "required", "Missing iCalUID")
+        existing = self._by_ical_uid(calendar, body["iCalUID"])
+        if existing is None:
+            return self._insert(account, calendarId, body)
+        event = dict(body, id=existing["id"], status="confirmed")
+        calendar["events"][existing["id"]] = event
+        self._touch(calendar, event)
+        return self._public(event)
+
+    def _update(self, account, calendarId="primary", eventId=None, body=None, **_ignored):
+        calendar = self._calendar(account)
+        existing = self._live(calendar, eventId)
+        body = copy.deepcopy(body or {})
+        if body.get("iCalUID") not in (None, existing["iCalUID"]):
+            raise _http_error(400, "invalid", "Cannot change the iCalUID of an event")
+        event = dict(body, id=eventId, iCalUID=existing["iCalUID"], status="confirmed")
+        calendar["events"][eventId] = event
+        self._touch(calendar, event)
+        return self._public(event)
+
+    def _delete(self, account, calendarId="primary", eventId=None, **_ignored):
+        calendar = self._calendar(account)
+        event = self._live(calendar, eventId)
+        event["status"] = "cancelled"
+        self._touch(calendar, event)
+        return ""
+
+    # Test helpers (not counted as API calls)
+
+    def events_of(self, account):
+        """Return the live events on an account's calendar"""
+        with self._lock:
+            calendar = self._calendar(str(account))
+            return [self._public(event) for event in calendar["events"].values() if event["status"] != "cancelled"]
+
+    def user_delete(self, account, event_id):
+        """Delete an event as the user would in the Calendar UI"""
+        with self._lock:
+            calendar = self._calendar(str(account))
+            event = self._live(calendar, event_id)
+            event["status"] = "cancelled"
+            self._touch(calendar, event)
+
+    def user_edit(self, account, event_id, **changes):
+        """Change fields of an event as the user would in the Calendar UI"""
+        with self._lock:
+            calendar = self._calendar(str(account))
+            event = self._live(calendar, event_id)
+            event.update(changes)
+            self._touch(calendar, event)
+
+    def expire_sync_tokens(self, account=None):
+        """Make every sync token issued so far answer 410 Gone"""
+        with self._lock:
+            accounts = [str(account)] if account is not None else list(self._calendars)
+            for name in accounts:
+                self._calendar(name)["epoch"] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {name: 0 for name in self.stats}
+            self.calls_by_method = {}
@@ -0,0 +1,600 @@
+"""
+Local stand-in for the DTU Koha OPAC, for benchmarks and offline testing.
+
+Serves the pages our scrapers use, with Koha's markup:
+
+    /cgi-bin/koha/opac-user.pl     login form, then the patron page with #checkoutst
+    /cgi-bin/koha/opac-search.pl   paged search results (?q=...&offset=...)
+    /cgi-bin/koha/opac-detail.pl   record page with the #holdingst items table
+    /cgi-bin/koha/ilsdi.pl         AuthenticatePatron, GetPatronInfo, GetAvailability
+    /api/v1/patrons, /api/v1/checkouts, /api/v1/biblios/<id>
+                                   REST API with patron basic auth (--rest)
+
+Any username logs in with any non-empty password. Each patron gets a stable,
+generated set of loans; the catalog is built from the website's books.json
+(or generated titles when it is missing). Pages carry ETags and answer
+If-None-Match with 304, and every response can be delayed to mimic a slow
+server. --error-rate answers a share of requests with 503, and --capacity
+answers 503 whenever more requests than that are in flight, to mimic an
+overloaded OPAC.
+
+Usage: python scrapeki/fake_opac.py --port 8765 --checkouts 10 --latency 0.05
+Then run any scraper with OPAC_BASE_URL=http://127.0.0.1:8765/cgi-bin/koha
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus, urlparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BOOKS_JSON = os.path.join(SCRIPT_DIR, "..", "website", "dataji", "books.json")
+
+KOHA_PREFIX = "/cgi-bin/koha"
+REST_PREFIX = "/api/v1"
+SEARCH_PAGE_SIZE = 20
+
+LOCATIONS = ["Central Library", "Reference Section", "Reading Room", "Book Bank"]
+SUBJECTS = ["Operating Systems", "Computer Networks", "Data Structures", "Digital Electronics",
+            "Thermodynamics", "Engineering Mechanics", "Signals and Systems", "Machine Learning"]
+PREFIXES = ["Introduction to", "Fundamentals of", "Principles of", "Advanced", "Handbook of"]
+AUTHORS = ["A. Sharma", "R. Gupta", "S. Iyer", "P. Verma", "K. Rao", "M. Singh", "N. Mehta"]
+
+LOGIN_FORM = """<div id="opac-auth"><form action="/cgi-bin/koha/opac-user.pl" method="post" name="auth" id="auth">
+{error}<input type="hidden" name="koha_login_context" value="opac">
+<fieldset class="brief">
+<label for="userid">Card number or username:</label>
+<input type="text" id="userid" size="10" name="login_userid" autocomplete="off">
+<label for="password">Password:</label>
+<input type="password" id="password" size="10" name="login_password" autocomplete="off">
+<fieldset class="action"><input type="submit" value="Log in" class="btn btn-primary"></fieldset>
+</fieldset></form></div>"""
+
+LOGIN_ERROR = '<div class="alert alert-warning">You entered an incorrect username or password.</div>\n'
+
+PAGE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title} &rsaquo; DTU Library catalog</title>
+<style>.tdlabel {{ display: none; }}</style></head>
+<body>{header}<main>{body}</main></body></html>"""
+
+def _books_from_json(path=BOOKS_JSON):
+    """Collect unique (title, author) pairs from the website's books.json"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return []
+
+    # The file holds several JSON documents back to back, so decode them one at a time
+    decoder = json.JSONDecoder()
+    documents = []
+    pos = 0
+    while pos < len(text):
+        if text[pos].isspace():
+            pos += 1
+            continue
+        try:
+            document, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            break
+        documents.append(document)
+
+    books = {}
+    stack = documents
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if "title" in node:
+                books.setdefault((node["title"], node.get("author") or "N/A"), None)
+            else:
+                stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return sorted(books)
+
+def _etag(*parts):
+    """Return a quoted ETag for the given content parts"""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+class FakeKoha:
+    """In-memory OPAC data: a catalog of biblios with items and generated patron loans"""
+
+    def __init__(self, checkouts=5, catalog_size=500, seed=0):
+        self.checkouts = checkouts
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.catalog = self._build_catalog(catalog_size)
+        self.patron_ids = {}
+        self._loans = {}
+
+    def _build_catalog(self, size):
+        rng = random.Random(self.seed)
+        books = _books_from_json()
+        while len(books) < size:
+            n = len(books)
+            title = f"{PREFIXES[n % len(PREFIXES)]} {SUBJECTS[n % len(SUBJECTS)]}, Vol. {n // 40 + 1}"
+            books.append((title, AUTHORS[n % len(AUTHORS)]))
+
+        catalog = {}
+        for biblionumber, (title, author) in enumerate(books[:size], 1):
+            items = []
+            for copy in range(rng.randint(1, 4)):
+                checked_out = rng.random() < 0.4
+                items.append({
+                    "itemnumber": biblionumber * 10 + copy,
+                    "barcode": f"DTU{biblionumber:06d}{copy}",
+                    "location": rng.choice(LOCATIONS),
+                    "call_no": f"{rng.randint(0, 999):03d}.{rng.randint(1, 99)} {author[:3].upper()}",
+                    "status": "checkedout" if checked_out else "available",
+                    "date_due": self.today + timedelta(days=rng.randint(1, 30)) if checked_out else None
+                })
+            catalog[biblionumber] = {"biblionumber": biblionumber, "title": title, "author": author, "items": items}
+        return catalog
+
+    def patron_id(self, username):
+        """Return a stable numeric borrowernumber for username"""
+        with self.lock:
+            return self.patron_ids.setdefault(username, len(self.patron_ids) + 1)
+
+    def username_for(self, patron_id):
+        with self.lock:
+            for username, pid in self.patron_ids.items():
+                if str(pid) == str(patron_id):
+                    return username
+        return None
+
+    def loans(self, username):
+        """Return the patron's loans; the same username always gets the same loans"""
+        with self.lock:
+            if username not in self._loans:
+                rng = random.Random(f"{self.seed}:{username}")
+                biblios = rng.sample(sorted(self.catalog), min(self.checkouts, len(self.catalog)))
+                loans = []
+                for biblionumber in biblios:
+                    record = self.catalog[biblionumber]
+                    item = record["items"][0]
+                    due = self.today + timedelta(days=rng.randint(-2, 30), hours=23, minutes=59)
+                    issued = due.replace(hour=rng.randint(9, 17), minute=rng.randint(0, 59)) - timedelta(days=14)
+                    loans.append({
+                        "biblionumber": biblionumber,
+                        "itemnumber": item["itemnumber"],
+                        "barcode": item["barcode"],
+                        "title": record["title"],
+                        "author": record["author"],
+                        "issuedate": issued,
+                        "date_due": due
+                    })
+                self._loans[username] = loans
+            return self._loans[username]
+
+    def renew(self, username, biblionumber, days=14):
+        """Push a loan's due date back, as a renewal would"""
+        with self.lock:
+            for loan in self._loans.get(username, []):
+                if loan["biblionumber"] == biblionumber:
+                    loan["date_due"] += timedelta(days=days)
+
+    def return_book(self, username, biblionumber):
+        """Remove a loan, as a check-in would"""
+        with self.lock:
+            self._loans[username] = [
+                loan for loan in self._loans.get(username, []) if loan["biblionumber"] != biblionumber
+            ]
+
+    def set_item_status(self, biblionumber, index, status, date_due=None):
+        """Change one item's status ('available' or 'checkedout')"""
+        with self.lock:
+            item = self.catalog[biblionumber]["items"][index]
+            item["status"] = status
+            item["date_due"] = date_due
+
+    def search(self, query):
+        """Return the biblionumbers whose title or author contains every query word"""
+        words = [word.casefold() for word in re.findall(r"\w+", query or "")]
+        results = []
+        for biblionumber, record in self.catalog.items():
+            text = f"{record['title']} {record['author']}".casefold()
+            if all(word in text for word in words):
+                results.append(biblionumber)
+        return results
+
+class FakeOpacHandler(BaseHTTPRequestHandler):
+    """Request handler; the server object carries the FakeKoha data and settings"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    def _params(self):
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8", "replace")
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+        return parsed.path, params
+
+    def _session_user(self):
+        match = re.search(r"CGISESSID=([\w-]+)", self.headers.get("Cookie") or "")
+        if match is None:
+            return None
+        with self.server.sessions_lock:
+            return self.server.sessions.get(match.group(1))
+
+    def _send(self, status, body="", content_type="text/html; charset=utf-8", headers=None, etag=None):
+        if etag and self.server.etags:
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, ""
+            headers = dict(headers or {}, ETag=etag)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def _page(self, title, body, username=None):
+        header = ""
+        if username:
+            header = (
+                '<div id="members"><ul class="nav"><li>Welcome, '
+                f'<span class="loggedinusername">{html.escape(username)}</span></li>'
+                '<li><a class="logout" id="logout" href="/cgi-bin/koha/opac-main.pl?logout.x=1">Log out</a></li></ul></div>'
+            )
+        return PAGE.format(title=html.escape(title), header=header, body=body)
+
+    def _route(self):
+        with self.server.stats_lock:
+            self.server.active += 1
+            overloaded = bool(self.server.capacity) and self.server.active > self.server.capacity
+        try:
+            self._route_request(overloaded)
+        finally:
+            with self.server.stats_lock:
+                self.server.active -= 1
+
+    def _route_request(self, overloaded):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path, params = self._params()
+        with self.server.stats_lock:
+            self.server.stats[path] = self.server.stats.get(path, 0) + 1
+            if overloaded or (self.server.error_rate and random.random() < self.server.error_rate):
+                self.server.stats["503"] = self.server.stats.get("503", 0) + 1
+                failing = True
+            else:
+                failing = False
+        if failing:
+            self._send(503, self._page("Service unavailable", "<h1>503 Service Unavailable</h1>"),
+                       headers={"Retry-After": "1"})
+            return
+
+        routes = {
+            f"{KOHA_PREFIX}/opac-user.pl": self._opac_user,
+            f"{KOHA_PREFIX}/opac-search.pl": self._opac_search,
+            f"{KOHA_PREFIX}/opac-detail.pl": self._opac_detail,
+        }
+        if self.server.ilsdi:
+            routes[f"{KOHA_PREFIX}/ilsdi.pl"] = self._ilsdi
+        if self.server.rest and path.startswith(f"{REST_PREFIX}/"):
+            self._rest(path[len(REST_PREFIX):], params)
+            return
+        handler = routes.get(path)
+        if handler is None:
+            self._send(404, self._page("Not found", "<h1>404 Not Found</h1>"))
+            return
+        handler(params)
+
+    def do_GET(self):
+        self._route()
+
+    def do_POST(self):
+        self._route()
+
+    # Pages
+
+    def _opac_user(self, params):
+        username = self._session_user()
+        headers = {}
+        if self.command == "POST" and "login_userid" in params:
+            username = None
+            if params.get("login_userid") and params.get("login_password"):
+                username = params["login_userid"]
+                session_id = uuid.uuid4().hex
+                with self.server.sessions_lock:
+                    self.server.sessions[session_id] = username
+                headers["Set-Cookie"] = f"CGISESSID={session_id}; Path=/; HttpOnly"
+            else:
+                form = LOGIN_FORM.format(error=LOGIN_ERROR)
+                self._send(200, self._page("Log in to your account", form))
+                return
+
+        if username is None:
+            self._send(200, self._page("Log in to your account", LOGIN_FORM.format(error="")))
+            return
+
+        loans = self.server.koha.loans(username)
+        body = self._checkouts_table(loans)
+        etag = _etag(username, loans) if self.command == "GET" else None
+        self._send(200, self._page("Your library home", body, username), headers=headers, etag=etag)
+
+    def _checkouts_table(self, loans):
+        if not loans:
+            return '<div id="opac-user-checkouts"><p>You have nothing checked out.</p></div>'
+        rows = []
+        for loan in loans:
+            rows.append(
+                "<tr>"
+                f'<td class="title"><a href="/cgi-bin/koha/opac-detail.pl?biblionumber={loan["biblionumber"]}">'
+                f'<span class="biblio-title">{html.escape(loan["title"])}</span></a></td>'
+                f'<td class="author"><span class="tdlabel">Author:</span> {html.escape(loan["author"])}</td>'
+                f'<td class="checkout_date" data-order="{loan["issuedate"]:%Y-%m-%d %H:%M}">'
+                f'<span class="tdlabel">Checked out on:</span> {loan["issuedate"]:%d/%m/%Y %H:%M}</td>'
+                f'<td class="date_due" data-order="{loan["date_due"]:%Y-%m-%d %H:%M}">'
+                f'<span class="tdlabel">Date due:</span> {loan["date_due"]:%d/%m/%Y}</td>'
+                "</tr>"
+            )
+        return (
+            '<div id="opac-user-checkouts"><table id="checkoutst" class="table table-bordered table-striped">'
+            "<thead><tr><th>Title</th><th>Author</th><th>Checked out on</th><th>Date due</th></tr></thead>"
+            f"<tbody>{''.join(rows)}</tbody></table></div>"
+        )
+
+    def _opac_search(self, params):
+        query = params.get("q", "")
+        offset = int(params.get("offset") or 0)
+        koha = self.server.koha
+        results = koha.search(query)
+        page = results[offset:offset + SEARCH_PAGE_SIZE]
+
+        rows = []
+        for biblionumber in page:
+            record = koha.catalog[biblionumber]
+            available = sum(1 for item in record["items"] if item["status"] == "available")
+            unavailable = len(record["items"]) - available
+            rows.append(
+                '<tr><td class="bibliocol">'
+                f'<a class="title" href="/cgi-bin/koha/opac-detail.pl?biblionumber={biblionumber}">'
+                f'{html.escape(record["title"])}</a>'
+                f'<ul class="author resource_list"><li>by <a href="#">{html.escape(record["author"])}</a></li></ul>'
+                '<span class="results_summary availability"><span class="label">Availability: </span>'
+                f'<span class="available">Items available for loan: ({available})</span> '
+                f'<span class="unavailable">Checked out ({unavailable})</span></span>'
+                "</td></tr>"
+            )
+
+        pagination = ""
+        if offset + SEARCH_PAGE_SIZE < len(results):
+            next_url = f"/cgi-bin/koha/opac-search.pl?q={quote_plus(query)}&offset={offset + SEARCH_PAGE_SIZE}"
+            pagination = (
+                '<nav class="pagination"><ul><li class="page-item">'
+                f'<a class="page-link" rel="next" href="{html.escape(next_url)}">Next &raquo;</a></li></ul></nav>'
+            )
+        body = (
+            f'<p id="numresults">Your search returned {len(results)} results.</p>'
+            '<div id="userresults"><div class="searchresults"><table class="table table-striped"><tbody>'
+            f"{''.join(rows)}</tbody></table></div>{pagination}</div>"
+        )
+        summaries = [(b, [item["status"] for item in koha.catalog[b]["items"]]) for b in page]
+        self._send(200, self._page(f"Results of search for '{query}'", body, self._session_user()),
+                   etag=_etag(query, offset, summaries))
+
+    def _opac_detail(self, params):
+        try:
+            record = self.server.koha.catalog[int(params.get("biblionumber", ""))]
+        except (KeyError, ValueError):
+            self._send(404, self._page("Record not found", "<h1>This record does not exist</h1>"))
+            return
+
+        rows = []
+        for item in record["items"]:
+            if item["status"] == "available":
+                status = '<span class="item-status available">Available</span>'
+            else:
+                status = '<span class="item-status checkedout">Checked out</span>'
+            due = f"{item['date_due']:%d/%m/%Y}" if item["date_due"] else ""
+            rows.append(
+                "<tr>"
+                f'<td class="location">{html.escape(item["location"])}</td>'
+                f'<td class="call_no">{html.escape(item["call_no"])}</td>'
+                f'<td class="status">{status}</td>'
+                f'<td class="date_due">{due}</td>'
+                f'<td class="barcode">{item["barcode"]}</td>'
+                "</tr>"
+            )
+        body = (
+            f'<div id="catalogue_detail_biblio"><h1 class="title">{html.escape(record["title"])}</h1>'
+            f'<span class="results_summary"><span class="author">{html.escape(record["author"])}</span></span></div>'
+            '<table id="holdingst" class="table table-bordered table-striped">'
+            "<thead><tr><th>Current library</th><th>Call number</th><th>Status</th><th>Date due</th><th>Barcode</th></tr></thead>"
+            f"<tbody>{''.join(rows)}</tbody></table>"
+        )
+        self._send(200, self._page(record["title"], body, self._session_user()), etag=_etag(record))
+
+    # ILS-DI
+
+    def _xml(self, root, inner):
+        body = f'<?xml version="1.0" encoding="UTF-8" ?>\n<{root}>{inner}</{root}>'
+        self._send(200, body, content_type="text/xml; charset=utf-8")
+
+    def _ilsdi(self, params):
+        koha = self.server.koha
+        service = params.get("service")
+        if service == "AuthenticatePatron":
+            if params.get("username") and params.get("password"):
+                self._xml(service, f"<id>{koha.patron_id(params['username'])}</id>")
+            else:
+                self._xml(service, "<code>PatronNotFound</code>")
+        elif service == "GetPatronInfo":
+            username = koha.username_for(params.get("patron_id"))
+            if username is None:
+                self._xml(service, "<code>PatronNotFound</code>")
+                return
+            loans = ""
+            if params.get("show_loans") == "1":
+                loans = "<loans>" + "".join(
+                    f"<loan><biblionumber>{loan['biblionumber']}</biblionumber>"
+                    f"<itemnumber>{loan['itemnumber']}</itemnumber><barcode>{loan['barcode']}</barcode>"
+                    f"<title>{html.escape(loan['title'])}</title><author>{html.escape(loan['author'])}</author>"
+                    f"<issuedate>{loan['issuedate']:%Y-%m-%d %H:%M:%S}</issuedate>"
+                    f"<date_due>{loan['date_due']:%Y-%m-%d %H:%M:%S}</date_due></loan>"
+                    for loan in koha.loans(username)
+                ) + "</loans>"
+            self._xml(service, f"<cardnumber>{html.escape(username)}</cardnumber>{loans}")
+        elif service == "GetAvailability":
+            records = []
+            for biblio_id in re.split(r"[+\s]+", params.get("id", "").strip()):
+                record = koha.catalog.get(int(biblio_id)) if biblio_id.isdigit() else None
+                if record is None:
+                    continue
+                items = "".join(
+                    f'<dlf:item id="{item["itemnumber"]}"><dlf:simpleavailability>'
+                    f"<dlf:identifier>{item['itemnumber']}</dlf:identifier>"
+                    f"<dlf:availabilitystatus>{'available' if item['status'] == 'available' else 'not available'}</dlf:availabilitystatus>"
+                    f"<dlf:availabilitymsg>{'Available' if item['status'] == 'available' else 'Checked out'}</dlf:availabilitymsg>"
+                    f"<dlf:location>{html.escape(item['location'])}</dlf:location>"
+                    "</dlf:simpleavailability></dlf:item>"
+                    for item in record["items"]
+                )
+                records.append(
+                    f'<dlf:record><dlf:bibliographic id="{record["biblionumber"]}" />'
+                    f"<dlf:items>{items}</dlf:items></dlf:record>"
+                )
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<dlf:collection xmlns:dlf="http://diglib.org/ilsdi/1.1">'
+                f"{''.join(records)}</dlf:collection>"
+            )
+            self._send(200, body, content_type="text/xml; charset=utf-8")
+        else:
+            self._xml("Error", "<code>NotSupported</code>")
+
+    # REST API
+
+    def _json(self, status, value):
+        self._send(status, json.dumps(value), content_type="application/json;charset=UTF-8")
+
+    def _basic_auth_user(self):
+        header = self.headers.get("Authorization") or ""
+        if not header.startswith("Basic "):
+            return None
+        try:
+            username, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+        except ValueError:
+            return None
+        return username if username and password else None
+
+    def _rest(self, path, params):
+        koha = self.server.koha
+        username = self._basic_auth_user()
+        if username is None:
+            self._json(401, {"error": "Authentication failure."})
+            return
+        if path == "/patrons":
+            userid = params.get("userid")
+            if userid is not None and userid != username:
+                self._json(403, {"error": "Authorization failure. Missing required permission(s)."})
+                return
+            self._json(200, [{"patron_id": koha.patron_id(username), "userid": username, "cardnumber": username}])
+        elif path == "/checkouts":
+            if str(params.get("patron_id")) != str(koha.patron_id(username)):
+                self._json(403, {"error": "Authorization failure. Missing required permission(s)."})
+                return
+            embed_item = "item" in (self.headers.get("x-koha-embed") or "")
+            checkouts = []
+            for loan in koha.loans(username):
+                checkout = {
+                    "checkout_id": loan["biblionumber"],
+                    "patron_id": koha.patron_id(username),
+                    "item_id": loan["itemnumber"],
+                    "checkout_date": f"{loan['issuedate']:%Y-%m-%dT%H:%M:%S}+05:30",
+                    "due_date": f"{loan['date_due']:%Y-%m-%dT%H:%M:%S}+05:30"
+                }
+                if embed_item:
+                    checkout["item"] = {"item_id": loan["itemnumber"], "biblio_id": loan["biblionumber"],
+                                        "external_id": loan["barcode"]}
+                checkouts.append(checkout)
+            self._json(200, checkouts)
+        elif re.fullmatch(r"/biblios/\d+", path):
+            record = koha.catalog.get(int(path.rsplit("/", 1)[1]))
+            if record is None:
+                self._json(404, {"error": "Object not found."})
+                return
+            self._json(200, {"biblio_id": record["biblionumber"], "title": record["title"], "author": record["author"]})
+        else:
+            self._json(404, {"error": "Endpoint not found."})
+
+def make_server(host="127.0.0.1", port=8765, koha=None, latency=0.0, ilsdi=True, etags=True,
+                error_rate=0.0, capacity=0, rest=False):
+    """Create (but do not start) a fake OPAC server"""
+    server = ThreadingHTTPServer((host, port), FakeOpacHandler)
+    server.daemon_threads = True
+    server.koha = koha or FakeKoha()
+    server.latency = latency
+    server.ilsdi = ilsdi
+    server.rest = rest
+    server.etags = etags
+    server.error_rate = error_rate
+    server.capacity = capacity
+    server.active = 0
+    server.sessions = {}
+    server.sessions_lock = threading.Lock()
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    return server
+
+def serve_in_thread(**kwargs):
+    """Start a fake OPAC server on a daemon thread and return (server, base_url)"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}{KOHA_PREFIX}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Koha OPAC")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--checkouts", type=int, default=5, help="loans per patron")
+    parser.add_argument("--catalog-size", type=int, default=500, help="number of biblios in the catalog")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to delay every response")
+    parser.add_argument("--no-ilsdi", action="store_true", help="disable the ILS-DI endpoint")
+    parser.add_argument("--rest", action="store_true", help="enable the REST API")
+    parser.add_argument("--no-etags", action="store_true", help="never answer 304 Not Modified")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="answer 503 while more requests than this are in flight (0 = unlimited)")
+    args = parser.parse_args()
+
+    koha = FakeKoha(checkouts=args.checkouts, catalog_size=args.catalog_size)
+    server = make_server(args.host, args.port, koha, args.latency, not args.no_ilsdi, not args.no_etags,
+                         args.error_rate, args.capacity, args.rest)
+    print("=" * 60)
+    print("Fake DTU Library OPAC")
+    print("=" * 60)
+    print(f"✓ Serving {len(koha.catalog)} records, {args.checkouts} loans per patron")
+    print(f"  OPAC_BASE_URL=http://{args.host}:{args.port}{KOHA_PREFIX}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+if __name__ == '__main__':
+    main()
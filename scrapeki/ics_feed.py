@@ -0,0 +1,302 @@
+"""
+iCalendar (.ics) feed of library reminders, served over HTTP.
+
+Pushing reminders to Google Calendar needs OAuth per user and API calls per
+book. A subscribed feed needs neither: the user adds the feed URL to any
+calendar app (Google Calendar "From URL", Apple Calendar, Outlook, Thunderbird)
+once, and the app polls it.
+
+Each feed is generated from the event payloads in the library database, the
+same ones the Google Calendar scripts push: summary, description, due time in
+Asia/Kolkata and the reminder overrides as VALARMs. The event's iCalUID is used
+as UID, so an event keeps its identity across feed updates.
+
+A feed is rebuilt only when the account's loans change (the fingerprint kept
+by library_store). Every response carries an ETag, and a poll with a matching
+If-None-Match gets an empty 304 Not Modified.
+
+    GET /feeds/<account>.ics
+
+Set ICS_FEED_TOKEN to require ?token=<value> on every request.
+
+Usage:
+    python scrapeki/ics_feed.py serve --port 8080
+    python scrapeki/ics_feed.py export 22234325 --output library.ics
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import ICAL_UID_DOMAIN, TIMEZONE
+from library_store import DEFAULT_DB_FILE, LibraryStore
+
+PRODID = "-//DTU Library Reminder//Library Due Dates//EN"
+FEED_PATH_RE = re.compile(r"^/feeds/([^/]+)\.ics$")
+FEED_TOKEN = os.environ.get("ICS_FEED_TOKEN")
+REFRESH_INTERVAL = "PT6H"    # how often subscribers are asked to poll
+
+# India has used +05:30 all year round since 1945
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE",
+    f"TZID:{TIMEZONE}",
+    "BEGIN:STANDARD",
+    "DTSTART:19700101T000000",
+    "TZOFFSETFROM:+0530",
+    "TZOFFSETTO:+0530",
+    "TZNAME:IST",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+def escape_text(value):
+    """Escape a TEXT value (RFC 5545 section 3.3.11)"""
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def fold_line(line):
+    """Fold a content line into chunks of at most 75 octets"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74    # continuation lines start with a space
+    return "\r\n ".join(parts)
+
+def ics_datetime(value):
+    """Turn the payload's local RFC 3339 dateTime into an iCalendar DATE-TIME"""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+def event_to_vevent(event, dtstamp):
+    """Return the content lines of one VEVENT for a Google Calendar event payload"""
+    start = event["start"]
+    end = event.get("end") or start
+    uid = event.get("iCalUID")
+    if not uid:
+        raw = f"{event.get('summary', '')}|{start['dateTime']}"
+        uid = f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]}@{ICAL_UID_DOMAIN}"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{dtstamp}",
+        f"DTSTART;TZID={start.get('timeZone', TIMEZONE)}:{ics_datetime(start['dateTime'])}",
+        f"DTEND;TZID={end.get('timeZone', TIMEZONE)}:{ics_datetime(end['dateTime'])}",
+        f"SUMMARY:{escape_text(event.get('summary', ''))}",
+    ]
+    if event.get("description"):
+        lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+    lines.append("TRANSP:TRANSPARENT")
+
+    # Email and popup reminders at the same time become one alarm; calendar apps only display them
+    minutes = sorted({override["minutes"] for override in event.get("reminders", {}).get("overrides", [])},
+                     reverse=True)
+    for minute in minutes:
+        lines += [
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{escape_text(event.get('summary', 'Library book due'))}",
+            f"TRIGGER:-PT{minute}M" if minute else "TRIGGER:PT0S",
+            "END:VALARM",
+        ]
+    lines.append("END:VEVENT")
+    return lines
+
+def build_calendar(events, name="DTU Library Due Dates", dtstamp=None):
+    """Return a complete VCALENDAR document for a list of event payloads"""
+    dtstamp = dtstamp or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}",
+        f"X-WR-TIMEZONE:{TIMEZONE}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{REFRESH_INTERVAL}",
+        f"X-PUBLISHED-TTL:{REFRESH_INTERVAL}",
+    ] + VTIMEZONE
+    for event in events:
+        lines += event_to_vevent(event, dtstamp)
+    lines.append("END:VCALENDAR")
+    return "".join(fold_line(line) + "\r\n" for line in lines)
+
+def _dtstamp(changed_at):
+    """Use the time the loans last changed as DTSTAMP, so an unchanged feed is byte-identical"""
+    try:
+        # library_store keeps naive local times; DTSTAMP must be UTC
+        changed = datetime.fromisoformat(changed_at).astimezone(timezone.utc)
+        return changed.strftime("%Y%m%dT%H%M%SZ")
+    except (TypeError, ValueError):
+        return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+class IcsFeedCache:
+    """Generated feeds, rebuilt only when an account's loans change"""
+
+    def __init__(self, db_path=DEFAULT_DB_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._feeds = {}
+        self._local = threading.local()
+        self.stats = {"built": 0, "cached": 0}
+
+    def _store(self):
+        # SQLite connections must not be shared across threads
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = LibraryStore(self.db_path)
+        return store
+
+    def feed(self, username):
+        """Return (etag, body) of an account's feed, or None for an unknown account"""
+        store = self._store()
+        version = store.account_version(username)
+        if version is None:
+            return None
+        with self._lock:
+            cached = self._feeds.get(username)
+            if cached is not None and cached[0] == version:
+                self.stats["cached"] += 1
+                return cached[1], cached[2]
+
+        body = build_calendar(store.load_events(username), f"DTU Library Due Dates ({username})",
+                              _dtstamp(version[1]))
+        etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+        with self._lock:
+            self._feeds[username] = (version, etag, body)
+            self.stats["built"] += 1
+        return etag, body
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+class IcsFeedHandler(BaseHTTPRequestHandler):
+    server_version = "DTULibraryFeed/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = FEED_PATH_RE.match(url.path)
+        if match is None:
+            self._send(404, b"Not found\n", {"Content-Type": "text/plain; charset=utf-8"})
+            return
+        token = self.server.token
+        if token and parse_qs(url.query).get("token", [None])[0] != token:
+            self._send(403, b"Forbidden\n", {"Content-Type": "text/plain; charset=utf-8"})
+            return
+
+        feed = self.server.feeds.feed(match.group(1))
+        if feed is None:
+            self._send(404, b"Unknown account\n", {"Content-Type": "text/plain; charset=utf-8"})
+            return
+        etag, body = feed
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+        if _etag_matches(self.headers.get("If-None-Match"), etag):
+            with self.server.stats_lock:
+                self.server.stats["not_modified"] += 1
+            self._send(304, headers=headers)
+            return
+        with self.server.stats_lock:
+            self.server.stats["full"] += 1
+        headers["Content-Type"] = "text/calendar; charset=utf-8"
+        headers["Content-Disposition"] = f'inline; filename="{match.group(1)}.ics"'
+        self._send(200, body.encode("utf-8"), headers)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+def make_server(host="127.0.0.1", port=8080, db_path=DEFAULT_DB_FILE, token=FEED_TOKEN):
+    """Create (but do not start) a feed server"""
+    server = ThreadingHTTPServer((host, port), IcsFeedHandler)
+    server.daemon_threads = True
+    server.feeds = IcsFeedCache(db_path)
+    server.token = token
+    server.stats = {"full": 0, "not_modified": 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+def serve_in_thread(**kwargs):
+    """Start a feed server on a daemon thread and return (server, base_url)"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/feeds"
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish library reminders as iCalendar feeds")
+    parser.add_argument("--db", default=DEFAULT_DB_FILE, help="path of the SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="serve /feeds/<account>.ics over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    export_parser = subparsers.add_parser("export", help="write one account's feed to a file")
+    export_parser.add_argument("account")
+    export_parser.add_argument("--output", help="output file (default: <account>.ics)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        feed = IcsFeedCache(args.db).feed(args.account)
+        if feed is None:
+            print(f"✗ No checkouts stored for {args.account} - run a scraper first")
+            return
+        output = args.output or f"{args.account}.ics"
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            f.write(feed[1])
+        print(f"✓ Wrote {output}")
+        return
+
+    server = make_server(args.host, args.port, args.db)
+    store = LibraryStore(args.db)
+    accounts = store.accounts()
+    store.close()
+    print("=" * 60)
+    print("DTU Library Reminder Feeds")
+    print("=" * 60)
+    query = "?token=<ICS_FEED_TOKEN>" if server.token else ""
+    for account in accounts:
+        print(f"  http://{args.host}:{args.port}/feeds/{account}.ics{query}")
+    if not accounts:
+        print("⊘ No accounts in the database yet - run a scraper first")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nServer stopped. {server.stats['full']} full responses, "
+              f"{server.stats['not_modified']} not modified.")
+
+if __name__ == '__main__':
+    main()
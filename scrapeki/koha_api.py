@@ -0,0 +1,266 @@
+"""
+Koha API client for DTU Library checkouts.
+
+The DTU OPAC runs Koha, which can expose patron loans and item availability
+through ILS-DI (/cgi-bin/koha/ilsdi.pl) and the REST API (/api/v1/). When
+either is enabled, this client reads checkouts from those structured
+endpoints: one small XML/JSON response instead of a rendered page, and
+nothing breaks when the OPAC theme changes. When both are disabled it falls
+back to scraping opac-user.pl with the HTTP engine in opac_http.py.
+
+Every source produces the same rows as scrp.py, so build_records() returns
+the usual checkout_data and calendar_events.
+
+Usage: python scrapeki/koha_api.py
+"""
+
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import build_records, extract_checkout_rows, make_soup, save_checkout_files
+from opac_http import OPAC_BASE_URL, PASSWORD, USERNAME, OpacLoginError, login, new_session, opac_request
+
+ILSDI_URL = f"{OPAC_BASE_URL}/ilsdi.pl"
+REST_API_URL = OPAC_BASE_URL.split("/cgi-bin/", 1)[0] + "/api/v1"
+
+SOURCES = ("ilsdi", "rest", "html")
+DISABLED_TTL = float(os.environ.get("KOHA_DISABLED_TTL", "3600"))   # seconds a disabled API is skipped
+
+# Statuses that mean the endpoint itself does not exist, rather than a passing failure
+ENDPOINT_MISSING_STATUSES = (404, 405)
+
+class KohaApiUnavailable(Exception):
+    """Raised when an API endpoint is disabled or not reachable on the OPAC
+
+    definitive is True when the reply shows the API is switched off for
+    everyone (not just failing right now, or refusing this one patron).
+    """
+
+    def __init__(self, message, definitive=False):
+        super().__init__(message)
+        self.definitive = definitive
+
+def _local_name(tag):
+    """Strip the XML namespace from a tag name"""
+    return tag.rsplit("}", 1)[-1]
+
+def _child_text(elem, name):
+    """Return the text of the first descendant called name, ignoring namespaces"""
+    for child in elem.iter():
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip() or None
+    return None
+
+def format_koha_date(value, due=False):
+    """Convert an ISO or 'YYYY-MM-DD HH:MM:SS' date to the OPAC display format used by scrp.py"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00").replace(" ", "T", 1))
+    except ValueError:
+        return value
+    # The OPAC shows due dates at end of day without a time, like parse_date expects
+    if due and (dt.hour, dt.minute) == (23, 59):
+        return dt.strftime("%d/%m/%Y")
+    return dt.strftime("%d/%m/%Y %H:%M")
+
+class KohaClient:
+    """Fetches one patron's checkouts, preferring ILS-DI, then REST, then HTML scraping"""
+
+    # {source: monotonic time until which it is skipped by every client}; only for definitive verdicts
+    _disabled_until = {}
+
+    def __init__(self, username, password, session=None):
+        self.username = username
+        self.password = password
+        self.session = session or new_session()
+        self.source = None
+        self._patron_id = None
+        # Sources that failed for this patron only (e.g. a REST 401) or transiently
+        self._skipped_sources = set()
+
+    # ILS-DI
+
+    def _ilsdi(self, **params):
+        """Call one ILS-DI service and return the parsed XML root"""
+        try:
+            response = opac_request(self.session, "GET", ILSDI_URL, params=params)
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            raise KohaApiUnavailable(f"ILS-DI returned {status}", definitive=status in ENDPOINT_MISSING_STATUSES)
+        try:
+            root = ET.fromstring(response.content)
+        except ET.ParseError:
+            raise KohaApiUnavailable("ILS-DI did not return XML (service disabled?)", definitive=True)
+        # Errors come back as a top-level <code> element
+        code = next(((child.text or "").strip() for child in root if _local_name(child.tag) == "code"), None)
+        if code == "PatronNotFound":
+            raise OpacLoginError(f"Login failed for account '{self.username}'")
+        if code:
+            raise KohaApiUnavailable(f"ILS-DI error: {code}", definitive=code == "NotSupported")
+        return root
+
+    def _ilsdi_rows(self):
+        """Read loans with ILS-DI AuthenticatePatron + GetPatronInfo(show_loans=1)"""
+        if self._patron_id is None:
+            root = self._ilsdi(service="AuthenticatePatron", username=self.username, password=self.password)
+            self._patron_id = _child_text(root, "id")
+            if self._patron_id is None:
+                raise KohaApiUnavailable("ILS-DI AuthenticatePatron returned no patron id")
+
+        root = self._ilsdi(service="GetPatronInfo", patron_id=self._patron_id, show_loans=1)
+        rows = []
+        for loan in root.iter():
+            if _local_name(loan.tag) != "loan":
+                continue
+            row = {
+                "title": _child_text(loan, "title") or f"Book {len(rows) + 1}",
+                "author": _child_text(loan, "author") or "N/A",
+                "checkout_date": format_koha_date(_child_text(loan, "issuedate")),
+                "due_date": format_koha_date(_child_text(loan, "date_due"), due=True)
+            }
+            for field in ("biblionumber", "itemnumber", "barcode"):
+                value = _child_text(loan, field)
+                if value:
+                    row[field] = value
+            rows.append(row)
+        return rows
+
+    # REST API
+
+    def _rest(self, path, **kwargs):
+        """GET one REST API path with patron basic auth and return the decoded JSON"""
+        headers = kwargs.pop("headers", {})
+        headers.setdefault("Accept", "application/json")
+        try:
+            response = opac_request(
+                self.session, "GET", f"{REST_API_URL}{path}",
+                auth=(self.username, self.password), headers=headers, **kwargs
+            )
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            if status == 401:
+                # Could equally be this patron's wrong password, so it only affects this client
+                raise KohaApiUnavailable("REST API basic auth is disabled or not allowed for patrons")
+            # A missing record (e.g. one biblio) says nothing about the API as a whole
+            definitive = status in ENDPOINT_MISSING_STATUSES and not path.startswith("/biblios/")
+            raise KohaApiUnavailable(f"REST API returned {status} for {path}", definitive=definitive)
+        try:
+            return response.json()
+        except ValueError:
+            raise KohaApiUnavailable(f"REST API did not return JSON for {path}", definitive=True)
+
+    def _rest_rows(self):
+        """Read loans from /api/v1/checkouts, looking up each biblio once"""
+        if self._patron_id is None:
+            patrons = self._rest("/patrons", params={"userid": self.username})
+            if not patrons:
+                raise KohaApiUnavailable("REST API did not return the patron record")
+            self._patron_id = patrons[0]["patron_id"]
+
+        checkouts = self._rest(
+            "/checkouts",
+            params={"patron_id": self._patron_id, "_per_page": -1},
+            headers={"x-koha-embed": "item"}
+        )
+
+        biblios = {}
+        rows = []
+        for checkout in checkouts:
+            item = checkout.get("item") or {}
+            biblio_id = item.get("biblio_id")
+            if biblio_id is not None and biblio_id not in biblios:
+                biblios[biblio_id] = self._rest(f"/biblios/{biblio_id}")
+            biblio = biblios.get(biblio_id, {})
+            row = {
+                "title": biblio.get("title") or f"Book {len(rows) + 1}",
+                "author": biblio.get("author") or "N/A",
+                "checkout_date": format_koha_date(checkout.get("checkout_date")),
+                "due_date": format_koha_date(checkout.get("due_date"), due=True)
+            }
+            if biblio_id is not None:
+                row["biblionumber"] = str(biblio_id)
+            if checkout.get("item_id") is not None:
+                row["itemnumber"] = str(checkout["item_id"])
+            if item.get("external_id"):
+                row["barcode"] = item["external_id"]
+            rows.append(row)
+        return rows
+
+    # HTML fallback
+
+    def _html_rows(self):
+        """Scrape opac-user.pl when neither API is enabled"""
+        html = login(self.session, self.username, self.password)
+        return extract_checkout_rows(make_soup(html))
+
+    def fetch_rows(self):
+        """Return the raw checkout rows from the first source that works"""
+        fetchers = {"ilsdi": self._ilsdi_rows, "rest": self._rest_rows, "html": self._html_rows}
+        now = time.monotonic()
+        for source in SOURCES:
+            if source in self._skipped_sources or self._disabled_until.get(source, 0) > now:
+                continue
+            try:
+                rows = fetchers[source]()
+            except KohaApiUnavailable as e:
+                print(f"  {source}: unavailable ({e})")
+                self._skipped_sources.add(source)
+                if e.definitive:
+                    self._disabled_until[source] = time.monotonic() + DISABLED_TTL
+                continue
+            self.source = source
+            return rows
+        raise KohaApiUnavailable("No Koha data source is available")
+
+    def get_checkouts(self):
+        """Return (checkout_data, calendar_events) for this patron"""
+        return build_records(self.fetch_rows(), self.username)
+
+    def get_availability(self, biblionumbers):
+        """Return {biblionumber: [item dicts]} from ILS-DI GetAvailability"""
+        ids = "+".join(str(b) for b in biblionumbers)
+        root = self._ilsdi(service="GetAvailability", id=ids, id_type="bib")
+        availability = {}
+        for record in root.iter():
+            if _local_name(record.tag) != "record":
+                continue
+            biblionumber = None
+            items = []
+            for elem in record.iter():
+                name = _local_name(elem.tag)
+                if name == "bibliographic":
+                    biblionumber = elem.get("id")
+                elif name == "item":
+                    items.append({
+                        "itemnumber": elem.get("id"),
+                        "status": _child_text(elem, "availabilitystatus"),
+                        "message": _child_text(elem, "availabilitymsg"),
+                        "location": _child_text(elem, "location")
+                    })
+            if biblionumber is not None:
+                availability[biblionumber] = items
+        return availability
+
+def main():
+    print("=" * 60)
+    print("DTU Library Koha API Client")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    client = KohaClient(USERNAME, PASSWORD)
+    checkout_data, calendar_events = client.get_checkouts()
+    print(f"✓ Fetched {len(checkout_data)} items from '{client.source}' in {time.perf_counter() - start:.2f}s")
+
+    output_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in save_checkout_files(output_dir, checkout_data, calendar_events):
+        print(f"✓ Saved: {path}")
+
+if __name__ == '__main__':
+    main()
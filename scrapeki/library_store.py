@@ -0,0 +1,380 @@
+"""
+SQLite store for DTU Library checkouts, calendar events and scrape runs.
+
+Every scraper used to rewrite library_due_dates.json, library_checkout_data.json
+and library_books.csv in full, and readers loaded the whole file. The store
+keeps everything in one WAL-mode database (scrapeki/library.db by default,
+or LIBRARY_DB):
+
+    accounts              one row per library account, with the last scrape time
+    checkouts             one row per loan, keyed by checkout_key(); returned books keep their row
+    calendar_events       the Google Calendar payload for each loan still checked out
+    calendar_sync         the calendar event id and payload hash last pushed for each loan
+    calendar_sync_tokens  the Calendar nextSyncToken of each account's last reconciliation
+    scrape_runs           one row per scrape, for auditing and freshness checks
+
+A scrape is applied in one transaction: loans are upserted, loans that
+disappeared are marked returned, and the run is logged. Queries such as
+"everything due in the next 3 days" use the due-date index.
+
+The JSON/CSV files are still written by default. Set LIBRARY_EXPORT_FILES=0
+to keep only the database, or export them on demand:
+
+    python scrapeki/library_store.py due --days 3
+    python scrapeki/library_store.py export 22234325 --output-dir .
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from change_detect import fingerprint_records
+from checkout_parser import add_event_identity, checkout_key, parse_date, save_checkout_files
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_FILE = os.environ.get("LIBRARY_DB") or os.path.join(SCRIPT_DIR, "library.db")
+EXPORT_FILES = os.environ.get("LIBRARY_EXPORT_FILES", "1").lower() not in ("0", "false", "no")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    username TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    last_scraped_at TEXT,
+    last_changed_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS checkouts (
+    checkout_key TEXT PRIMARY KEY,
+    username TEXT NOT NULL REFERENCES accounts(username),
+    title TEXT NOT NULL,
+    author TEXT,
+    checkout_date TEXT,
+    due_date TEXT,
+    due_at TEXT,
+    first_seen_at TEXT NOT NULL,
+    last_seen_at TEXT NOT NULL,
+    returned_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_checkouts_account ON checkouts(username, returned_at);
+CREATE INDEX IF NOT EXISTS idx_checkouts_due ON checkouts(due_at) WHERE returned_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS calendar_events (
+    checkout_key TEXT PRIMARY KEY REFERENCES checkouts(checkout_key) ON DELETE CASCADE,
+    username TEXT NOT NULL,
+    start_at TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_account ON calendar_events(username, start_at);
+
+CREATE TABLE IF NOT EXISTS calendar_sync (
+    checkout_key TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    payload_hash TEXT NOT NULL,
+    summary TEXT,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (checkout_key, calendar_id)
+);
+CREATE INDEX IF NOT EXISTS idx_sync_account ON calendar_sync(username, calendar_id);
+
+CREATE TABLE IF NOT EXISTS calendar_sync_tokens (
+    username TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    sync_token TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (username, calendar_id)
+);
+
+CREATE TABLE IF NOT EXISTS scrape_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    engine TEXT,
+    finished_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    items INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_account ON scrape_runs(username, finished_at);
+"""
+
+def _due_at(due_date):
+    """Return the ISO due datetime for an OPAC due date string, or None"""
+    if not due_date or due_date == "N/A":
+        return None
+    dt = parse_date(due_date)
+    return dt.isoformat() if dt else None
+
+def pair_events(checkout_data, calendar_events):
+    """Yield (item, event or None) pairs; build_records only creates events for items with a due date"""
+    events = iter(calendar_events)
+    for item in checkout_data:
+        yield item, (next(events, None) if _due_at(item.get("due_date")) else None)
+
+class LibraryStore:
+    """One connection to the library database (create one per thread)"""
+
+    def __init__(self, path=DEFAULT_DB_FILE):
+        self.path = path
+        # Autocommit mode; transaction() groups the statements of one scrape
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of statements atomically"""
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            yield self.conn
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _log_run(self, conn, username, engine, status, items=None, error=None, now=None):
+        conn.execute(
+            "INSERT INTO scrape_runs (username, engine, finished_at, status, items, error) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, engine, now or datetime.now().isoformat(), status, items, error)
+        )
+
+    def record_scrape(self, username, checkout_data, calendar_events, engine=None):
+        """Apply one scrape atomically and return True if the account's loans changed"""
+        now = datetime.now().isoformat()
+        fingerprint = fingerprint_records(checkout_data)
+        with self.transaction() as conn:
+            row = conn.execute("SELECT fingerprint FROM accounts WHERE username = ?", (username,)).fetchone()
+            changed = row is None or row["fingerprint"] != fingerprint
+            conn.execute(
+                """INSERT INTO accounts (username, fingerprint, last_scraped_at, last_changed_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(username) DO UPDATE SET
+                       fingerprint = excluded.fingerprint,
+                       last_scraped_at = excluded.last_scraped_at,
+                       last_changed_at = CASE WHEN accounts.fingerprint IS excluded.fingerprint
+                                              THEN accounts.last_changed_at ELSE excluded.last_changed_at END""",
+                (username, fingerprint, now, now)
+            )
+
+            seen = []
+            for item, event in pair_events(checkout_data, calendar_events):
+                key = checkout_key(username, item)
+                seen.append(key)
+                conn.execute(
+                    """INSERT INTO checkouts (checkout_key, username, title, author, checkout_date, due_date,
+                                              due_at, first_seen_at, last_seen_at, returned_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+                       ON CONFLICT(checkout_key) DO UPDATE SET
+                           author = excluded.author,
+                           due_date = excluded.due_date,
+                           due_at = excluded.due_at,
+                           last_seen_at = excluded.last_seen_at,
+                           returned_at = NULL""",
+                    (key, username, item["title"], item.get("author"), item.get("checkout_date"),
+                     item.get("due_date"), _due_at(item.get("due_date")), now, now)
+                )
+                if event is None:
+                    conn.execute("DELETE FROM calendar_events WHERE checkout_key = ?", (key,))
+                else:
+                    # Engines that do not know the account (e.g. the driver pool) leave this to the store
+                    if "iCalUID" not in event:
+                        event = add_event_identity(dict(event), username, item)
+                    conn.execute(
+                        """INSERT INTO calendar_events (checkout_key, username, start_at, payload)
+                           VALUES (?, ?, ?, ?)
+                           ON CONFLICT(checkout_key) DO UPDATE SET
+                               start_at = excluded.start_at, payload = excluded.payload""",
+                        (key, username, event["start"]["dateTime"], json.dumps(event, ensure_ascii=False))
+                    )
+
+            # Loans missing from this scrape have been returned
+            placeholders = ",".join("?" * len(seen))
+            returned_filter = f"AND checkout_key NOT IN ({placeholders})" if seen else ""
+            conn.execute(
+                f"UPDATE checkouts SET returned_at = ? WHERE username = ? AND returned_at IS NULL {returned_filter}",
+                (now, username, *seen)
+            )
+            conn.execute(
+                f"DELETE FROM calendar_events WHERE username = ? {returned_filter}",
+                (username, *seen)
+            )
+            self._log_run(conn, username, engine, "changed" if changed else "unchanged", len(checkout_data), now=now)
+        return changed
+
+    def record_unchanged(self, username, engine=None):
+        """Log a poll that found nothing new (e.g. 304 Not Modified)"""
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            conn.execute("UPDATE accounts SET last_scraped_at = ? WHERE username = ?", (now, username))
+            self._log_run(conn, username, engine, "unchanged", now=now)
+
+    def record_failure(self, username, engine, error):
+        """Log a failed scrape"""
+        with self.transaction() as conn:
+            self._log_run(conn, username, engine, "error", error=str(error))
+
+    # Queries
+
+    def accounts(self):
+        """Return every account in the database"""
+        return [row["username"] for row in self.conn.execute("SELECT username FROM accounts ORDER BY username")]
+
+    def has_account(self, username):
+        return self.conn.execute("SELECT 1 FROM accounts WHERE username = ?", (username,)).fetchone() is not None
+
+    def account_version(self, username):
+        """Return (fingerprint, last_changed_at) of the account's loans, or None for an unknown account"""
+        row = self.conn.execute(
+            "SELECT fingerprint, last_changed_at FROM accounts WHERE username = ?", (username,)
+        ).fetchone()
+        return (row["fingerprint"], row["last_changed_at"]) if row else None
+
+    def last_scraped_at(self, username):
+        """Return the time of the account's last successful scrape, or None"""
+        row = self.conn.execute("SELECT last_scraped_at FROM accounts WHERE username = ?", (username,)).fetchone()
+        return datetime.fromisoformat(row["last_scraped_at"]) if row and row["last_scraped_at"] else None
+
+    def load_checkouts(self, username):
+        """Return the account's current loans in the checkout_data format"""
+        rows = self.conn.execute(
+            """SELECT title, author, checkout_date, due_date FROM checkouts
+               WHERE username = ? AND returned_at IS NULL ORDER BY due_at""",
+            (username,)
+        )
+        return [
+            {
+                "title": row["title"],
+                "author": row["author"] or "N/A",
+                "checkout_date": row["checkout_date"] or "N/A",
+                "due_date": row["due_date"] or "N/A"
+            }
+            for row in rows
+        ]
+
+    def load_events(self, username):
+        """Return the account's calendar event payloads, soonest first"""
+        rows = self.conn.execute(
+            "SELECT payload FROM calendar_events WHERE username = ? ORDER BY start_at", (username,)
+        )
+        return [json.loads(row["payload"]) for row in rows]
+
+    def load_events_by_key(self, username):
+        """Return {checkout_key: event payload} for the account's loans that have a due date"""
+        rows = self.conn.execute(
+            "SELECT checkout_key, payload FROM calendar_events WHERE username = ?", (username,)
+        )
+        return {row["checkout_key"]: json.loads(row["payload"]) for row in rows}
+
+    # Calendar sync state
+
+    def load_sync_state(self, username, calendar_id="primary"):
+        """Return {checkout_key: row} (event_id, payload_hash, summary) of what was last pushed to the calendar"""
+        rows = self.conn.execute(
+            """SELECT checkout_key, event_id, payload_hash, summary FROM calendar_sync
+               WHERE username = ? AND calendar_id = ?""",
+            (username, calendar_id)
+        )
+        return {row["checkout_key"]: row for row in rows}
+
+    def save_sync_state(self, username, calendar_id, checkout_key, event_id, payload_hash, summary=None):
+        """Remember that checkout_key's event was pushed as event_id with payload_hash"""
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO calendar_sync (checkout_key, calendar_id, username, event_id, payload_hash, summary, synced_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(checkout_key, calendar_id) DO UPDATE SET
+                       event_id = excluded.event_id,
+                       payload_hash = excluded.payload_hash,
+                       summary = excluded.summary,
+                       synced_at = excluded.synced_at""",
+                (checkout_key, calendar_id, username, event_id, payload_hash, summary, datetime.now().isoformat())
+            )
+
+    def forget_sync_state(self, calendar_id, checkout_key):
+        """Drop the mapping of a loan whose event was deleted"""
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM calendar_sync WHERE checkout_key = ? AND calendar_id = ?", (checkout_key, calendar_id)
+            )
+
+    def load_sync_token(self, username, calendar_id="primary"):
+        """Return the nextSyncToken saved by the account's last reconciliation, or None"""
+        row = self.conn.execute(
+            "SELECT sync_token FROM calendar_sync_tokens WHERE username = ? AND calendar_id = ?",
+            (username, calendar_id)
+        ).fetchone()
+        return row["sync_token"] if row else None
+
+    def save_sync_token(self, username, calendar_id, sync_token):
+        """Remember the nextSyncToken to use for the account's next reconciliation (None forgets it)"""
+        with self.transaction() as conn:
+            if sync_token is None:
+                conn.execute(
+                    "DELETE FROM calendar_sync_tokens WHERE username = ? AND calendar_id = ?", (username, calendar_id)
+                )
+                return
+            conn.execute(
+                """INSERT INTO calendar_sync_tokens (username, calendar_id, sync_token, updated_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(username, calendar_id) DO UPDATE SET
+                       sync_token = excluded.sync_token, updated_at = excluded.updated_at""",
+                (username, calendar_id, sync_token, datetime.now().isoformat())
+            )
+
+    def due_within(self, days, username=None):
+        """Return loans (including overdue ones) due within the next `days` days"""
+        limit = (datetime.now() + timedelta(days=days)).isoformat()
+        query = """SELECT username, title, author, due_date, due_at FROM checkouts
+                   WHERE returned_at IS NULL AND due_at IS NOT NULL AND due_at <= ?"""
+        params = [limit]
+        if username is not None:
+            query += " AND username = ?"
+            params.append(username)
+        return [dict(row) for row in self.conn.execute(query + " ORDER BY due_at", params)]
+
+    def export_files(self, username, output_dir):
+        """Write the classic JSON/CSV files for one account from the database"""
+        return save_checkout_files(output_dir, self.load_checkouts(username), self.load_events(username))
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the DTU Library checkout database")
+    parser.add_argument("--db", default=DEFAULT_DB_FILE, help="path of the SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    due_parser = subparsers.add_parser("due", help="list loans due soon")
+    due_parser.add_argument("--days", type=float, default=3)
+    due_parser.add_argument("--account", help="only this account")
+
+    export_parser = subparsers.add_parser("export", help="write the JSON/CSV files for one account")
+    export_parser.add_argument("account")
+    export_parser.add_argument("--output-dir", default=SCRIPT_DIR)
+    args = parser.parse_args()
+
+    store = LibraryStore(args.db)
+    try:
+        if args.command == "due":
+            rows = store.due_within(args.days, args.account)
+            print(f"{len(rows)} loans due within {args.days:g} days")
+            for row in rows:
+                overdue = " (OVERDUE)" if row["due_at"] < datetime.now().isoformat() else ""
+                print(f"  {row['username']}: {row['title']} - due {row['due_date']}{overdue}")
+        else:
+            for path in store.export_files(args.account, args.output_dir):
+                print(f"✓ Saved: {path}")
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Concurrent multi-account scraper for DTU Library checkouts.
+
+Scrapes a whole list of library accounts at once with an asyncio HTTP
+client (aiohttp). All accounts share one bounded connection pool to the
+OPAC host, a semaphore caps how many accounts are in flight, and a
+result is emitted for each account as soon as it finishes.
+
+Accounts file (JSON list or CSV with a header row):
+    [{"username": "22234325", "password": "1234"}, ...]
+
+Prerequisites:
+1. Install dependencies: pip install aiohttp beautifulsoup4
+2. Run this script: python scrapeki/multi_account.py accounts.json --concurrency 20
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+import aiohttp
+from yarl import URL
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from change_detect import ChangeTracker, fingerprint_records
+from checkout_parser import build_records, extract_checkout_rows, is_logged_in, make_soup, save_checkout_files
+from library_store import EXPORT_FILES, LibraryStore
+from ndjson_stream import NDJSONWriter
+from snapshot_archive import SNAPSHOTS_ENABLED, save_snapshot
+from opac_governor import GOVERNOR, OpacUnavailableError
+from opac_http import OPAC_USER_URL, REQUEST_TIMEOUT, USER_AGENT, OpacLoginError, build_login_payload
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_PER_HOST = 8
+
+def load_accounts(path):
+    """Load a list of {'username', 'password'} dicts from a JSON or CSV file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            accounts = [dict(row) for row in csv.DictReader(f)]
+        else:
+            accounts = json.load(f)
+    return [
+        {"username": str(acc["username"]).strip(), "password": str(acc["password"])}
+        for acc in accounts
+        if acc.get("username")
+    ]
+
+def make_connector(per_host=DEFAULT_PER_HOST):
+    """Create the shared connection pool, bounded per host"""
+    return aiohttp.TCPConnector(limit_per_host=per_host, ttl_dns_cache=300)
+
+async def _fetch_text(session, method, url, **kwargs):
+    """Send one request under the OPAC governor and return (final_url, body_text)"""
+    async def send():
+        async with session.request(method, url, **kwargs) as response:
+            await response.read()
+            return response
+
+    response = await GOVERNOR.call_async(send, method)
+    response.raise_for_status()
+    return str(response.url), await response.text()
+
+async def scrape_account_async(connector, username, password, session_store=None):
+    """Log into one account on the shared pool and return its result dict"""
+    start = time.perf_counter()
+    result = {"username": username, "status": "ok", "checkout_data": [], "calendar_events": []}
+
+    # Every account needs its own cookie jar so sessions do not leak between students
+    cookie_jar = aiohttp.CookieJar(unsafe=True)
+    cached = session_store.load(username) if session_store is not None else None
+    if cached:
+        cookie_jar.update_cookies(cached, URL(OPAC_USER_URL))
+
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=False,
+            cookie_jar=cookie_jar,
+            headers={"User-Agent": USER_AGENT},
+            timeout=timeout,
+        ) as session:
+            page_url, html = await _fetch_text(session, "GET", OPAC_USER_URL)
+            soup = make_soup(html)
+            if not is_logged_in(soup):
+                action_url, payload = build_login_payload(html, username, password, page_url)
+                page_url, html = await _fetch_text(session, "POST", action_url, data=payload)
+                soup = make_soup(html)
+                if not is_logged_in(soup):
+                    raise OpacLoginError(f"Login failed for account '{username}'")
+                if "checkoutst" not in html and "opac-user.pl" not in page_url:
+                    page_url, html = await _fetch_text(session, "GET", OPAC_USER_URL)
+                    soup = make_soup(html)
+
+            if session_store is not None:
+                cookies = {morsel.key: morsel.value for morsel in cookie_jar.filter_cookies(URL(OPAC_USER_URL)).values()}
+                if cookies != cached:
+                    session_store.save(username, cookies)
+
+            checkout_data, calendar_events = build_records(extract_checkout_rows(soup), username)
+            if SNAPSHOTS_ENABLED:
+                save_snapshot(html, username, checkout_data, "async", page_url)
+            result["checkout_data"] = checkout_data
+            result["calendar_events"] = calendar_events
+    except (aiohttp.ClientError, asyncio.TimeoutError, OpacLoginError, OpacUnavailableError) as e:
+        result["status"] = "error"
+        result["error"] = str(e) or e.__class__.__name__
+    except Exception as e:
+        # A parser bug or an unexpected page must only fail this account, not the whole run
+        result["status"] = "error"
+        result["error"] = f"{e.__class__.__name__}: {e}"
+
+    result["elapsed"] = round(time.perf_counter() - start, 3)
+    return result
+
+async def scrape_accounts(accounts, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, session_store=None):
+    """Scrape all accounts concurrently, yielding one result dict per account as each finishes"""
+    connector = make_connector(per_host)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(account):
+        async with semaphore:
+            return await scrape_account_async(connector, account["username"], account["password"], session_store)
+
+    tasks = [asyncio.create_task(bounded(account)) for account in accounts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await connector.close()
+
+async def _aenumerate(aiterable, start=0):
+    i = start
+    async for item in aiterable:
+        yield i, item
+        i += 1
+
+async def run(accounts, concurrency, per_host, output_dir, session_store=None, ndjson_path=None):
+    """Scrape all accounts, save per-account files and print a summary"""
+    ok_count = 0
+    unchanged_count = 0
+    failed_count = 0
+    start = time.perf_counter()
+    # State is written once at the end instead of after every account
+    tracker = ChangeTracker(autosave=False)
+    store = LibraryStore()
+    # Every account's lines are appended as soon as it finishes
+    ndjson = NDJSONWriter(ndjson_path) if ndjson_path else None
+
+    async for i, result in _aenumerate(scrape_accounts(accounts, concurrency, per_host, session_store), 1):
+        username = result["username"]
+        if result["status"] == "ok":
+            account_dir = os.path.join(output_dir, username)
+            if ndjson is not None:
+                ndjson.write_account(username, result["checkout_data"], result["calendar_events"])
+            store.record_scrape(username, result["checkout_data"], result["calendar_events"], engine="async")
+            fingerprint = fingerprint_records(result["checkout_data"])
+            changed = tracker.is_changed(username, fingerprint)
+            if not changed and (not EXPORT_FILES or os.path.isdir(account_dir)):
+                tracker.update(username, fingerprint)
+                print(f"= [{i}/{len(accounts)}] {username}: unchanged ({result['elapsed']:.2f}s)")
+                unchanged_count += 1
+                continue
+            if EXPORT_FILES:
+                os.makedirs(account_dir, exist_ok=True)
+                save_checkout_files(account_dir, result["checkout_data"], result["calendar_events"])
+            tracker.update(username, fingerprint)
+            print(f"✓ [{i}/{len(accounts)}] {username}: {len(result['checkout_data'])} items ({result['elapsed']:.2f}s)")
+            ok_count += 1
+        else:
+            store.record_failure(username, "async", result["error"])
+            print(f"✗ [{i}/{len(accounts)}] {username}: {result['error']}")
+            failed_count += 1
+
+    tracker.save()
+    store.close()
+    if ndjson is not None:
+        ndjson.close()
+        print(f"✓ Streamed {ndjson.count} records to: {ndjson_path}")
+    elapsed = time.perf_counter() - start
+    print("\n" + "=" * 60)
+    print("Summary")
+    print("=" * 60)
+    print(f"Accounts scraped: {ok_count}")
+    print(f"Unchanged: {unchanged_count}")
+    print(f"Failed: {failed_count}")
+    print(f"Wall time: {elapsed:.2f}s ({len(accounts) / elapsed if elapsed else 0:.1f} accounts/s)")
+    governor = GOVERNOR.snapshot()
+    print(f"OPAC governor: limit {governor['limit']:g}, {governor['retries']} retries, "
+          f"{governor['errors']} errors, breaker {governor['breaker']} ({governor['trips']} trips)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape many DTU Library accounts concurrently")
+    parser.add_argument("accounts", help="JSON or CSV file with username/password pairs")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of accounts scraped at the same time")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST,
+                        help="maximum open connections to the OPAC host")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts"),
+                        help="directory for per-account output files")
+    parser.add_argument("--ndjson", help="also stream every checkout and event to this NDJSON file")
+    args = parser.parse_args()
+
+    accounts = load_accounts(args.accounts)
+    print("=" * 60)
+    print(f"DTU Library Multi-Account Scraper ({len(accounts)} accounts)")
+    print("=" * 60)
+    # Reuse saved login sessions when the optional cache is available
+    try:
+        from session_store import SessionStore
+        session_store = SessionStore()
+    except ImportError:
+        session_store = None
+
+    asyncio.run(run(accounts, args.concurrency, args.per_host, args.output_dir, session_store, args.ndjson))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Streaming NDJSON output for scrapes that cover many accounts.
+
+The JSON files hold a whole run in memory and are written once at the end,
+so a failure late in a run loses everything. An NDJSON stream gets one
+compact line per checkout or calendar event as soon as it is extracted, and
+is flushed every few records or seconds. Readers consume it line by line
+with a generator, so memory stays flat however large the run is.
+
+Line format:
+
+    {"type":"checkout","account":"22234325","title":...,"author":...,"checkout_date":...,"due_date":...}
+    {"type":"event","account":"22234325","event":{...Google Calendar event...}}
+
+The file is opened in append mode, so an interrupted run can simply be resumed.
+"""
+
+import json
+import os
+import time
+
+FLUSH_EVERY = 50          # records
+FLUSH_INTERVAL = 2.0      # seconds
+
+class NDJSONWriter:
+    """Appends one JSON object per line, flushing every flush_every records or flush_interval seconds"""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._file = open(path, 'a', encoding='utf-8')
+        # Start on a fresh line if a previous run died halfway through one
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def write(self, record):
+        """Append one record"""
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.count += 1
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_checkout(self, account, item):
+        self.write({"type": "checkout", "account": account, **item})
+
+    def write_event(self, account, event):
+        self.write({"type": "event", "account": account, "event": event})
+
+    def write_account(self, account, checkout_data, calendar_events):
+        """Append every checkout and event of one scraped account"""
+        for item in checkout_data:
+            self.write_checkout(account, item)
+        for event in calendar_events:
+            self.write_event(account, event)
+
+    def flush(self):
+        """Push buffered lines to disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_ndjson(path, kind=None, account=None):
+    """Yield the records of an NDJSON file one at a time, optionally filtered by type and account"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a partial last line
+                print(f"⊘ Skipping malformed line {line_number} in {path}")
+                continue
+            if kind is not None and record.get("type") != kind:
+                continue
+            if account is not None and record.get("account") != account:
+                continue
+            yield record
+
+def iter_events(path, account=None):
+    """Yield the Google Calendar event payloads stored in an NDJSON file"""
+    for record in iter_ndjson(path, kind="event", account=account):
+        yield record["event"]
+
+def iter_checkouts(path, account=None):
+    """Yield checkout_data items (without the type/account fields) from an NDJSON file"""
+    for record in iter_ndjson(path, kind="checkout", account=account):
+        yield {key: value for key, value in record.items() if key not in ("type", "account")}
@@ -0,0 +1,293 @@
+"""
+Request governor for all OPAC traffic.
+
+The OPAC is a shared college server that slows down badly during exam
+season. Every OPAC request (opac_http.opac_request, and the aiohttp requests of
+multi_account.py) passes through one OpacGovernor, which:
+
+- caps in-flight requests with an AIMD limit. The limit grows by about one per
+  round of fast successes and shrinks by BACKOFF_RATIO on an error or when
+  latency rises well above the no-load baseline. A healthy OPAC therefore
+  gets full concurrency, and a struggling one sees the load drop quickly.
+- trips a circuit breaker when most recent requests failed. While it is open,
+  requests fail at once with OpacUnavailableError instead of piling on. After
+  a cool-down a single probe request is let through (half-open state).
+- retries connection errors, timeouts, 429 and 5xx responses with jittered
+  exponential backoff, honouring Retry-After. POST requests are only retried
+  when the server refused them outright (429/503).
+
+Environment variables:
+    OPAC_MAX_CONCURRENCY   upper bound of the AIMD limit (default 16)
+    OPAC_MAX_RETRIES       retries per request (default 3)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+
+INITIAL_LIMIT = 4
+MIN_LIMIT = 1
+MAX_LIMIT = 16
+BACKOFF_RATIO = 0.7          # limit multiplier on congestion
+LATENCY_TOLERANCE = 2.0      # latency above baseline * tolerance counts as congestion
+MIN_SLOW_LATENCY = 0.25      # ...but never below this many seconds
+DECREASE_COOLDOWN = 1.0      # seconds between two multiplicative decreases
+
+BREAKER_WINDOW = 20          # recent outcomes considered by the circuit breaker
+BREAKER_MIN_CALLS = 10
+BREAKER_ERROR_RATE = 0.5
+BREAKER_RESET = 15.0         # seconds open before the first probe
+BREAKER_MAX_RESET = 300.0
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REFUSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+ASYNC_POLL_INTERVAL = 0.01
+
+class OpacUnavailableError(requests.RequestException):
+    """Raised without contacting the OPAC while the circuit breaker is open"""
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Return a 'full jitter' delay for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _retry_after(response):
+    """Return the Retry-After delay of a response in seconds, or None"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+def _status_of(response):
+    """Return the HTTP status of a requests or aiohttp response"""
+    return getattr(response, "status_code", None) or getattr(response, "status", None)
+
+class CircuitBreaker:
+    """Closed -> open when the recent error rate is too high -> half-open probe -> closed"""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, error_rate=BREAKER_ERROR_RATE,
+                 reset_timeout=BREAKER_RESET, max_reset_timeout=BREAKER_MAX_RESET):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = "closed"
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        """Return True if a request may be sent now (caller holds the governor lock)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_in(self):
+        """Seconds until the breaker lets a probe through"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def cancel_probe(self):
+        """Let another request probe if the half-open probe never finished"""
+        self._probing = False
+
+    def record(self, ok):
+        if self.state == "half_open":
+            if ok:
+                self.state = "closed"
+                self.reset_timeout = self.base_reset_timeout
+                self._outcomes.clear()
+            else:
+                # Still unhealthy: stay away for longer each time
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+                self._trip()
+            return
+        self._outcomes.append(ok)
+        if self.state == "closed" and len(self._outcomes) >= self.min_calls:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.error_rate:
+                self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self.trips += 1
+        self._opened_at = time.monotonic()
+        self._probing = False
+
+class OpacGovernor:
+    """AIMD concurrency limit + circuit breaker + jittered retries, shared by threads and asyncio tasks"""
+
+    def __init__(self, initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT,
+                 max_retries=MAX_RETRIES, breaker=None):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.stats = {"requests": 0, "errors": 0, "retries": 0, "rejected": 0, "decreases": 0}
+
+    # Admission
+
+    def _try_enter(self):
+        """Take an in-flight slot if the breaker and the limit allow it (caller holds the lock)"""
+        if self.in_flight >= int(self.limit):
+            return False
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise OpacUnavailableError(
+                f"OPAC circuit breaker is open; retrying in {self.breaker.retry_in():.0f}s"
+            )
+        self.in_flight += 1
+        return True
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        with self._cond:
+            while not self._try_enter():
+                self._cond.wait()
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a request may be sent"""
+        while True:
+            with self._cond:
+                if self._try_enter():
+                    return
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+    def release(self, latency, ok):
+        """Free the slot and adapt the limit to the outcome of the request"""
+        with self._cond:
+            self.in_flight -= 1
+            self.stats["requests"] += 1
+            self.breaker.record(ok)
+            now = time.monotonic()
+            if ok:
+                # The baseline follows drops at once but rises only slowly
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    self.baseline += (latency - self.baseline) * 0.01
+            else:
+                self.stats["errors"] += 1
+            slow = ok and latency > max(self.baseline * LATENCY_TOLERANCE, MIN_SLOW_LATENCY)
+            if not ok or slow:
+                # One decrease per cooldown, so a burst of failures of the same window counts once
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self.limit = max(self.min_limit, self.limit * BACKOFF_RATIO)
+                    self._last_decrease = now
+                    self.stats["decreases"] += 1
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow while the current limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def abandon(self):
+        """Free the slot of a request that was cancelled, without judging the OPAC by it"""
+        with self._cond:
+            self.in_flight -= 1
+            self.breaker.cancel_probe()
+            self._cond.notify_all()
+
+    # Retry policy
+
+    def _should_retry(self, method, response, error, attempt):
+        if attempt >= self.max_retries:
+            return False
+        status = _status_of(response) if response is not None else None
+        if method.upper() in IDEMPOTENT_METHODS:
+            return error is not None or status in RETRY_STATUSES
+        return status in REFUSED_STATUSES
+
+    def _retry_delay(self, response, attempt):
+        delay = backoff_delay(attempt)
+        retry_after = _retry_after(response)
+        return max(delay, min(retry_after, BACKOFF_CAP)) if retry_after is not None else delay
+
+    @staticmethod
+    def _is_ok(response):
+        status = _status_of(response)
+        return status is not None and status not in RETRY_STATUSES
+
+    def call(self, send, method="GET"):
+        """Run send() (which returns a response) under the governor, retrying transient failures"""
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.monotonic()
+            response = error = None
+            try:
+                response = send()
+            except Exception as e:
+                error = e
+            self.release(time.monotonic() - start, error is None and self._is_ok(response))
+            if not self._should_retry(method, response, error, attempt):
+                if error is not None:
+                    raise error
+                return response
+            with self._cond:
+                self.stats["retries"] += 1
+            time.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+    async def call_async(self, send, method="GET"):
+        """Async version of call(); send is a coroutine function returning a response"""
+        attempt = 0
+        while True:
+            await self.acquire_async()
+            start = time.monotonic()
+            response = error = None
+            try:
+                response = await send()
+            except asyncio.CancelledError:
+                self.abandon()
+                raise
+            except Exception as e:
+                error = e
+            self.release(time.monotonic() - start, error is None and self._is_ok(response))
+            if not self._should_retry(method, response, error, attempt):
+                if error is not None:
+                    raise error
+                return response
+            with self._cond:
+                self.stats["retries"] += 1
+            await asyncio.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+    def snapshot(self):
+        """Return the current limit, breaker state and counters"""
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+                "breaker": self.breaker.state,
+                "trips": self.breaker.trips,
+                **self.stats
+            }
+
+GOVERNOR = OpacGovernor(
+    max_limit=int(os.environ.get("OPAC_MAX_CONCURRENCY", MAX_LIMIT)),
+    max_retries=int(os.environ.get("OPAC_MAX_RETRIES", MAX_RETRIES)),
+)
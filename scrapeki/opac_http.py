@@ -0,0 +1,209 @@
+"""
+Browserless scraping engine for DTU Library checkouts.
+
+Logs into the Koha OPAC by posting the login form on a persistent
+requests.Session and parses the #checkoutst table offline with
+BeautifulSoup. No browser is started, so one scrape takes well under a
+second and a few MB of memory. If the HTTP engine fails (for example
+because the page suddenly needs JavaScript), main() falls back to the
+Selenium scraper in scrp.py.
+
+Prerequisites:
+1. Install dependencies: pip install requests beautifulsoup4
+2. Run this script: python scrapeki/opac_http.py
+"""
+
+import os
+import sys
+import runpy
+import time
+from urllib.parse import urljoin
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from checkout_parser import (
+    build_records,
+    extract_checkout_rows,
+    is_logged_in,
+    make_soup,
+    save_checkout_files,
+)
+from opac_governor import GOVERNOR
+
+OPAC_BASE_URL = os.environ.get("OPAC_BASE_URL", "https://dtu.bestbookbuddies.com/cgi-bin/koha")
+OPAC_USER_URL = f"{OPAC_BASE_URL}/opac-user.pl"
+
+# Login credentials
+USERNAME = "22234325"
+PASSWORD = "1234"
+
+REQUEST_TIMEOUT = 20
+USER_AGENT = "Mozilla/5.0 (compatible; DTU-Library-Reminder/1.0)"
+
+USERNAME_FIELDS = ["login_userid", "userid", "username", "cardnumber"]
+PASSWORD_FIELDS = ["login_password", "password"]
+
+class OpacLoginError(Exception):
+    """Raised when the login form cannot be found or the OPAC rejects the credentials"""
+
+def new_session():
+    """Create a requests.Session with keep-alive and a browser-like User-Agent"""
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+def opac_request(session, method, url, **kwargs):
+    """Send one request to the OPAC and return the response (all OPAC traffic goes through here)
+
+    The request runs under the shared OpacGovernor: it may wait for a
+    concurrency slot, is retried on transient failures, and raises
+    OpacUnavailableError at once while the circuit breaker is open.
+    """
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    response = GOVERNOR.call(lambda: session.request(method, url, **kwargs), method)
+    response.raise_for_status()
+    return response
+
+def build_login_payload(html, username, password, page_url=OPAC_USER_URL):
+    """Return (action_url, form_data) for the Koha login form found in html"""
+    soup = make_soup(html)
+    password_input = soup.select_one("form input[type='password']")
+    form = password_input.find_parent("form") if password_input else None
+    if form is None:
+        raise OpacLoginError("Could not find the login form on the OPAC page")
+
+    payload = {}
+    # Keep hidden fields such as koha_login_context, op and csrf_token
+    for hidden in form.select("input[type='hidden'][name]"):
+        payload[hidden["name"]] = hidden.get("value", "")
+
+    username_name = None
+    username_input = form.select_one("input#userid[name]")
+    if username_input is not None:
+        username_name = username_input["name"]
+    else:
+        for name in USERNAME_FIELDS:
+            if form.select_one(f"input[name='{name}']"):
+                username_name = name
+                break
+    if username_name is None:
+        raise OpacLoginError("Could not find username field with id='userid' or name='login_userid'")
+
+    password_name = password_input.get("name")
+    if not password_name:
+        for name in PASSWORD_FIELDS:
+            if form.select_one(f"input[name='{name}']"):
+                password_name = name
+                break
+    if not password_name:
+        raise OpacLoginError("Could not find password field with id='password' or name='login_password'")
+
+    payload[username_name] = username
+    payload[password_name] = password
+
+    submit = form.select_one("input[type='submit'][name], button[type='submit'][name]")
+    if submit is not None:
+        payload[submit["name"]] = submit.get("value", "")
+
+    action_url = urljoin(page_url, form.get("action") or page_url)
+    return action_url, payload
+
+def fetch_patron_page(session, username, password, headers=None):
+    """Log in if needed and return the opac-user.pl response
+
+    headers can carry If-None-Match/If-Modified-Since; the response is then a
+    304 with no body when the page has not changed.
+    """
+    page = opac_request(session, "GET", OPAC_USER_URL, headers=headers)
+    if page.status_code == 304 or is_logged_in(make_soup(page.text)):
+        return page
+
+    action_url, payload = build_login_payload(page.text, username, password, page.url)
+    response = opac_request(session, "POST", action_url, data=payload)
+    if not is_logged_in(make_soup(response.text)):
+        raise OpacLoginError(f"Login failed for account '{username}'")
+
+    # Koha normally renders the patron page straight after login
+    if "checkoutst" not in response.text and "opac-user.pl" not in response.url:
+        response = opac_request(session, "GET", OPAC_USER_URL)
+    return response
+
+def login(session, username, password):
+    """Log into the OPAC on the given session and return the HTML of opac-user.pl"""
+    return fetch_patron_page(session, username, password).text
+
+def scrape_account(username, password, session=None, session_store=None):
+    """Scrape one account over plain HTTP and return (checkout_data, calendar_events)"""
+    if session is None:
+        session = new_session()
+    if session_store is not None:
+        html = session_store.login(session, username, password)
+    else:
+        html = login(session, username, password)
+    return build_records(extract_checkout_rows(make_soup(html)), username)
+
+def run_selenium_fallback():
+    """Run the Selenium scraper (scrp.py) as a fallback and return its results"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    namespace = runpy.run_path(os.path.join(script_dir, "scrp.py"), run_name="__main__")
+    return namespace.get("checkout_data", []), namespace.get("calendar_events", [])
+
+def main():
+    print("=" * 60)
+    print("DTU Library HTTP Scraper")
+    print("=" * 60)
+
+    # Reuse the saved login session when the optional cache is available
+    try:
+        from session_store import SessionStore
+        session_store = SessionStore()
+    except ImportError:
+        session_store = None
+
+    # Imported here because change_detect and library_store build on this module
+    from change_detect import ChangeTracker, scrape_if_changed
+    from library_store import EXPORT_FILES, LibraryStore
+    tracker = ChangeTracker()
+
+    start = time.perf_counter()
+    try:
+        result = scrape_if_changed(USERNAME, PASSWORD, tracker, session_store=session_store)
+        print(f"✓ Polled account over HTTP in {time.perf_counter() - start:.2f}s")
+    except (requests.RequestException, OpacLoginError) as e:
+        print(f"✗ HTTP engine failed: {e}")
+        print("Falling back to the Selenium scraper (scrp.py)...")
+        run_selenium_fallback()
+        return
+
+    store = LibraryStore()
+    if result["status"] == "unchanged":
+        store.record_unchanged(USERNAME, engine="http")
+        store.close()
+        tracker.confirm(result)
+        print("✓ Checkouts unchanged since last run - output files left as they are")
+        return
+
+    checkout_data = result["checkout_data"]
+    calendar_events = result["calendar_events"]
+
+    store.record_scrape(USERNAME, checkout_data, calendar_events, engine="http")
+    store.close()
+    print(f"✓ Stored in: {store.path}")
+    if EXPORT_FILES:
+        output_dir = os.path.dirname(os.path.abspath(__file__))
+        for path in save_checkout_files(output_dir, checkout_data, calendar_events):
+            print(f"✓ Saved: {path}")
+    tracker.confirm(result)
+
+    print("\n" + "=" * 60)
+    print("Summary")
+    print("=" * 60)
+    print(f"Total items checked out: {len(checkout_data)}")
+    print(f"Calendar events created: {len(calendar_events)}")
+    for i, item in enumerate(checkout_data, 1):
+        print(f"  {i}. {item['title']}")
+        print(f"     Due: {item['due_date']}")
+
+if __name__ == '__main__':
+    main()
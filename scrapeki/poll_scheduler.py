@@ -0,0 +1,183 @@
+"""
+Adaptive polling daemon for DTU Library accounts.
+
+Instead of polling every account on the same clock, the scheduler keeps a
+priority queue of accounts keyed by their next poll time. How soon an
+account is polled again depends on its nearest due date:
+
+    overdue or due within 48 hours   every 30 minutes
+    due within 7 days                every 4 hours
+    due later                        every 12 hours
+    no books checked out             every 2 days
+
+Every interval gets random jitter so accounts do not bunch up, and a global
+token bucket caps the request rate to the OPAC. Polls use change detection,
+so an unchanged account costs one lightweight request and rewrites nothing.
+
+Usage: python scrapeki/poll_scheduler.py accounts.json --rate-per-minute 30
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from change_detect import ChangeTracker, scrape_if_changed
+from checkout_parser import parse_date, save_checkout_files
+from library_store import EXPORT_FILES, LibraryStore
+from multi_account import load_accounts
+from opac_http import OpacLoginError
+from rate_limit import TokenBucket
+
+URGENT_WINDOW = timedelta(hours=48)
+SOON_WINDOW = timedelta(days=7)
+
+URGENT_INTERVAL = 30 * 60
+SOON_INTERVAL = 4 * 3600
+DISTANT_INTERVAL = 12 * 3600
+NO_LOANS_INTERVAL = 48 * 3600
+UNKNOWN_INTERVAL = 3600
+ERROR_INTERVAL = 15 * 60
+
+JITTER = 0.1
+DEFAULT_RATE_PER_MINUTE = 30
+
+def soonest_due(checkout_data):
+    """Return the earliest due datetime among the checkouts, or None"""
+    due_dates = [
+        parse_date(item["due_date"])
+        for item in checkout_data
+        if item.get("due_date") and item["due_date"] != "N/A"
+    ]
+    due_dates = [dt for dt in due_dates if dt is not None]
+    return min(due_dates) if due_dates else None
+
+def poll_interval(checkout_data, now=None):
+    """Return the base seconds until the next poll for an account with these checkouts"""
+    if checkout_data is None:
+        return UNKNOWN_INTERVAL
+    if not checkout_data:
+        return NO_LOANS_INTERVAL
+    due = soonest_due(checkout_data)
+    if due is None:
+        return UNKNOWN_INTERVAL
+    remaining = due - (now or datetime.now())
+    if remaining <= URGENT_WINDOW:
+        return URGENT_INTERVAL
+    if remaining <= SOON_WINDOW:
+        return SOON_INTERVAL
+    return DISTANT_INTERVAL
+
+def with_jitter(seconds, jitter=JITTER):
+    """Spread a delay by +/- jitter so accounts do not poll in lockstep"""
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+class PollScheduler:
+    """Priority queue of accounts ordered by next poll time"""
+
+    def __init__(self, accounts, rate_per_minute=DEFAULT_RATE_PER_MINUTE, output_dir=None,
+                 session_store=None, tracker=None, startup_spread=60):
+        self.accounts = {acc["username"]: acc["password"] for acc in accounts}
+        self.bucket = TokenBucket(rate_per_minute / 60.0, capacity=1)
+        self.output_dir = output_dir
+        self.session_store = session_store
+        self.tracker = tracker or ChangeTracker()
+        self.store = LibraryStore()
+        self._queue = []
+        self._counter = itertools.count()
+        self._last_checkouts = {}
+
+        # Spread the first round of polls instead of starting them all at once
+        now = time.time()
+        for username in self.accounts:
+            self.schedule(username, now + random.uniform(0, startup_spread))
+
+    def schedule(self, username, when):
+        """Queue the account's next poll at the given epoch time"""
+        heapq.heappush(self._queue, (when, next(self._counter), username))
+
+    def poll(self, username):
+        """Poll one account now and return (result, seconds until its next poll)"""
+        try:
+            result = scrape_if_changed(
+                username, self.accounts[username], self.tracker, session_store=self.session_store
+            )
+        except (requests.RequestException, OpacLoginError) as e:
+            self.store.record_failure(username, "http", e)
+            return {"username": username, "status": "error", "error": str(e)}, with_jitter(ERROR_INTERVAL)
+
+        if result["checkout_data"] is not None:
+            self._last_checkouts[username] = result["checkout_data"]
+            self.store.record_scrape(username, result["checkout_data"], result["calendar_events"], engine="http")
+        else:
+            self.store.record_unchanged(username, engine="http")
+        if result["status"] == "changed" and self.output_dir and EXPORT_FILES:
+            account_dir = os.path.join(self.output_dir, username)
+            os.makedirs(account_dir, exist_ok=True)
+            save_checkout_files(account_dir, result["checkout_data"], result["calendar_events"])
+        self.tracker.confirm(result)
+
+        checkouts = self._last_checkouts.get(username)
+        if checkouts is None and self.store.has_account(username):
+            # A 304 right after a restart: fall back to the loans stored last time
+            checkouts = self.store.load_checkouts(username)
+        return result, with_jitter(poll_interval(checkouts))
+
+    def run_once(self):
+        """Wait for the next due account, poll it and reschedule it"""
+        when, _, username = heapq.heappop(self._queue)
+        delay = when - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self.bucket.acquire()
+
+        result, next_in = self.poll(username)
+        self.schedule(username, time.time() + next_in)
+
+        next_at = datetime.now() + timedelta(seconds=next_in)
+        status = result["status"]
+        symbol = {"changed": "✓", "unchanged": "=", "error": "✗"}.get(status, "?")
+        detail = f" ({result['error']})" if status == "error" else ""
+        print(f"{symbol} {username}: {status}{detail} - next poll {next_at:%d/%m %H:%M}")
+        return result
+
+    def run_forever(self):
+        """Poll accounts until interrupted"""
+        while self._queue:
+            self.run_once()
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll DTU Library accounts adaptively by due date")
+    parser.add_argument("accounts", help="JSON or CSV file with username/password pairs")
+    parser.add_argument("--rate-per-minute", type=float, default=DEFAULT_RATE_PER_MINUTE,
+                        help="global cap on OPAC polls per minute")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts"),
+                        help="directory for per-account output files")
+    args = parser.parse_args()
+
+    try:
+        from session_store import SessionStore
+        session_store = SessionStore()
+    except ImportError:
+        session_store = None
+
+    accounts = load_accounts(args.accounts)
+    print("=" * 60)
+    print(f"DTU Library Poll Scheduler ({len(accounts)} accounts, {args.rate_per_minute:g} polls/min)")
+    print("=" * 60)
+
+    scheduler = PollScheduler(accounts, args.rate_per_minute, args.output_dir, session_store)
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        print("\nScheduler stopped.")
+
+if __name__ == '__main__':
+    main()
@@ -5,23 +5,39 @@ and format them for Google Calendar API reminders.
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from time import sleep
-import json
 import os
-import csv
 from datetime import datetime, timedelta
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bulk_extract import DEFAULT_EXTRACTION_MODE, extract_rows
+from change_detect import ChangeTracker, fingerprint_records
+from checkout_parser import add_event_identity, save_checkout_files
+from library_store import EXPORT_FILES, LibraryStore
+from ndjson_stream import NDJSONWriter
+from snapshot_archive import SNAPSHOTS_ENABLED, save_snapshot
+from waits import BudgetedWait, RunBudget, debug_pause, wait_for_checkouts, wait_for_login_form, wait_for_login_redirect
 
 # Login credentials
 username = "22234325"
 password = "1234"
 
+# Row extraction: "script" (one execute_script call), "page_source" or "elements"
+EXTRACTION_MODE = DEFAULT_EXTRACTION_MODE
+
+# Optional NDJSON stream: every checkout and event is appended as soon as it is extracted
+NDJSON_PATH = os.environ.get("SCRAPER_NDJSON")
+ndjson = NDJSONWriter(NDJSON_PATH) if NDJSON_PATH else None
+
+# Per-run time budget: every wait below stops when it runs out
+budget = RunBudget()
+
 # Initialize the WebDriver
 driver = webdriver.Chrome()
 driver.get("https://dtu.bestbookbuddies.com/cgi-bin/koha/opac-user.pl")
 
-wait = WebDriverWait(driver, 20)
+wait = BudgetedWait(driver, budget, 20)
 
 def parse_date(date_str):
     """Parse date string from format 'DD/MM/YYYY HH:MM' or 'DD/MM/YYYY' and return datetime object"""
@@ -52,7 +68,7 @@ try:
     print("=" * 60)
     print(f"Page: {driver.title}")
     
-    sleep(2)  # Wait for page to load
+    wait_for_login_form(wait)
     
     # Find username field using specific selectors: id="userid" or name="login_userid"
     print("Finding username field...")
@@ -70,11 +86,9 @@ try:
     # Enter username
     wait.until(EC.element_to_be_clickable(username_field))
     driver.execute_script("arguments[0].scrollIntoView(true);", username_field)
-    sleep(0.5)
     
     try:
         username_field.click()
-        sleep(0.3)
         username_field.clear()
         username_field.send_keys(username)
         print(f"✓ Username '{username}' entered")
@@ -100,11 +114,9 @@ try:
     
     wait.until(EC.element_to_be_clickable(password_field))
     driver.execute_script("arguments[0].scrollIntoView(true);", password_field)
-    sleep(0.5)
     
     try:
         password_field.click()
-        sleep(0.3)
         password_field.clear()
         password_field.send_keys(password)
         print("✓ Password entered")
@@ -118,35 +130,37 @@ try:
     # Find and click login button: <input type="submit" value="Log in" class="btn btn-primary">
     print("Finding login button...")
     login_button = None
+    # The form is already loaded, so each fallback selector only needs a short wait
+    form_wait = BudgetedWait(driver, budget, 2)
     try:
         # First try: Exact match - input with type="submit", class="btn btn-primary", value="Log in"
         try:
-            login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary[value='Log in']")))
+            login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary[value='Log in']")))
             print("✓ Found login button: input[type='submit'].btn.btn-primary[value='Log in']")
         except:
             # Second try: Find by class and value (without type check)
             try:
-                login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input.btn.btn-primary[value='Log in']")))
+                login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input.btn.btn-primary[value='Log in']")))
                 print("✓ Found login button: input.btn.btn-primary[value='Log in']")
             except:
                 # Third try: Find button inside fieldset.action
                 try:
-                    login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'].btn.btn-primary[value='Log in']")))
+                    login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'].btn.btn-primary[value='Log in']")))
                     print("✓ Found login button inside fieldset.action")
                 except:
                     # Fourth try: Find by fieldset.action and button attributes
                     try:
-                        login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'][value='Log in']")))
+                        login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit'][value='Log in']")))
                         print("✓ Found login button in fieldset.action by value")
                     except:
                         # Fifth try: Find button inside fieldset.action (any submit button)
                         try:
-                            login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit']")))
+                            login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "fieldset.action input[type='submit']")))
                             print("✓ Found login button in fieldset.action")
                         except:
                             # Sixth try: Find by class only
                             try:
-                                login_button = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary")))
+                                login_button = form_wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='submit'].btn.btn-primary")))
                                 print("✓ Found login button by class")
                             except:
                                 # Seventh try: Find by value attribute (search all submit buttons)
@@ -168,8 +182,7 @@ try:
         # Wait for button to be clickable
         wait.until(EC.element_to_be_clickable(login_button))
         # Scroll button into view
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'smooth'});", login_button)
-        sleep(1)
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", login_button)
         
         # Try multiple click methods
         clicked = False
@@ -213,8 +226,8 @@ try:
     else:
         raise Exception("Login button not found")
     
-    # Wait for login to complete
-    sleep(3)
+    # Wait for the post-login redirect to the patron page
+    wait_for_login_redirect(driver, wait, login_button)
     print("✓ Login successful!\n")
     
     # Step 2: Extract tabular data from dashboard
@@ -222,17 +235,14 @@ try:
     print("Extracting Book Names and Due Dates")
     print("=" * 60)
     
-    # Wait for dashboard to load and checkouts table to appear
-    print("Waiting for dashboard to load...")
-    sleep(3)
-    
-    # Wait for checkouts table
-    checkout_table = wait.until(EC.presence_of_element_located((By.ID, "checkoutst")))
+    # Wait for the checkouts table to be rendered
+    print("Waiting for checkouts table...")
+    checkout_table = wait_for_checkouts(wait)
     print("✓ Found checkouts table")
     
-    # Find all rows in tbody
-    rows = checkout_table.find_elements(By.CSS_SELECTOR, "tbody tr")
-    print(f"✓ Found {len(rows)} checked out items\n")
+    # Pull every row (all DataTables pages) in one round trip instead of one per cell
+    rows = extract_rows(driver, EXTRACTION_MODE)
+    print(f"✓ Found {len(rows)} checked out items ({EXTRACTION_MODE} extraction)\n")
     
     checkout_data = []
     calendar_events = []
@@ -240,55 +250,21 @@ try:
     # Extract data from each row
     for i, row in enumerate(rows, 1):
         try:
-            # Extract book name from <span class="biblio-title">
-            try:
-                title_elem = row.find_element(By.CSS_SELECTOR, "span.biblio-title")
-                title = title_elem.text.strip()
-                print(f"Item {i}: {title}")
-            except Exception as e:
-                print(f"✗ Could not find book title in row {i}: {e}")
-                title = f"Book {i}"
+            title = row["title"]
+            print(f"Item {i}: {title}")
             
-            # Extract due date from the "Due" column
-            # The Due column has class containing "dt-type-date"
-            # We need to find the td in the same column position as the "Due" header
-            try:
-                # Find the Due date cell - it's in a column with date_due class
-                due_date_elem = row.find_element(By.CSS_SELECTOR, "td.date_due")
-                due_date_str = due_date_elem.text.strip()
+            due_date_str = row.get("due_date")
+            if due_date_str:
                 print(f"  Due date: {due_date_str}")
-            except:
-                # Alternative: try to find by data-order attribute or by position
-                try:
-                    # Find all date cells in the row
-                    date_cells = row.find_elements(By.CSS_SELECTOR, "td[class*='date'], td[data-order]")
-                    # The due date is typically the last date column
-                    if date_cells:
-                        due_date_elem = date_cells[-1]  # Last date cell is usually due date
-                        due_date_str = due_date_elem.text.strip()
-                        print(f"  Due date: {due_date_str}")
-                    else:
-                        raise Exception("No date cells found")
-                except Exception as e:
-                    print(f"✗ Could not find due date in row {i}: {e}")
-                    due_date_str = None
+            else:
+                print(f"✗ Could not find due date in row {i}")
             
-            # Extract checkout date if available (optional)
-            checkout_date_str = None
-            try:
-                checkout_date_elem = row.find_element(By.CSS_SELECTOR, "td.checkout_date")
-                checkout_date_str = checkout_date_elem.text.strip()
+            # Checkout date is optional
+            checkout_date_str = row.get("checkout_date")
+            if checkout_date_str:
                 print(f"  Checkout date: {checkout_date_str}")
-            except:
-                pass  # Checkout date is optional
             
-            # Extract author if available (optional)
-            author = "N/A"
-            try:
-                author_elem = row.find_element(By.CSS_SELECTOR, "td.author")
-                author = author_elem.text.strip()
-            except:
-                pass
+            author = row.get("author") or "N/A"
             
             # Parse due date
             due_date_dt = None
@@ -303,6 +279,8 @@ try:
                 "due_date": due_date_str if due_date_str else "N/A"
             }
             checkout_data.append(item_data)
+            if ndjson is not None:
+                ndjson.write_checkout(username, item_data)
             
             # Create Google Calendar event only if we have a valid due date
             if due_date_dt:
@@ -330,7 +308,11 @@ try:
                         ]
                     }
                 }
+                # Deterministic iCalUID + private checkoutKey, so calendar upserts are idempotent
+                add_event_identity(calendar_event, username, item_data)
                 calendar_events.append(calendar_event)
+                if ndjson is not None:
+                    ndjson.write_event(username, calendar_event)
                 print(f"  ✓ Calendar event created")
             else:
                 print(f"  ✗ Skipped calendar event (no valid due date)")
@@ -345,50 +327,42 @@ try:
     
     print(f"\n✓ Extracted {len(checkout_data)} items")
     
+    # Keep the raw page so parser changes can be replayed against it offline
+    if SNAPSHOTS_ENABLED:
+        snapshot_path = save_snapshot(driver.page_source, username, checkout_data, "selenium", driver.current_url)
+        print(f"✓ Page snapshot saved to: {snapshot_path}")
+    
     # Step 3: Save data for Google Calendar API
     print("\n" + "=" * 60)
     print("Saving Data for Google Calendar API")
     print("=" * 60)
     
-    # Save calendar events JSON
-    calendar_json = {
-        "events": calendar_events,
-        "metadata": {
-            "total_events": len(calendar_events),
-            "extracted_at": datetime.now().isoformat(),
-            "source": "DTU Library Checkouts"
-        }
-    }
-    
-    # Save calendar events JSON to scrapeki folder
     output_dir = os.path.dirname(os.path.abspath(__file__))
     json_filename = os.path.join(output_dir, "library_due_dates.json")
-    with open(json_filename, 'w', encoding='utf-8') as f:
-        json.dump(calendar_json, f, indent=2, ensure_ascii=False)
-    print(f"✓ Calendar events saved to: {json_filename}")
     
-    # Save raw data to scrapeki folder
-    raw_data_filename = os.path.join(output_dir, "library_checkout_data.json")
-    with open(raw_data_filename, 'w', encoding='utf-8') as f:
-        json.dump({
-            "checkout_data": checkout_data,
-            "extracted_at": datetime.now().isoformat()
-        }, f, indent=2, ensure_ascii=False)
-    print(f"✓ Raw checkout data saved to: {raw_data_filename}")
+    # The database is always updated; it only touches this account's rows
+    store = LibraryStore()
+    store.record_scrape(username, checkout_data, calendar_events, engine="selenium")
+    store.close()
+    print(f"✓ Checkouts stored in: {store.path}")
     
-    # Also save a simple CSV file for easy viewing
-    csv_filename = os.path.join(output_dir, "library_books.csv")
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Title", "Author", "Checkout Date", "Due Date"])
-        for item in checkout_data:
-            writer.writerow([
-                item['title'],
-                item['author'],
-                item['checkout_date'],
-                item['due_date']
-            ])
-    print(f"✓ CSV data saved to: {csv_filename}")
+    # Skip rewriting the files when the loans are exactly the same as last run
+    tracker = ChangeTracker()
+    fingerprint = fingerprint_records(checkout_data)
+    changed = tracker.is_changed(username, fingerprint)
+    if not EXPORT_FILES:
+        print("⊘ JSON/CSV export disabled (LIBRARY_EXPORT_FILES=0)")
+    elif not changed and os.path.exists(json_filename):
+        print("✓ Checkouts unchanged since last run - output files left as they are")
+    else:
+        json_filename, raw_data_filename, csv_filename = save_checkout_files(
+            output_dir, checkout_data, calendar_events
+        )
+        print(f"✓ Calendar events saved to: {json_filename}")
+        print(f"✓ Raw checkout data saved to: {raw_data_filename}")
+        print(f"✓ CSV data saved to: {csv_filename}")
+    # Only remembered once the files are written, so a failed write is retried next run
+    tracker.update(username, fingerprint)
     
     # Display summary
     print("\n" + "=" * 60)
@@ -405,22 +379,19 @@ try:
         print(f"  ... and {len(calendar_events) - 3} more events")
     
     print("\n✓ Data ready for Google Calendar API!")
-    print("\n" + "=" * 60)
-    print("Browser will stay open for 30 seconds for verification...")
-    print("You can manually close it or wait for auto-close.")
-    print("=" * 60)
-    sleep(30)  # Keep browser open for 30 seconds
+    print(f"\n✓ Finished in {budget.elapsed():.1f}s")
+    debug_pause(30, "for verification")
     
 except Exception as e:
     print(f"\n✗ An error occurred: {e}")
     import traceback
     traceback.print_exc()
-    print("\n" + "=" * 60)
-    print("Browser will stay open for 30 seconds for debugging...")
-    print("=" * 60)
-    sleep(30)  # Keep browser open for debugging
+    debug_pause(30, "for debugging")
 
 finally:
+    if ndjson is not None:
+        ndjson.close()
+        print(f"✓ Streamed {ndjson.count} records to: {NDJSON_PATH}")
     print("\nClosing browser...")
     driver.close()
     print("✓ Browser closed")
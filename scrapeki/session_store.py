@@ -0,0 +1,112 @@
+"""
+Encrypted on-disk cache of Koha OPAC login sessions.
+
+Logging in costs a form POST and the heaviest page load of a scrape. This
+store keeps each account's Koha session cookie (CGISESSID) encrypted on
+disk and reuses it on the next run. The cookie is validated by the normal
+GET of opac-user.pl, which the scrape needs anyway, so a still-valid
+session costs no extra request; the account only logs in again once Koha
+has expired the session.
+
+The encryption key comes from the OPAC_SESSION_KEY environment variable
+(a Fernet key) or is generated once into scrapeki/.session_key.
+
+Prerequisites: pip install cryptography
+"""
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from cryptography.fernet import Fernet, InvalidToken
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from opac_http import fetch_patron_page
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SESSION_DIR = os.path.join(SCRIPT_DIR, "sessions")
+DEFAULT_KEY_FILE = os.path.join(SCRIPT_DIR, ".session_key")
+
+def _write_private(path, data):
+    """Atomically write bytes to a file readable only by the current user"""
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def load_key(key_file=DEFAULT_KEY_FILE):
+    """Return the Fernet key from OPAC_SESSION_KEY or the key file, creating it if needed"""
+    env_key = os.environ.get("OPAC_SESSION_KEY")
+    if env_key:
+        return env_key.encode()
+    if os.path.exists(key_file):
+        with open(key_file, 'rb') as f:
+            return f.read().strip()
+    key = Fernet.generate_key()
+    _write_private(key_file, key)
+    return key
+
+class SessionStore:
+    """Per-account encrypted cookie cache"""
+
+    def __init__(self, directory=DEFAULT_SESSION_DIR, key=None):
+        self.directory = directory
+        self._fernet = Fernet(key or load_key())
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username):
+        # Hash the account name so card numbers do not appear in file names
+        digest = hashlib.sha256(username.encode()).hexdigest()[:24]
+        return os.path.join(self.directory, f"{digest}.session")
+
+    def load(self, username):
+        """Return the cached cookies for username, or None if missing or unreadable"""
+        path = self._path(username)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                record = json.loads(self._fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError):
+            return None
+        if record.get("username") != username:
+            return None
+        return record.get("cookies") or None
+
+    def save(self, username, cookies):
+        """Encrypt and store the cookies for username"""
+        record = {
+            "username": username,
+            "cookies": cookies,
+            "saved_at": datetime.now().isoformat()
+        }
+        _write_private(self._path(username), self._fernet.encrypt(json.dumps(record).encode()))
+
+    def delete(self, username):
+        """Forget the cached session for username"""
+        try:
+            os.remove(self._path(username))
+        except FileNotFoundError:
+            pass
+
+    def fetch_patron_page(self, session, username, password, headers=None):
+        """Return the opac-user.pl response, reusing the cached cookie while Koha still accepts it"""
+        cached = self.load(username)
+        if cached:
+            session.cookies.update(cached)
+
+        # The first GET of opac-user.pl doubles as the validity check for the cached cookie
+        response = fetch_patron_page(session, username, password, headers=headers)
+
+        cookies = requests.utils.dict_from_cookiejar(session.cookies)
+        if cookies != cached:
+            self.save(username, cookies)
+        return response
+
+    def login(self, session, username, password):
+        """Log in on a requests.Session with the cached cookie and return the HTML of opac-user.pl"""
+        return self.fetch_patron_page(session, username, password).text
@@ -0,0 +1,201 @@
+"""
+Archive of raw OPAC pages for offline re-parsing.
+
+With SCRAPER_SNAPSHOTS=1, every scrape saves a gzip-compressed snapshot of
+the opac-user.pl HTML together with the records the scraper extracted from
+it, under scrapeki/snapshots/YYYY-MM-DD/ (or SCRAPER_SNAPSHOT_DIR).
+
+The replay command re-parses every archived page with the current
+checkout_parser on a process pool and diffs the result against the stored
+records. Parser changes can then be regression-tested and timed against
+thousands of real pages in seconds. After a parser bug is fixed, --apply
+writes the re-parsed records of each account's newest snapshot back into
+the library database without re-scraping. Accounts whose loans changed after
+that snapshot was taken are skipped, so an old page never rolls them back.
+
+Usage:
+    python scrapeki/snapshot_archive.py replay --workers 4
+    python scrapeki/snapshot_archive.py replay --parser html.parser --show 5
+    python scrapeki/snapshot_archive.py replay --apply
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import checkout_parser
+from checkout_parser import parse_checkout_page
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SNAPSHOT_DIR = os.environ.get("SCRAPER_SNAPSHOT_DIR") or os.path.join(SCRIPT_DIR, "snapshots")
+SNAPSHOTS_ENABLED = os.environ.get("SCRAPER_SNAPSHOTS", "").lower() in ("1", "true", "yes")
+
+def save_snapshot(html, username, checkout_data, engine, url=None, directory=DEFAULT_SNAPSHOT_DIR):
+    """Write one compressed page snapshot with the records extracted from it and return its path"""
+    now = datetime.now()
+    day_dir = os.path.join(directory, now.strftime("%Y-%m-%d"))
+    os.makedirs(day_dir, exist_ok=True)
+    safe_name = re.sub(r"[^\w.-]", "_", username)
+    path = os.path.join(day_dir, f"{safe_name}-{now.strftime('%H%M%S%f')}-{engine}.json.gz")
+    snapshot = {
+        "account": username,
+        "engine": engine,
+        "url": url,
+        "captured_at": now.isoformat(),
+        "checkout_data": checkout_data,
+        "html": html
+    }
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    return path
+
+def load_snapshot(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+def iter_snapshot_paths(directory=DEFAULT_SNAPSHOT_DIR):
+    """Yield every snapshot path in the archive, oldest first"""
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if name.endswith(".json.gz"):
+                yield os.path.join(root, name)
+
+def _record_key(item):
+    return (" ".join((item.get("title") or "").split()).casefold(), item.get("checkout_date"))
+
+def diff_records(stored, reparsed):
+    """Return a list of human-readable differences between two checkout_data lists"""
+    differences = []
+    stored_by_key = {_record_key(item): item for item in stored}
+    reparsed_by_key = {_record_key(item): item for item in reparsed}
+    for key, item in stored_by_key.items():
+        other = reparsed_by_key.get(key)
+        if other is None:
+            differences.append(f"missing: {item.get('title')}")
+            continue
+        for field in sorted(set(item) | set(other)):
+            if item.get(field) != other.get(field):
+                differences.append(f"{item.get('title')}: {field} {item.get(field)!r} -> {other.get(field)!r}")
+    for key, item in reparsed_by_key.items():
+        if key not in stored_by_key:
+            differences.append(f"new: {item.get('title')}")
+    # Same keys but different multiplicity (e.g. two copies of one book)
+    if not differences and Counter(map(_record_key, stored)) != Counter(map(_record_key, reparsed)):
+        differences.append(f"row count {len(stored)} -> {len(reparsed)}")
+    return differences
+
+def _set_parser(parser):
+    """Process pool initializer: choose the BeautifulSoup parser for this worker"""
+    if parser:
+        checkout_parser.HTML_PARSER = parser
+
+def replay_snapshot(path):
+    """Re-parse one snapshot; runs in a worker process"""
+    # change_detect imports this module for save_snapshot
+    from change_detect import fingerprint_records
+    snapshot = load_snapshot(path)
+    start = time.perf_counter()
+    checkout_data, calendar_events = parse_checkout_page(snapshot["html"], snapshot["account"])
+    elapsed = time.perf_counter() - start
+    return {
+        "path": path,
+        "account": snapshot["account"],
+        "captured_at": snapshot["captured_at"],
+        "parse_seconds": elapsed,
+        "checkout_data": checkout_data,
+        "calendar_events": calendar_events,
+        "differences": diff_records(snapshot.get("checkout_data") or [], checkout_data),
+        "stored_fingerprint": fingerprint_records(snapshot.get("checkout_data") or [])
+    }
+
+def replay(directory=DEFAULT_SNAPSHOT_DIR, workers=None, parser=None):
+    """Re-parse the whole archive on a process pool, yielding one result per snapshot"""
+    paths = list(iter_snapshot_paths(directory))
+    if not paths:
+        return
+    chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_parser, initargs=(parser,)) as executor:
+        yield from executor.map(replay_snapshot, paths, chunksize=chunksize)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived OPAC pages through the current parser")
+    parser.add_argument("--dir", default=DEFAULT_SNAPSHOT_DIR, help="snapshot directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="re-parse every snapshot and diff against stored records")
+    replay_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    replay_parser.add_argument("--parser", choices=["lxml", "html.parser"],
+                               help="BeautifulSoup parser to use (default: lxml when installed)")
+    replay_parser.add_argument("--show", type=int, default=10, help="number of differing snapshots to print")
+    replay_parser.add_argument("--apply", action="store_true",
+                               help="store the re-parsed records of each account's newest snapshot in the database")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DTU Library Snapshot Replay")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    total = 0
+    differing = 0
+    parse_seconds = 0.0
+    newest = {}
+    for result in replay(args.dir, args.workers, args.parser):
+        total += 1
+        parse_seconds += result["parse_seconds"]
+        if result["differences"]:
+            differing += 1
+            if differing <= args.show:
+                print(f"✗ {os.path.relpath(result['path'], args.dir)} ({result['account']})")
+                for line in result["differences"][:5]:
+                    print(f"    {line}")
+        if args.apply:
+            current = newest.get(result["account"])
+            if current is None or result["captured_at"] > current["captured_at"]:
+                newest[result["account"]] = result
+
+    if total == 0:
+        print(f"No snapshots found in {args.dir} (scrape with SCRAPER_SNAPSHOTS=1 to collect them)")
+        return
+
+    elapsed = time.perf_counter() - start
+    print("\n" + "=" * 60)
+    print("Summary")
+    print("=" * 60)
+    print(f"Snapshots replayed: {total} in {elapsed:.2f}s ({total / elapsed:.0f} pages/s)")
+    print(f"Average parse time: {parse_seconds / total * 1000:.1f} ms per page")
+    print(f"✓ Identical: {total - differing}")
+    print(f"✗ Different: {differing}")
+
+    if args.apply and newest:
+        from library_store import LibraryStore
+        store = LibraryStore()
+        applied = 0
+        stale = []
+        for account, result in newest.items():
+            # Only a snapshot of the loans the database holds now may replace them;
+            # an older page would roll the account back and mark current loans returned
+            version = store.account_version(account)
+            last_scraped = store.last_scraped_at(account)
+            if version is not None and version[0] != result["stored_fingerprint"] \
+                    and last_scraped is not None and datetime.fromisoformat(result["captured_at"]) <= last_scraped:
+                stale.append(account)
+                continue
+            store.record_scrape(account, result["checkout_data"], result["calendar_events"], engine="replay")
+            applied += 1
+        store.close()
+        print(f"✓ Stored re-parsed records for {applied} accounts in {store.path}")
+        if stale:
+            print(f"⊘ Skipped {len(stale)} accounts whose loans changed after their newest snapshot "
+                  f"(re-scrape them instead): {', '.join(stale[:5])}{' ...' if len(stale) > 5 else ''}")
+
+if __name__ == '__main__':
+    main()
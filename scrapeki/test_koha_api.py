@@ -0,0 +1,132 @@
+"""
+Checks koha_api.py against fake_opac.py: the ILS-DI -> REST -> HTML fallback
+order, and that every source yields the same rows.
+
+Usage: python -m unittest scrapeki/test_koha_api.py
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import koha_api
+import opac_http
+from checkout_parser import checkout_key
+from fake_opac import FakeKoha, serve_in_thread
+
+USERNAME = "22234325"
+PASSWORD = "secret"
+
+class KohaApiFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        koha_api.KohaClient._disabled_until.clear()
+        self.koha = FakeKoha(checkouts=3, catalog_size=50)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        koha_api.KohaClient._disabled_until.clear()
+
+    def serve(self, ilsdi, rest):
+        """Point koha_api at a fresh fake OPAC with the given APIs enabled"""
+        server, base_url = serve_in_thread(port=0, koha=self.koha, ilsdi=ilsdi, rest=rest)
+        self.servers.append(server)
+        root_url = base_url.split("/cgi-bin/", 1)[0]
+        for patch in (
+            mock.patch.object(koha_api, "ILSDI_URL", f"{base_url}/ilsdi.pl"),
+            mock.patch.object(koha_api, "REST_API_URL", f"{root_url}/api/v1"),
+            mock.patch.object(opac_http, "OPAC_USER_URL", f"{base_url}/opac-user.pl"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        return server
+
+    def fetch(self):
+        client = koha_api.KohaClient(USERNAME, PASSWORD)
+        with mock.patch("builtins.print"):
+            rows = client.fetch_rows()
+        return client.source, rows
+
+    def expected_rows(self):
+        return [
+            {
+                "title": loan["title"],
+                "author": loan["author"],
+                "checkout_date": f"{loan['issuedate']:%d/%m/%Y %H:%M}",
+                "due_date": f"{loan['date_due']:%d/%m/%Y}"
+            }
+            for loan in self.koha.loans(USERNAME)
+        ]
+
+    def assert_rows(self, rows):
+        self.assertEqual([{name: row.get(name) for name in ("title", "author", "checkout_date", "due_date")}
+                          for row in rows], self.expected_rows())
+        self.assertEqual([row.get("biblionumber") for row in rows],
+                         [str(loan["biblionumber"]) for loan in self.koha.loans(USERNAME)])
+
+    def test_ilsdi_xml_first(self):
+        server = self.serve(ilsdi=True, rest=True)
+        source, rows = self.fetch()
+        self.assertEqual(source, "ilsdi")
+        self.assert_rows(rows)
+        self.assertNotIn("/api/v1/patrons", server.stats)
+
+    def test_rest_json_when_ilsdi_is_disabled(self):
+        server = self.serve(ilsdi=False, rest=True)
+        source, rows = self.fetch()
+        self.assertEqual(source, "rest")
+        self.assert_rows(rows)
+        self.assertNotIn("/cgi-bin/koha/opac-user.pl", server.stats)
+
+    def test_html_when_both_apis_are_disabled(self):
+        self.serve(ilsdi=False, rest=False)
+        source, rows = self.fetch()
+        self.assertEqual(source, "html")
+        self.assertEqual([row["title"] for row in rows], [row["title"] for row in self.expected_rows()])
+
+    def test_every_source_gives_the_same_checkout_keys(self):
+        keys = {}
+        for ilsdi, rest in ((True, False), (False, True), (False, False)):
+            koha_api.KohaClient._disabled_until.clear()
+            self.serve(ilsdi=ilsdi, rest=rest)
+            source, rows = self.fetch()
+            checkout_data, calendar_events = koha_api.build_records(rows, USERNAME)
+            keys[source] = [checkout_key(USERNAME, item) for item in checkout_data]
+            self.assertEqual([event["iCalUID"].split("@")[0] for event in calendar_events], keys[source])
+            if source == "html":
+                # opac-user.pl shows no copy ids, unlike the APIs
+                self.assertFalse(any("barcode" in row or "itemnumber" in row for row in rows))
+        self.assertEqual(keys["ilsdi"], keys["html"])
+        self.assertEqual(keys["rest"], keys["html"])
+
+    def test_disabled_api_is_skipped_by_other_clients_until_the_ttl_expires(self):
+        server = self.serve(ilsdi=False, rest=True)
+        self.fetch()
+        self.assertEqual(server.stats.get("/cgi-bin/koha/ilsdi.pl"), 1)
+
+        self.assertEqual(self.fetch()[0], "rest")
+        self.assertEqual(server.stats.get("/cgi-bin/koha/ilsdi.pl"), 1)
+
+        koha_api.KohaClient._disabled_until["ilsdi"] = time.monotonic() - 1
+        self.assertEqual(self.fetch()[0], "rest")
+        self.assertEqual(server.stats.get("/cgi-bin/koha/ilsdi.pl"), 2)
+
+    def test_passing_failure_only_affects_one_client(self):
+        server = self.serve(ilsdi=True, rest=True)
+        server.ilsdi = False
+        with mock.patch.object(koha_api, "ENDPOINT_MISSING_STATUSES", ()):
+            self.assertEqual(self.fetch()[0], "rest")
+        self.assertNotIn("ilsdi", koha_api.KohaClient._disabled_until)
+
+        server.ilsdi = True
+        self.assertEqual(self.fetch()[0], "ilsdi")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Condition-based waits and a per-run time budget for the Selenium scrapers.
+
+Replaces fixed sleep() calls: every wait returns as soon as the page is
+ready, and no wait can run past the run's overall time budget. The
+"keep the browser open" pauses only happen when SCRAPER_DEBUG_PAUSE is set.
+
+Environment variables:
+    SCRAPER_BUDGET_SECONDS  total time allowed for one scraper run (default 60)
+    SCRAPER_DEBUG_PAUSE     set to 1 to keep the browser open after a run
+"""
+
+import os
+import time
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+RUN_BUDGET_SECONDS = float(os.environ.get("SCRAPER_BUDGET_SECONDS", "60"))
+DEBUG_PAUSE = os.environ.get("SCRAPER_DEBUG_PAUSE", "").lower() in ("1", "true", "yes")
+POLL_FREQUENCY = 0.1
+
+LOGGED_IN_SELECTOR = "#checkoutst, .loggedinusername, a.logout, #logout"
+LOGIN_ERROR_SELECTOR = "#auth .alert, .alert-warning, .alert-danger"
+
+class BudgetExceeded(Exception):
+    """Raised when a scraper run uses up its time budget"""
+
+class RunBudget:
+    """Tracks the time left for one scraper run"""
+
+    def __init__(self, seconds=RUN_BUDGET_SECONDS):
+        self.seconds = seconds
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return self.seconds - self.elapsed()
+
+    def check(self, step):
+        """Abort the run if the budget is already spent"""
+        if self.remaining() <= 0:
+            raise BudgetExceeded(f"Time budget of {self.seconds:.0f}s exceeded during: {step}")
+
+class BudgetedWait(WebDriverWait):
+    """WebDriverWait whose timeout never runs past the run budget"""
+
+    def __init__(self, driver, budget, timeout=20, poll_frequency=POLL_FREQUENCY):
+        super().__init__(driver, timeout, poll_frequency=poll_frequency)
+        self._budget = budget
+        self._cap = float(timeout)
+
+    def until(self, method, message=""):
+        self._budget.check(message or "waiting for page")
+        self._timeout = max(POLL_FREQUENCY, min(self._cap, self._budget.remaining()))
+        return super().until(method, message)
+
+def wait_for_login_form(wait):
+    """Wait until the login form's username field is present and return it"""
+    return wait.until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "#userid, input[name='login_userid']")),
+        "login form"
+    )
+
+def wait_for_login_redirect(driver, wait, login_element):
+    """Wait for the page to leave the login form, then for the patron page or a login error"""
+    wait.until(EC.staleness_of(login_element), "post-login redirect")
+    wait.until(
+        EC.any_of(
+            EC.presence_of_element_located((By.CSS_SELECTOR, LOGGED_IN_SELECTOR)),
+            EC.presence_of_element_located((By.CSS_SELECTOR, LOGIN_ERROR_SELECTOR)),
+        ),
+        "patron page after login"
+    )
+    if not driver.find_elements(By.CSS_SELECTOR, LOGGED_IN_SELECTOR):
+        raise Exception("Login failed: the OPAC did not show the patron page")
+
+def wait_for_checkouts(wait):
+    """Wait until the #checkoutst table and its rows are rendered and return the table"""
+    table = wait.until(EC.presence_of_element_located((By.ID, "checkoutst")), "checkouts table")
+    wait.until(
+        lambda driver: driver.execute_script("return document.readyState") != "loading",
+        "checkouts table ready"
+    )
+    return table
+
+def debug_pause(seconds, reason="for verification"):
+    """Keep the browser open only when SCRAPER_DEBUG_PAUSE is set"""
+    if not DEBUG_PAUSE:
+        return
+    print(f"Browser will stay open for {seconds} seconds {reason}...")
+    time.sleep(seconds)
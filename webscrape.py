@@ -1,20 +1,27 @@
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from time import sleep
 import json
+import os
+import sys
 from datetime import datetime, timedelta
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrapeki"))
+from checkout_parser import add_event_identity
+from waits import BudgetedWait, RunBudget, debug_pause, wait_for_checkouts, wait_for_login_form, wait_for_login_redirect
+
 username = "22234325"
 password = "1234"
 
+# Per-run time budget: every wait below stops when it runs out
+budget = RunBudget()
+
 # Initialize the WebDriver
 driver = webdriver.Chrome()
 driver.get("https://dtu.bestbookbuddies.com/cgi-bin/koha/opac-user.pl")
 
-wait = WebDriverWait(driver, 20)  # Increased wait time
+wait = BudgetedWait(driver, budget, 20)
 
 try:
     # Step 1: Login automatically
@@ -22,8 +29,10 @@ try:
     print(f"Page title: {driver.title}")
     print(f"Current URL: {driver.current_url}")
     
-    # Wait a bit for page to fully load
-    sleep(2)
+    # Wait for the login form to be rendered
+    wait_for_login_form(wait)
+    # The form is already loaded, so each candidate field name only needs a short wait
+    form_wait = BudgetedWait(driver, budget, 1)
     
     # Try multiple possible field names for username
     username_field = None
@@ -32,7 +41,7 @@ try:
     for field_name in possible_username_fields:
         try:
             print(f"Trying to find username field with name='{field_name}'...")
-            username_field = wait.until(EC.presence_of_element_located((By.NAME, field_name)))
+            username_field = form_wait.until(EC.presence_of_element_located((By.NAME, field_name)))
             print(f"✓ Found username field: {field_name}")
             break
         except:
@@ -74,13 +83,11 @@ try:
     
     # Scroll element into view
     driver.execute_script("arguments[0].scrollIntoView(true);", username_field)
-    sleep(0.5)
     
     # Try to interact with the field
     try:
         # Click the field first to focus it
         username_field.click()
-        sleep(0.3)
         username_field.clear()
         username_field.send_keys(username)
         print("✓ Username entered")
@@ -115,12 +122,10 @@ try:
     print("Waiting for password field to be interactable...")
     wait.until(EC.element_to_be_clickable(password_field))
     driver.execute_script("arguments[0].scrollIntoView(true);", password_field)
-    sleep(0.5)
     
     # Try to interact with the password field
     try:
         password_field.click()
-        sleep(0.3)
         password_field.clear()
         password_field.send_keys(password)
         print("✓ Password entered")
@@ -160,7 +165,6 @@ try:
     print("Waiting for login button to be clickable...")
     wait.until(EC.element_to_be_clickable(login_button))
     driver.execute_script("arguments[0].scrollIntoView(true);", login_button)
-    sleep(0.5)
     
     # Try to click the login button
     try:
@@ -172,13 +176,13 @@ try:
         driver.execute_script("arguments[0].click();", login_button)
         print("✓ Login button clicked via JavaScript")
     
-    # Wait for login to complete and page to load
-    sleep(3)
+    # Wait for the post-login redirect to the patron page
+    wait_for_login_redirect(driver, wait, login_button)
     print("Login successful!")
     
     # Step 2: Wait for the checkouts table to be present
     print("Waiting for checkouts table...")
-    checkout_table = wait.until(EC.presence_of_element_located((By.ID, "checkoutst")))
+    checkout_table = wait_for_checkouts(wait)
     
     # Step 3: Find all rows in the tbody of the checkouts table
     rows = checkout_table.find_elements(By.CSS_SELECTOR, "tbody tr")
@@ -268,6 +272,8 @@ try:
                     }
                 }
                 
+                # Deterministic iCalUID + private checkoutKey, so calendar upserts are idempotent
+                add_event_identity(calendar_event, username, item_data)
                 calendar_events.append(calendar_event)
             
         except Exception as e:
@@ -328,14 +334,15 @@ try:
     if len(calendar_events) > 3:
         print(f"\n... and {len(calendar_events) - 3} more events")
     
-    # Keep browser open to see results
-    sleep(5)
+    print(f"\nFinished in {budget.elapsed():.1f}s")
+    # Keep browser open to see results (only with SCRAPER_DEBUG_PAUSE=1)
+    debug_pause(5, "to see results")
     
 except Exception as e:
     print(f"An error occurred: {e}")
     import traceback
     traceback.print_exc()
-    sleep(10)  # Keep browser open to debug
+    debug_pause(10, "for debugging")
 
 finally:
     driver.close()